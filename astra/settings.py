@@ -23,16 +23,23 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 IMG_PATH = os.path.join(MEDIA_ROOT, "images")
 SOUND_PATH = os.path.join(MEDIA_ROOT, "sound")
 TTS_PATH = os.path.join(MEDIA_ROOT, "tts")
+TTS_CACHE_PATH = os.path.join(MEDIA_ROOT, "tts_cache")
+BGM_CACHE_PATH = os.path.join(MEDIA_ROOT, "bgm_cache")
+IMAGE_CACHE_PATH = os.path.join(MEDIA_ROOT, "image_cache")
+COVER_CACHE_PATH = os.path.join(MEDIA_ROOT, "cover_cache")
 ARTICLE_PATH = os.path.join(MEDIA_ROOT, "article")
 VIDEO_PATH = os.path.join(MEDIA_ROOT, "videos")
+PREVIEW_PATH = os.path.join(VIDEO_PATH, "preview")
 LOGO_PATH = os.path.join(MEDIA_ROOT, "logo")
 FONTS_PATH = os.path.join(MEDIA_ROOT, 'fonts')
 EFFECT_PATH = os.path.join(MEDIA_ROOT, 'effect')
 SCRIPTS_PATH = os.path.join(MEDIA_ROOT, 'scripts')
 SPEAKER_PATH = os.path.join(MEDIA_ROOT, 'speaker')
 TMP_PATH = os.path.join(MEDIA_ROOT, 'tmp')
+RENDER_WORKSPACE_PATH = os.path.join(MEDIA_ROOT, 'workspace')
 
-ALL_PATHS = [MEDIA_ROOT, IMG_PATH, SOUND_PATH, LOGO_PATH, FONTS_PATH, EFFECT_PATH, TTS_PATH, ARTICLE_PATH, SCRIPTS_PATH, SPEAKER_PATH, TMP_PATH]
+ALL_PATHS = [MEDIA_ROOT, IMG_PATH, SOUND_PATH, LOGO_PATH, FONTS_PATH, EFFECT_PATH, TTS_PATH, TTS_CACHE_PATH, BGM_CACHE_PATH, IMAGE_CACHE_PATH, COVER_CACHE_PATH, PREVIEW_PATH, ARTICLE_PATH, SCRIPTS_PATH, SPEAKER_PATH,
+             TMP_PATH, RENDER_WORKSPACE_PATH]
 for path in ALL_PATHS:
     if not os.path.exists(path):
         os.makedirs(path)
@@ -395,6 +402,76 @@ LOGGING = {
 
 # FFMPEG_PATH = r"C:\ffmpeg-7.1.1-full_build\bin\ffmpeg.exe"
 
+# 视频渲染进程池（python manage.py render_worker）
+RENDER_WORKER_NUM = 2  # 渲染进程数
+RENDER_QUEUE_TIMEOUT = 5  # 队列阻塞等待时间（秒）
+RENDER_PREVIEW_WORKER_NUM = 1  # 预览渲染进程数，预览任务走独立队列，不占用正式渲染进程
+# 单个视频按时间切片并行渲染的进程数，0 表示使用全部 CPU 核心
+RENDER_SEGMENT_PROCESSES = 8
+RENDER_MIN_SEGMENT_SECONDS = 10  # 每个分段的最短时长（秒），短视频不切片
+# 渲染进度推送：同一阶段内的最短发布间隔（秒）、SSE 心跳间隔（秒）、最近一次进度的保留时长（秒）
+RENDER_PROGRESS_INTERVAL = 0.5
+RENDER_PROGRESS_HEARTBEAT = 15
+RENDER_PROGRESS_TTL = 60 * 60
+# 渲染阶段耗时统计：默认统计最近天数、单次最多统计的视频数
+RENDER_STATS_DAYS = 30
+RENDER_STATS_MAX_VIDEOS = 5000
+# 渲染工作区：失败后保留供重试续跑，超过保留时长（秒）未使用的由渲染进程池定期清理
+RENDER_WORKSPACE_TTL = 24 * 60 * 60
+RENDER_WORKSPACE_GC_INTERVAL = 10 * 60
+# 批量生成：单个批次最多视频数、批次状态保留时长（秒）
+RENDER_BATCH_MAX_VIDEOS = 100
+RENDER_BATCH_TTL = 7 * 24 * 60 * 60
+# 渲染准入控制：本机可分配给渲染任务的 CPU 核数与内存（MB），None 时按本机核数与 75% 物理内存计算，留出 Web 服务与抠图模型的内存；
+# 临时目录所在磁盘至少保留的空闲空间（MB）；资源不足时渲染进程等待重试的间隔（秒）
+RENDER_HOST_CORES = None
+RENDER_HOST_MEMORY_MB = None
+RENDER_DISK_RESERVE_MB = 5 * 1024
+RENDER_ADMISSION_POLL = 2
+# 渲染资源估算：主进程基础内存与每个分段进程的内存（MB，按 1080p 折算），每个字的配音时长（秒），每秒成片大小（MB）；
+# 同一模板有足够的历史渲染记录时按最近若干条记录的内存峰值估算，结果在渲染进程内缓存若干秒
+RENDER_MEMORY_BASE_MB = 600
+RENDER_MEMORY_PER_PROCESS_MB = 400
+RENDER_SECONDS_PER_CHAR = 0.25
+RENDER_OUTPUT_MB_PER_SECOND = {'final': 1.5, 'preview': 0.2}
+RENDER_ESTIMATE_HISTORY = 50
+RENDER_ESTIMATE_CACHE_TTL = 10 * 60
+# 渲染时采样主进程与子进程内存的间隔（秒）
+RENDER_MEMORY_SAMPLE_INTERVAL = 0.5
+# 渲染队列公平调度：按 Video.creator 加权轮流出队，权重默认 1；每个用户正式与批量任务合计同时渲染的任务数上限，
+# 预览任务单独计数，批量渲染占满名额时仍能预览；0 表示不限
+RENDER_USER_WEIGHTS = {}
+RENDER_USER_MAX_RUNNING = 2
+RENDER_USER_MAX_RUNNING_OVERRIDES = {}
+RENDER_USER_MAX_PREVIEW_RUNNING = 2
+# 取消渲染：取消标记的保留时长（秒），逐帧渲染时检查取消标记的最短间隔（秒）
+RENDER_CANCEL_TTL = 24 * 60 * 60
+RENDER_CANCEL_CHECK_INTERVAL = 0.5
+# 相同渲染请求合并：同一用户相同模板、参数与渲染配置的请求在该时长（秒）内复用同一个视频，不超过 RENDER_PROGRESS_TTL
+RENDER_DEDUP_WINDOW = 10 * 60
+
+# TTS 并发合成线程数
+TTS_MAX_WORKERS = 4
+# TTS 结果缓存上限，超出后按最近最少使用淘汰
+TTS_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB
+TTS_CACHE_MAX_ENTRIES = 20000
+# 各进程累计写入量的统计超过该时长（秒）后重新扫描缓存目录，计入其他进程写入的条目
+TTS_CACHE_RESCAN_INTERVAL = 10 * 60
+# BGM 底轨缓存：按时长档位预先循环拼接好的 WAV，超出容量后按最近最少使用淘汰
+BGM_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB
+BGM_CACHE_BUCKET_SECONDS = 60
+# 派生图片缓存：缩放、裁剪、调亮度后的图片按内容寻址缓存，超出容量后按最近最少使用淘汰
+IMAGE_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1GB
+# 封面缓存：按 (模板, 标题, 人名, 图片内容) 缓存生成的封面，重新生成草稿时直接复用
+COVER_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512MB
+# 抠图：rembg 模型、每个进程常驻的会话数（即推理线程数）、批量接口单次处理的图片数
+REMBG_MODEL = "u2net"
+REMBG_SESSION_NUM = 2
+REMBG_BATCH_SIZE = 8
+REMBG_BATCH_MAX_IMAGES = 100
+# 抠图任务由渲染进程执行，任务状态与结果的保留时长（秒）
+REMBG_JOB_TTL = 24 * 60 * 60
+
 # Session 配置
 SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'  # 使用缓存+数据库混合模式
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 7  # Session过期时间：7天
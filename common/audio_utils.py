@@ -0,0 +1,94 @@
+import logging
+
+import numpy as np
+from moviepy.audio.AudioClip import AudioArrayClip
+from pydub import AudioSegment
+
+logger = logging.getLogger("util")
+
+
+class NarrationAssembler:
+    """旁白音频拼接
+
+    按 Tts.duration 预先分配整段 PCM 缓冲区，逐段解码后直接写入，
+    淡入淡出与交叉淡化在缓冲区内原地完成，结果以 AudioArrayClip 交给视频合成，
+    不再经过 AudioSegment.append 的反复整段复制和 mp3 导出再解码。
+    与原 pydub 写法一致：每段语音淡入淡出 200ms，语音之间交叉淡化 200ms，
+    静音追加沿用 AudioSegment.append 默认的 100ms 交叉淡化。
+    """
+
+    def __init__(self, frame_rate=44100, channels=2, fade_ms=200):
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.fade_ms = fade_ms
+        self.pieces = []
+        self._buffer = None
+
+    def add_speech(self, path, duration, crossfade=200):
+        self.pieces.append(('speech', path, duration, crossfade))
+        self._buffer = None
+
+    def add_silence(self, duration_ms, crossfade=100):
+        self.pieces.append(('silence', None, duration_ms / 1000, crossfade))
+        self._buffer = None
+
+    def _samples(self, ms):
+        return int(self.frame_rate * ms / 1000)
+
+    def _decode(self, path):
+        try:
+            segment = AudioSegment.from_file(path)
+        except Exception:
+            # 读取失败时，尝试按mp3或wav显式解码
+            try:
+                segment = AudioSegment.from_file(path, format='mp3')
+            except Exception:
+                segment = AudioSegment.from_file(path, format='wav')
+        segment = segment.set_frame_rate(self.frame_rate).set_channels(self.channels).set_sample_width(2)
+        data = np.array(segment.get_array_of_samples(), dtype=np.float32).reshape(-1, self.channels)
+        data /= 32768
+
+        fade = min(self._samples(self.fade_ms), len(data))
+        if fade:
+            data[:fade] *= np.linspace(0, 1, fade, endpoint=False, dtype=np.float32)[:, None]
+            data[-fade:] *= np.linspace(1, 0, fade, endpoint=False, dtype=np.float32)[:, None]
+        return data
+
+    def build(self):
+        """返回 (采样数, 声道数) 的 float32 PCM 数组"""
+        if self._buffer is not None:
+            return self._buffer
+
+        # 按已知时长预分配，多留 1 秒余量，解码长度超出时才扩容
+        capacity = int(sum(piece[2] for piece in self.pieces) * self.frame_rate) + self.frame_rate
+        buffer = np.zeros((capacity, self.channels), dtype=np.float32)
+        cursor = 0
+        for kind, path, duration, crossfade in self.pieces:
+            if kind == 'speech':
+                data = self._decode(path)
+            else:
+                data = np.zeros((int(duration * self.frame_rate), self.channels), dtype=np.float32)
+
+            overlap = min(self._samples(crossfade), cursor, len(data))
+            end = cursor - overlap + len(data)
+            if end > len(buffer):
+                logger.warning(f"旁白实际时长超出预估，扩容缓冲区：{end - len(buffer)} 采样")
+                buffer = np.concatenate([buffer, np.zeros((end - len(buffer) + self.frame_rate, self.channels),
+                                                          dtype=np.float32)])
+            if overlap:
+                # 交叉淡化：已有音频尾部淡出，新片段头部淡入后叠加
+                buffer[cursor - overlap:cursor] *= np.linspace(1, 0, overlap, endpoint=False, dtype=np.float32)[:, None]
+                buffer[cursor - overlap:cursor] += data[:overlap] * np.linspace(0, 1, overlap, endpoint=False,
+                                                                                dtype=np.float32)[:, None]
+            buffer[cursor:end] = data[overlap:]
+            cursor = end
+
+        self._buffer = buffer[:cursor]
+        return self._buffer
+
+    @property
+    def duration(self):
+        return len(self.build()) / self.frame_rate
+
+    def clip(self):
+        return AudioArrayClip(self.build(), fps=self.frame_rate)
@@ -0,0 +1,116 @@
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from PIL import Image
+
+from astra.settings import REMBG_MODEL, REMBG_SESSION_NUM, REMBG_BATCH_SIZE
+from common.image_cache import ImageCache
+
+logger = logging.getLogger("util")
+
+
+class RembgSessionPool:
+    """进程内常驻的 rembg 会话池
+
+    每个模型在一个进程内最多创建 size 个会话，模型只加载一次，
+    推理线程借用空闲会话、用完归还；fork 出的子进程不复用父进程的会话，重新按需创建。
+    """
+
+    _pools = {}
+    _lock = threading.Lock()
+
+    def __init__(self, model_name, size):
+        self.model_name = model_name
+        self.size = max(1, size)
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._created_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, model_name=REMBG_MODEL, size=REMBG_SESSION_NUM):
+        with cls._lock:
+            pool = cls._pools.get(model_name)
+            if pool is None or pool.pid != os.getpid():
+                pool = cls(model_name, size)
+                cls._pools[model_name] = pool
+            return pool
+
+    def _new_session(self):
+        from rembg import new_session
+
+        logger.info(f"加载rembg模型：{self.model_name}")
+        return new_session(self.model_name)
+
+    @contextmanager
+    def session(self):
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            with self._created_lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    session = self._new_session()
+                except Exception:
+                    with self._created_lock:
+                        self._created -= 1
+                    raise
+            else:
+                # 会话已全部借出，等待归还
+                session = self._idle.get()
+        try:
+            yield session
+        finally:
+            self._idle.put(session)
+
+
+class CutoutUtils:
+    """抠图：按图片内容缓存 rembg 推理得到的遮罩，同一张图片只推理一次，抠图结果由遮罩直接合成"""
+
+    def __init__(self, model_name=REMBG_MODEL, cache=None):
+        self.model_name = model_name
+        self.cache = cache or ImageCache()
+
+    def _predict(self, image_path):
+        from rembg import remove
+        from rembg.bg import fix_image_orientation
+
+        img = fix_image_orientation(Image.open(image_path))
+        with RembgSessionPool.get(self.model_name).session() as session:
+            return remove(img, session=session, only_mask=True)
+
+    def mask_path(self, image_path):
+        return self.cache.derive(image_path, 'rembg_mask', {'model': self.model_name}, self._predict)
+
+    def cutout(self, image_path):
+        """返回去除背景后的 RGBA 图片，与 rembg.remove 默认输出一致"""
+        from rembg.bg import fix_image_orientation, naive_cutout
+
+        mask = Image.open(self.mask_path(image_path))
+        img = fix_image_orientation(Image.open(image_path))
+        return naive_cutout(img, mask)
+
+    def batch(self, image_paths, batch_size=REMBG_BATCH_SIZE):
+        """批量抠图，按批次提交到线程池并发推理，线程数与会话数一致
+
+        返回与 image_paths 顺序一致的列表，单张失败时对应位置为异常对象。
+        """
+        results = []
+        workers = RembgSessionPool.get(self.model_name).size
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i in range(0, len(image_paths), batch_size):
+                futures = [executor.submit(self.cutout, path) for path in image_paths[i:i + batch_size]]
+                for path, future in zip(image_paths[i:i + batch_size], futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        logger.error(f"抠图失败：{path}，{e}")
+                        results.append(e)
+        return results
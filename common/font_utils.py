@@ -0,0 +1,38 @@
+import logging
+import threading
+
+from PIL import ImageFont
+
+logger = logging.getLogger("util")
+
+
+class FontRegistry:
+    """进程级字体注册表，按 (字体路径, 字号) 懒加载并复用 FreeType 字体对象"""
+    _fonts = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, font_path, size):
+        key = (font_path, int(size))
+        font = cls._fonts.get(key)
+        if font is None:
+            with cls._lock:
+                font = cls._fonts.get(key)
+                if font is None:
+                    font = ImageFont.truetype(font_path, int(size))
+                    cls._fonts[key] = font
+        return font
+
+    @classmethod
+    def warm(cls, fonts):
+        """预加载字体，缺失的字体只记录日志，不影响渲染进程启动"""
+        for font_path, size in fonts:
+            try:
+                cls.get(font_path, size)
+            except OSError as e:
+                logger.warning(f"预加载字体失败 {font_path}({size}): {e}")
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._fonts = {}
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+
+from astra.settings import IMAGE_CACHE_PATH, IMAGE_CACHE_MAX_BYTES
+
+logger = logging.getLogger("util")
+
+
+class ImageCache:
+    """按内容寻址的派生图片缓存
+
+    以 (源图内容哈希, 操作, 参数) 为键缓存缩放、裁剪、调亮度等处理结果，
+    所有模板共用，同一张球员图片或背景图只处理一次；超出容量后按最近最少使用淘汰。
+    """
+
+    # 进程内记录 (路径, 大小, 修改时间) 对应的内容哈希，避免每次都重新读取源图
+    _hashes = {}
+    max_hashes = 4096
+
+    def __init__(self, cache_path=IMAGE_CACHE_PATH, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def source_hash(cls, source_path):
+        stat = os.stat(source_path)
+        signature = (os.path.abspath(source_path), stat.st_size, stat.st_mtime_ns)
+        digest = cls._hashes.get(signature)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(source_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            if len(cls._hashes) >= cls.max_hashes:
+                cls._hashes.clear()
+            cls._hashes[signature] = digest
+        return digest
+
+    def make_key(self, source_hash, operation, params):
+        raw = json.dumps({'source': source_hash, 'operation': operation, 'params': params}, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def derive(self, source_path, operation, params, func):
+        """返回派生图片路径，未命中时调用 func(source_path) 生成 PIL 图片并写入缓存
+
+        func 返回 None 时不缓存，直接返回 None。返回的文件由缓存管理，调用方不可修改或删除。
+        """
+        key = self.make_key(self.source_hash(source_path), operation, params)
+        return self.get(key, lambda: func(source_path))
+
+    def get(self, key, func):
+        """按键返回缓存图片路径，未命中时调用 func() 生成 PIL 图片并写入缓存，func 返回 None 时不缓存"""
+        path = os.path.join(self.cache_path, f'{key}.png')
+        if os.path.isfile(path):
+            # 更新访问时间，用于LRU淘汰
+            now = time.time()
+            os.utime(path, (now, now))
+            return path
+
+        img = func()
+        if img is None:
+            return None
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        img.save(tmp_path, format='PNG')
+        os.replace(tmp_path, path)
+        logger.info(f"图片已缓存：{path}")
+        self.evict()
+        return path
+
+    def evict(self):
+        """超出容量上限时，按最近最少使用顺序删除缓存图片"""
+        entries = []
+        for name in os.listdir(self.cache_path):
+            if not name.endswith('.png'):
+                continue
+            path = os.path.join(self.cache_path, name)
+            try:
+                entries.append((os.path.getmtime(path), path, os.path.getsize(path)))
+            except FileNotFoundError:
+                continue
+
+        total = sum(entry[2] for entry in entries)
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for last_used, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.info(f"派生图片缓存淘汰：{path}")
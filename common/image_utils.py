@@ -1,14 +1,19 @@
 import traceback
 
 from PIL import Image, ImageDraw
-from rembg import remove
+
+from common.cutout_utils import CutoutUtils
+from common.image_cache import ImageCache
 
 
 class ImageUtils:
+    def __init__(self):
+        self.cache = ImageCache()
+
     @staticmethod
     def transparent_img(img_path):
-        img = Image.open(img_path)
-        return remove(img)
+        # 复用进程内常驻的 rembg 会话，遮罩按图片内容缓存
+        return CutoutUtils().cutout(img_path)
 
     def resize_and_crop(self, img, target_width=1280, target_height=720):
 
@@ -40,7 +45,25 @@ class ImageUtils:
         img = img.crop((int(left), int(top), int(right), int(bottom)))
         return img
 
+    def resize_and_crop_path(self, image_path, target_width=1280, target_height=720):
+        """缩放裁剪后的图片路径，结果按源图内容缓存"""
+        return self.cache.derive(image_path, 'resize_and_crop', {'size': [target_width, target_height]},
+                                 lambda path: self.resize_and_crop(Image.open(path), target_width, target_height))
+
     def trim_image(self, image_path):
+        """裁掉透明边缘，结果按源图内容缓存"""
+        try:
+            path = self.cache.derive(image_path, 'trim_image', {}, self._trim)
+            if path is None:
+                return
+            img = Image.open(path)
+            img.load()
+            return img
+        except Exception:
+            print(traceback.format_exc())
+
+    @staticmethod
+    def _trim(image_path):
         # 打开图片
         try:
             img = Image.open(image_path).convert("RGBA")
@@ -48,6 +48,11 @@ class ControlRedis:
         value = self.client.lpop(list_name)
         return json.loads(value) if value else None
 
+    def block_left_list(self, list_name, timeout=5):
+        # 阻塞弹出，超时返回 None
+        item = self.client.blpop(list_name, timeout=timeout)
+        return json.loads(item[1]) if item else None
+
     def add_right_list(self, list_name, info):
         self.client.rpush(list_name, json.dumps(info))
 
@@ -55,10 +60,8 @@ class ControlRedis:
         self.client.lpush(list_name, json.dumps(info))
 
     def set_lock(self, key, info, exp_time=10 * 60):
-        if self.client.setnx(key, info):
-            self.client.expire(key, exp_time)
-            return True
-        return False
+        # SET NX EX 一条命令完成，避免 setnx 后进程退出留下永不过期的锁
+        return bool(self.client.set(key, info, nx=True, ex=exp_time))
 
     def exists_key(self, key):
         return self.client.exists(key)
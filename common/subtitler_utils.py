@@ -1,6 +1,12 @@
 import re
-from moviepy import TextClip, CompositeVideoClip
-from PIL import ImageFont
+from bisect import bisect_right
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+from moviepy import TextClip, VideoClip
+
+from common.font_utils import FontRegistry
 
 
 class SubtitlerUtils:
@@ -16,7 +22,7 @@ class SubtitlerUtils:
         return [t[0] or t[2] or t[3] or t[4] for t in tokens if any(t)]
 
     def wrap_text(self, text, max_width):
-        font = ImageFont.truetype(self.font_path, self.font_size)
+        font = FontRegistry.get(self.font_path, self.font_size)
         tokens = self.tokenize(text)
 
         lines = []
@@ -42,22 +48,105 @@ class SubtitlerUtils:
 
         return lines  # 返回 list 而不是拼接字符串
 
+    def line_clip(self, line):
+        return TextClip(
+            text=line,
+            font=self.font_path,
+            font_size=self.font_size,
+            color="lightyellow",
+            stroke_color='black',
+            stroke_width=2,
+            method="label",
+            transparent=True,
+        ).with_opacity(0.7)
+
+    def track(self, video_size):
+        """创建字幕轨道，所有字幕合并为一个片段"""
+        return SubtitleTrack(self, video_size)
+
     def text_clip(self, text, start, duration, subtitler_height, max_width):
         lines = self.wrap_text(text, max_width - 100)
 
         for idx, line in enumerate(lines):
-            txt_clip = TextClip(
-                text=line,
-                font=self.font_path,
-                font_size=self.font_size,
-                color="lightyellow",
-                stroke_color='black',
-                stroke_width=2,
-                method="label",
-                transparent=True,
-            ).with_opacity(0.7).with_start(start).with_duration(duration - 0.2)
+            txt_clip = self.line_clip(line).with_start(start).with_duration(duration - 0.2)
 
             # 水平居中，垂直位置根据行号调整
             y = subtitler_height + idx * (self.font_size + self.line_spacing)
             txt_clip = txt_clip.with_position(('center', y))
             yield txt_clip
+
+
+class SubtitleTrack:
+    """字幕轨道
+
+    每行字幕只栅格化一次存入图集（相同文本共用一张精灵图），整条轨道对外只暴露一个片段；
+    按所有字幕的起止时间建立区间索引，逐帧二分查找当前显示的行，
+    同一组显示行只合成一次，开销不随字幕条数增长。
+    """
+
+    def __init__(self, subtitler, video_size):
+        self.subtitler = subtitler
+        self.video_size = video_size
+        self.atlas = {}
+        self.entries = []
+
+    def sprite(self, line):
+        if line not in self.atlas:
+            clip = self.subtitler.line_clip(line)
+            rgb = clip.get_frame(0).astype("uint8")
+            alpha = (clip.mask.get_frame(0) * 255).astype("uint8")
+            self.atlas[line] = Image.fromarray(np.dstack([rgb, alpha]), "RGBA")
+        return self.atlas[line]
+
+    def add(self, text, start, duration, subtitler_height, max_width):
+        """参数与 SubtitlerUtils.text_clip 一致：水平居中，垂直位置根据行号调整"""
+        lines = self.subtitler.wrap_text(text, max_width - 100)
+        for idx, line in enumerate(lines):
+            y = subtitler_height + idx * (self.subtitler.font_size + self.subtitler.line_spacing)
+            self.entries.append((start, start + duration - 0.2, self.sprite(line), y))
+
+    def _build_index(self):
+        """区间索引：相邻边界之间显示的字幕行集合不变"""
+        bounds = sorted({t for entry in self.entries for t in entry[:2]})
+        active = []
+        for left in bounds:
+            active.append(tuple(i for i, (start, end, _, _) in enumerate(self.entries) if start <= left < end))
+        return bounds, active
+
+    def _compose(self, indexes):
+        """把同时显示的字幕行合成为一张紧贴包围盒的 RGBA 图"""
+        width = self.video_size[0]
+        placed = []
+        for i in indexes:
+            _, _, sprite, y = self.entries[i]
+            placed.append((sprite, int((width - sprite.width) / 2), int(y)))
+        x0 = min(x for _, x, _ in placed)
+        y0 = min(y for _, _, y in placed)
+        x1 = max(x + sprite.width for sprite, x, _ in placed)
+        y1 = max(y + sprite.height for sprite, _, y in placed)
+        canvas = Image.new("RGBA", (x1 - x0, y1 - y0), (0, 0, 0, 0))
+        for sprite, x, y in placed:
+            canvas.alpha_composite(sprite, dest=(x - x0, y - y0))
+        return np.array(canvas), (x0, y0)
+
+    def clips(self):
+        """返回字幕片段列表（无字幕时为空），可直接展开到 CompositeVideoClip 中"""
+        if not self.entries:
+            return []
+        bounds, active = self._build_index()
+        empty = (np.zeros((1, 1, 4), dtype=np.uint8), (0, 0))
+        # 逐帧顺序渲染时只需保留最近的几组合成结果
+        frames = OrderedDict()
+
+        def lookup(t):
+            index = bisect_right(bounds, t) - 1
+            indexes = active[index] if index >= 0 else ()
+            if not indexes:
+                return empty
+            if indexes not in frames:
+                frames[indexes] = self._compose(indexes)
+                if len(frames) > 4:
+                    frames.popitem(last=False)
+            return frames[indexes]
+
+        return [VideoClip(lambda t: lookup(t)[0], duration=bounds[-1]).with_position(lambda t: lookup(t)[1])]
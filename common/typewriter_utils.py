@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageDraw
+from moviepy import VideoClip
+
+from common.font_utils import FontRegistry
+
+
+class TypewriterEffect:
+    """打字机标题效果
+
+    每个“显示前缀 + 缩放比例”状态只栅格化一次，缓存为紧贴文字包围盒的精灵图，
+    逐帧渲染时直接从缓存取图并通过位置函数定位，避免每帧新建整画布和重复描边。
+    缩放动画中每帧的比例各不相同，缓存按最近最少使用只保留 max_layers 张精灵图。
+    """
+
+    def __init__(self, text, font_path, font_size, fill, stroke_fill=None, stroke_width=0, max_layers=64):
+        self.text = text or ''
+        self.font_path = font_path
+        self.font_size = font_size
+        self.fill = fill
+        self.stroke_fill = stroke_fill
+        self.stroke_width = stroke_width
+        self.max_layers = max_layers
+        self._layers = OrderedDict()
+        self._draw = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+
+    def font(self, scale=1.0):
+        return FontRegistry.get(self.font_path, int(self.font_size * scale))
+
+    def layer(self, num_chars, anchor, scale=1.0, stroke_width=None):
+        """返回 (精灵图, 左上角坐标)，anchor(txt, font, draw) 给出与整画布绘制时一致的文字坐标"""
+        if stroke_width is None:
+            stroke_width = self.stroke_width
+        key = (num_chars, round(scale, 4), stroke_width)
+        layer = self._layers.get(key)
+        if layer is None:
+            layer = self._render(self.text[:num_chars], anchor, scale, stroke_width)
+            self._layers[key] = layer
+            if len(self._layers) > self.max_layers:
+                self._layers.popitem(last=False)
+        else:
+            self._layers.move_to_end(key)
+        return layer
+
+    def _render(self, txt, anchor, scale, stroke_width):
+        if not txt:
+            return np.zeros((1, 1, 4), dtype=np.uint8), (0, 0)
+        font = self.font(scale)
+        x, y = anchor(txt, font, self._draw)
+        left, top, right, bottom = self._draw.textbbox((0, 0), txt, font=font)
+
+        # 保留坐标的小数部分，与 ImageDraw.text 的亚像素定位保持一致
+        ix, iy = int(x), int(y)
+        fx, fy = x - ix, y - iy
+        pad = stroke_width + 1
+        sprite = Image.new('RGBA', (right - left + 2 * pad, bottom - top + 2 * pad), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(sprite)
+        origin_x, origin_y = pad - left + fx, pad - top + fy
+
+        if self.stroke_fill is not None:
+            for dx in range(-stroke_width, stroke_width + 1):
+                for dy in range(-stroke_width, stroke_width + 1):
+                    if dx or dy:
+                        draw.text((origin_x + dx, origin_y + dy), txt, font=font, fill=self.stroke_fill)
+        draw.text((origin_x, origin_y), txt, font=font, fill=self.fill)
+        return np.array(sprite), (ix + left - pad, iy + top - pad)
+
+    def make_clip(self, state, anchor, duration):
+        """state(t) 返回 (显示字数, 缩放比例, 描边宽度)"""
+
+        def make_frame(t):
+            num_chars, scale, stroke_width = state(t)
+            return self.layer(num_chars, anchor, scale, stroke_width)[0]
+
+        def position(t):
+            num_chars, scale, stroke_width = state(t)
+            return self.layer(num_chars, anchor, scale, stroke_width)[1]
+
+        return VideoClip(make_frame, duration=duration).with_position(position)
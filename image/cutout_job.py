@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import time
+import uuid
+
+from astra.settings import IMG_PATH, REMBG_JOB_TTL
+from common.cutout_utils import CutoutUtils
+from common.redis_tools import ControlRedis
+from image.models import Image
+
+logger = logging.getLogger("image")
+
+CUTOUT_JOB_KEY = 'astra:cutout:job:{}'
+
+
+class CutoutJob:
+    """批量抠图任务
+
+    接口只登记任务并放入渲染队列，rembg 模型与会话池常驻在渲染进程中，由渲染进程执行抠图；
+    任务状态与结果保存在 Redis，客户端按任务ID轮询。
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.key = CUTOUT_JOB_KEY.format(job_id)
+        self.redis = ControlRedis()
+
+    @classmethod
+    def create(cls, user, image_ids):
+        job = cls(str(uuid.uuid4()))
+        job.save({
+            'job_id': job.job_id,
+            'user': user,
+            'image_ids': [str(image_id) for image_id in image_ids],
+            'state': 'queued',
+            'results': [],
+            'failed': [],
+            'not_found': [],
+            'created': time.time(),
+        })
+        return job
+
+    def load(self):
+        return self.redis.get_key(self.key)
+
+    def save(self, info):
+        self.redis.conn.set(self.key, json.dumps(info), ex=REMBG_JOB_TTL)
+
+    def update(self, **fields):
+        info = self.load()
+        if info is None:
+            return
+        info.update(fields)
+        self.save(info)
+
+    def run(self):
+        """在渲染进程中执行：只处理该用户自己的图片，已抠过图的图片直接返回该用户已有的结果"""
+        info = self.load()
+        if info is None:
+            logger.warning(f"抠图任务{self.job_id}已过期")
+            return
+        self.update(state='running', started=time.time())
+        user = info['user']
+        image_ids = info['image_ids']
+        try:
+            images = {str(image.id): image for image in Image.objects.filter(id__in=image_ids, creator=user)}
+            not_found = [iid for iid in image_ids if iid not in images]
+
+            existing = {}
+            for cutout in Image.objects.filter(creator=user, spec__cutout_of__in=list(images.keys())):
+                existing.setdefault(cutout.spec['cutout_of'], str(cutout.id))
+
+            results, failed, pending = [], [], []
+            for iid, image in images.items():
+                if iid in existing:
+                    results.append({'image_id': iid, 'cutout_id': existing[iid]})
+                    continue
+                file_path = os.path.join(IMG_PATH, image.img_name)
+                if not os.path.exists(file_path):
+                    failed.append({'image_id': iid, 'reason': "图片文件不存在"})
+                    continue
+                pending.append((image, file_path))
+
+            outputs = CutoutUtils().batch([file_path for _, file_path in pending])
+            for (image, _), output in zip(pending, outputs):
+                if isinstance(output, Exception):
+                    failed.append({'image_id': str(image.id), 'reason': str(output)})
+                    continue
+                filename = f"{uuid.uuid4()}.png"
+                output.save(os.path.join(IMG_PATH, filename), format='PNG')
+                cutout = Image(
+                    img_name=filename,
+                    category=image.category,
+                    img_path=IMG_PATH,
+                    width=output.width,
+                    height=output.height,
+                    origin="抠图",
+                    creator=user,
+                    spec={'format': 'PNG', 'mode': output.mode, 'cutout_of': str(image.id)}
+                )
+                cutout.save()
+                results.append({'image_id': str(image.id), 'cutout_id': str(cutout.id)})
+        except Exception as e:
+            logger.exception(f"抠图任务{self.job_id}失败: {e}")
+            self.update(state='failed', error=str(e), finished=time.time())
+            raise
+        logger.info(f"抠图任务{self.job_id}完成：成功{len(results)}张，失败{len(failed)}张")
+        self.update(state='finished', results=results, failed=failed, not_found=not_found, finished=time.time())
@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import  ImageInfoAPIView
 
-from image.views import BindTagsToImageAPIView, ImageListView, ImageUploadView, DeleteImagesAPIView, ImageDetailView
+from image.views import BindTagsToImageAPIView, ImageListView, ImageUploadView, DeleteImagesAPIView, ImageDetailView, \
+    ImageCutoutAPIView, ImageCutoutJobView
 
 urlpatterns = [
     path('<uuid:id>/', ImageDetailView.as_view(), name='image-detail'),
@@ -9,5 +10,7 @@ urlpatterns = [
     path('', ImageListView.as_view(), name='image-list'),
     path('upload/', ImageUploadView.as_view(), name='image-upload'),
     path('delete/', DeleteImagesAPIView.as_view(), name='delete-image'),
+    path('cutout/', ImageCutoutAPIView.as_view(), name='image-cutout'),
+    path('cutout/<str:job_id>/', ImageCutoutJobView.as_view(), name='image-cutout-job'),
     path('<uuid:image_id>/detail/', ImageInfoAPIView.as_view(), name='image-info'),
 ]
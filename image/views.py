@@ -17,14 +17,16 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 
-from astra.settings import IMG_PATH
+from astra.settings import IMG_PATH, REMBG_BATCH_MAX_IMAGES
 from common.response import error_response, ok_response
+from image.cutout_job import CutoutJob
 from image.models import Image, ImageTags
 from image.serializers import ImageSerializer, ImageBindTagsSerializer, ImageUploadSerializer
 from tag.models import Tag
 from asset.models import AssetInfo
 from text.models import DynamicImage
 from video.models import Video
+from video.render_queue import RenderQueue
 
 TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
 
@@ -335,6 +337,85 @@ class DeleteImagesAPIView(APIView):
             return error_response(f"删除失败：{str(e)}")
 
 
+class ImageCutoutAPIView(APIView):
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="批量抠图：提交抠图任务，由渲染进程去除图片背景并保存为新的 PNG 图片，立即返回任务ID；"
+                              "同一张图片重复抠图直接返回已有结果",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'image_ids': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_STRING, format='uuid'),
+                    description=f'图片ID列表，单次最多{REMBG_BATCH_MAX_IMAGES}张'
+                ),
+            },
+            required=['image_ids']
+        ),
+        responses={
+            200: openapi.Response(
+                description="抠图任务",
+                examples={
+                    "application/json": {
+                        "code": 0,
+                        "data": {"job_id": "uuid"},
+                        "msg": "success"
+                    }
+                }
+            )
+        },
+    )
+    def post(self, request):
+        image_ids = request.data.get('image_ids')
+        if not image_ids or not isinstance(image_ids, list):
+            return error_response("输入参数错误,image_ids必须是一个非空的列表")
+        if len(image_ids) > REMBG_BATCH_MAX_IMAGES:
+            return error_response(f"单次最多处理{REMBG_BATCH_MAX_IMAGES}张图片")
+
+        try:
+            job = CutoutJob.create(request.user.id, image_ids)
+            RenderQueue().enqueue_cutout(request.user.id, job.job_id)
+            return ok_response({'job_id': job.job_id})
+        except Exception as e:
+            logger.exception(f"提交抠图任务失败: {e}")
+            return error_response(f"抠图失败：{str(e)}")
+
+
+class ImageCutoutJobView(APIView):
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="查询抠图任务状态，state 为 queued、running、finished 或 failed，完成后返回抠图结果",
+        responses={
+            200: openapi.Response(
+                description="抠图任务状态",
+                examples={
+                    "application/json": {
+                        "code": 0,
+                        "data": {
+                            "job_id": "uuid",
+                            "state": "finished",
+                            "results": [{"image_id": "uuid", "cutout_id": "uuid"}],
+                            "failed": [{"image_id": "uuid", "reason": "错误信息"}],
+                            "not_found": []
+                        },
+                        "msg": "success"
+                    }
+                }
+            )
+        },
+    )
+    def get(self, request, job_id):
+        info = CutoutJob(job_id).load()
+        if info is None or str(info['user']) != str(request.user.id):
+            return error_response("抠图任务不存在")
+        return ok_response({key: info.get(key) for key in ('job_id', 'state', 'results', 'failed', 'not_found', 'error')})
+
+
 class ImageDetailView(generics.RetrieveAPIView):
     queryset = Image.objects.all()
     serializer_class = ImageSerializer
@@ -0,0 +1,392 @@
+import hashlib
+import math
+from bisect import bisect_right
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+from moviepy import CompositeVideoClip, ImageClip, VideoClip
+from moviepy.tools import compute_position
+
+
+def is_static_content(clip):
+    """图层内容（画面与遮罩）是否不随时间变化：未经逐帧变换的 ImageClip/ColorClip/TextClip"""
+    if not isinstance(clip, ImageClip):
+        return False
+    try:
+        if clip.frame_function(0) is not clip.img:
+            return False
+        mask = clip.mask
+        return mask is None or (isinstance(mask, ImageClip) and mask.frame_function(0) is mask.img)
+    except Exception:
+        return False
+
+
+def interval_clips(make_frame, duration, animated=(), changes=(), position=(0, 0)):
+    """把逐帧绘制的 RGBA 图层按时间切成片段
+
+    animated 为 [(开始, 结束)] 逐帧变化的区间，changes 为画面在两种静止状态间切换的时刻，其余时间画面不变。
+    不变的区间只绘制一次，裁剪到非透明像素的包围盒后作为 ImageClip，合成时可压平到底板；
+    动画区间仍按 make_frame 逐帧绘制。返回片段列表，可直接展开到 CompositeVideoClip 中。
+    """
+    bounds = {0, duration, *changes}
+    for start, end in animated:
+        bounds.update((start, end))
+    bounds = sorted(t for t in bounds if 0 <= t <= duration)
+    x, y = position
+    clips = []
+    for start, end in zip(bounds, bounds[1:]):
+        if end <= start:
+            continue
+        if any(a <= start and end <= b for a, b in animated):
+            clip = VideoClip(lambda t, start=start: make_frame(start + t), duration=end - start)
+            clips.append(clip.with_start(start).with_position(position))
+            continue
+        # 取区间中点绘制，避开边界上的浮点误差
+        img = Image.fromarray(make_frame((start + end) / 2))
+        bbox = img.getchannel('A').getbbox()
+        if bbox is None:
+            continue
+        # 保留透明通道、不拆出遮罩，与逐帧绘制的图层合成结果一致
+        clip = ImageClip(np.array(img.crop(bbox)), transparent=False).with_start(start).with_duration(end - start)
+        clips.append(clip.with_position((x + bbox[0], y + bbox[1])))
+    return clips
+
+
+def _position(clip, t):
+    pos = clip.pos(t - clip.start)
+    if isinstance(pos, (list, np.ndarray)):
+        pos = tuple(pos)
+    return pos
+
+
+def _scaled_size(size, scale):
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def _resize_frame(frame, scale, is_mask=False):
+    if is_mask:
+        img = Image.fromarray((frame * 255).astype("uint8"))
+        return np.array(img.resize(_scaled_size(img.size, scale), Image.Resampling.BILINEAR)) / 255.0
+    img = Image.fromarray(frame.astype("uint8"))
+    return np.array(img.resize(_scaled_size(img.size, scale), Image.Resampling.BILINEAR))
+
+
+def _scale_position(pos, scale):
+    if isinstance(pos, str):
+        return pos
+    return tuple(value if isinstance(value, str) else value * scale for value in pos)
+
+
+def layer_image(clip, ct):
+    """与 VideoClip.compose_on 相同的图层取帧与遮罩处理（ct 为片段内时间），统一转为 RGBA"""
+    clip_img = Image.fromarray(clip.get_frame(ct).astype("uint8"))
+    if clip.mask is not None:
+        clip_mask_img = Image.fromarray((clip.mask.get_frame(ct) * 255).astype("uint8")).convert("L")
+        if clip_mask_img.size != clip_img.size:
+            mask_width, mask_height = clip_mask_img.size
+            img_width, img_height = clip_img.size
+            if mask_width > img_width or mask_height > img_height:
+                clip_mask_img = clip_mask_img.crop((0, 0, img_width, img_height))
+            else:
+                new_mask = Image.new("L", (img_width, img_height), 0)
+                new_mask.paste(clip_mask_img, (0, 0))
+                clip_mask_img = new_mask
+        clip_img = clip_img.convert("RGBA")
+        clip_img.putalpha(clip_mask_img)
+    if clip_img.mode != "RGBA":
+        clip_img = clip_img.convert("RGBA")
+    return clip_img
+
+
+def _resized_clip(clip, scale):
+    """逐帧缩放画面与遮罩，静态图层只缩放一次"""
+    if is_static_content(clip):
+        scaled = clip.image_transform(lambda frame: _resize_frame(frame, scale, clip.is_mask))
+    else:
+        scaled = clip.transform(lambda get_frame, t: _resize_frame(get_frame(t), scale, clip.is_mask))
+    if clip.mask is not None:
+        scaled.mask = _resized_clip(clip.mask, scale)
+    return scaled
+
+
+def scale_layer(clip, scale):
+    """按比例缩放图层的画面、遮罩与位置
+
+    静态图层只缩放一次，仍可被压平；动画图层多为整幅画布大小、大部分透明，
+    逐帧先裁剪到非透明像素的包围盒再缩放，裁掉的偏移计入位置。
+    """
+    pos = clip.pos
+    start = pos(0)
+    numeric = not isinstance(start, str) and not any(isinstance(value, str) for value in start)
+    if is_static_content(clip) or clip.relative_pos or not numeric:
+        scaled = _resized_clip(clip, scale)
+        if not clip.relative_pos:
+            scaled.pos = lambda t: _scale_position(pos(t), scale)
+        return scaled
+
+    state = {}
+
+    def render(t):
+        if state.get('t') != t:
+            img = layer_image(clip, t)
+            bbox = img.getchannel('A').getbbox()
+            if bbox is None:
+                frame, offset = np.zeros((1, 1, 4), dtype=np.uint8), (0, 0)
+            else:
+                img = img.crop(bbox)
+                frame = np.array(img.resize(_scaled_size(img.size, scale), Image.Resampling.BILINEAR))
+                offset = (bbox[0] * scale, bbox[1] * scale)
+            state.update(t=t, frame=frame, offset=offset)
+        return state
+
+    scaled = VideoClip(lambda t: render(t)['frame'], duration=clip.duration)
+    scaled = scaled.with_start(clip.start).with_layer_index(clip.layer_index)
+    scaled.pos = lambda t: tuple(value * scale + offset for value, offset in zip(pos(t), render(t)['offset']))
+    return scaled
+
+
+class FlattenedCompositeVideoClip(CompositeVideoClip):
+    """预先压平静态图层的合成片段
+
+    按所有图层的起止时间把时间轴切成若干区间，区间内画面与位置都不变的底层图层
+    只合成一次为背景底板并缓存，逐帧只叠加其上的动画图层；
+    渲染时逐帧校验底板图层位置，不一致则退回 moviepy 原始合成，保证画面一致。
+    """
+
+    def __init__(self, clips, size=None, bg_color=None, use_bgclip=False, is_mask=False, fps=30, max_plates=8):
+        super().__init__(clips, size=size, bg_color=bg_color, use_bgclip=use_bgclip, is_mask=is_mask)
+        # 缩放时按相同参数重新构造
+        self._options = {'bg_color': bg_color, 'fps': fps, 'max_plates': max_plates}
+        self.sample_fps = fps
+        self.max_plates = max_plates
+        self._static = {id(clip): is_static_content(clip) for clip in self.clips}
+        self._bg_static = is_static_content(self.bg) and (self.bg.mask is None or self.bg.mask.size == self.bg.size)
+        bounds = {0.0}
+        for clip in self.clips:
+            bounds.add(clip.start)
+            if clip.end is not None:
+                bounds.add(clip.end)
+        self._bounds = sorted(bounds)
+        self._prefixes = {}
+        self._plates = OrderedDict()
+
+    def scaled(self, scale):
+        """按比例缩小后的合成片段：各图层分别缩放后在缩小的画布上合成，合成开销随像素数一同下降
+
+        画布宽高取偶数以满足 yuv420p，音轨与时长保持不变。
+        """
+        clips = self.clips if self.created_bg else [self.bg, *self.clips]
+        width, height = self.size
+        size = (max(2, round(width * scale / 2) * 2), max(2, round(height * scale / 2) * 2))
+        clip = type(self)([scale_layer(layer, scale) for layer in clips], size=size, use_bgclip=not self.created_bg,
+                          is_mask=self.is_mask, **self._options)
+        if self.duration is not None:
+            clip = clip.with_duration(self.duration)
+        return clip.with_audio(self.audio)
+
+    def _sample_times(self, index):
+        start = self._bounds[index]
+        end = self._bounds[index + 1] if index + 1 < len(self._bounds) else math.inf
+        if self.duration is not None:
+            end = min(end, self.duration)
+        first = math.ceil(start * self.sample_fps)
+        last = math.ceil(end * self.sample_fps) if end != math.inf else first + 1
+        times = [frame / self.sample_fps for frame in range(first, max(last, first + 1))]
+        return [t for t in times if start <= t] or [start]
+
+    def static_prefix(self, index):
+        """区间内可压平的底层图层及其位置：从最底层开始连续的静态图层"""
+        if index not in self._prefixes:
+            times = self._sample_times(index)
+            clips, positions = [], []
+            for clip in self.playing_clips(times[0]):
+                if not self._static[id(clip)]:
+                    break
+                pos = _position(clip, times[0])
+                if any(_position(clip, t) != pos for t in times[1:]):
+                    break
+                clips.append(clip)
+                positions.append(pos)
+            self._prefixes[index] = (clips, tuple(positions))
+        return self._prefixes[index]
+
+    def _background(self, t):
+        """与 CompositeVideoClip.frame_function 相同的背景处理"""
+        bg_img = Image.fromarray(self.bg.get_frame(t - self.bg.start).astype("uint8"))
+        if self.bg.mask:
+            bg_mask = (self.bg.mask.get_frame(t - self.bg.mask.start) * 255).astype("uint8")
+            bg_img = bg_img.convert("RGBA")
+            bg_img.putalpha(Image.fromarray(bg_mask).convert("L"))
+        return bg_img
+
+    def _plate(self, clips, positions, t):
+        key = tuple(zip(map(id, clips), positions))
+        plate = self._plates.get(key)
+        if plate is None:
+            plate = self._background(t)
+            for clip in clips:
+                plate = clip.compose_on(plate, t)
+            self._plates[key] = plate
+            if len(self._plates) > self.max_plates:
+                self._plates.popitem(last=False)
+        else:
+            self._plates.move_to_end(key)
+        return plate
+
+    def frame_function(self, t):
+        if self.is_mask or not self._bg_static:
+            return super().frame_function(t)
+
+        index = max(0, bisect_right(self._bounds, t) - 1)
+        clips, positions = self.static_prefix(index)
+        if not clips or tuple(_position(clip, t) for clip in clips) != positions:
+            return super().frame_function(t)
+
+        playing = self.playing_clips(t)
+        if any(a is not b for a, b in zip(playing, clips)):
+            return super().frame_function(t)
+
+        # 底板会被 paste 原地修改，逐帧复制一份再叠加动画图层
+        current_img = self._plate(clips, positions, t).copy()
+        for clip in playing[len(clips):]:
+            current_img = clip.compose_on(current_img, t)
+
+        frame = np.array(current_img)
+        if frame.shape[2] == 4:
+            return frame[:, :, :3]
+        return frame
+
+
+def _intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _merge_rects(rects):
+    """合并相交的脏矩形，避免重叠区域重复合成"""
+    merged = []
+    for rect in rects:
+        while True:
+            for other in merged:
+                if _intersects(rect, other):
+                    merged.remove(other)
+                    rect = (min(rect[0], other[0]), min(rect[1], other[1]),
+                            max(rect[2], other[2]), max(rect[3], other[3]))
+                    break
+            else:
+                break
+        merged.append(rect)
+    return merged
+
+
+class DirtyRectCompositeVideoClip(FlattenedCompositeVideoClip):
+    """脏矩形合成片段
+
+    在静态图层压平的基础上复用上一帧的画面缓冲区：按图层包围盒比较前后两帧，
+    只在位置、内容发生变化或出现/消失的图层所覆盖的区域内，从底板开始重新叠加图层，
+    其余像素保持不变。动画图层按实际像素裁剪并比较内容，画面没变的帧不重绘。区域内的叠加与 moviepy 整帧 alpha 合成逐像素一致。
+    """
+
+    def __init__(self, clips, size=None, bg_color=None, use_bgclip=False, is_mask=False, fps=30, max_plates=8,
+                 max_sprites=64, full_redraw_ratio=0.6):
+        super().__init__(clips, size=size, bg_color=bg_color, use_bgclip=use_bgclip, is_mask=is_mask, fps=fps,
+                         max_plates=max_plates)
+        self.max_sprites = max_sprites
+        self.full_redraw_ratio = full_redraw_ratio
+        self._options.update(max_sprites=max_sprites, full_redraw_ratio=full_redraw_ratio)
+        # 只有带透明通道的背景才全部走 alpha 合成，才能按区域合成
+        self._dirty_rect = self._bg_static and self.bg.mask is not None
+        self._sprites = OrderedDict()
+        self._buffer = None
+        self._plate_key = None
+        self._layers = []
+
+    def _layer_image(self, clip, t):
+        return layer_image(clip, t - clip.start)
+
+    def _sprite(self, clip, t):
+        """静态图层的 RGBA 图像只生成一次"""
+        key = id(clip)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            sprite = self._layer_image(clip, t)
+            self._sprites[key] = sprite
+            if len(self._sprites) > self.max_sprites:
+                self._sprites.popitem(last=False)
+        else:
+            self._sprites.move_to_end(key)
+        return sprite
+
+    def _collect_layers(self, clips, t):
+        """返回 [(图层标识, 包围盒, 图像, 原点)]
+
+        动画图层按非透明像素裁剪到实际包围盒，以裁剪后的像素摘要作为内容标识：
+        模板中常见的整幅画布大小的动画图层（信息卡、打字机标题、字幕）大部分时间画面不变或只变一小块，
+        这样只有真正变化的区域才重绘。
+        """
+        width, height = self.size
+        layers = []
+        for clip in clips:
+            if self._static[id(clip)]:
+                clip_img = self._sprite(clip, t)
+                size, bbox, content = clip_img.size, (0, 0), id(clip)
+            else:
+                clip_img = self._layer_image(clip, t)
+                size, bbox = clip_img.size, clip_img.getchannel('A').getbbox()
+                if bbox is None:
+                    continue
+                if bbox != (0, 0, *size):
+                    clip_img = clip_img.crop(bbox)
+                content = hashlib.blake2b(clip_img.tobytes(), digest_size=16).digest()
+            x, y = compute_position(size, (width, height), clip.pos(t - clip.start), clip.relative_pos)
+            x, y = x + bbox[0], y + bbox[1]
+            box = (max(x, 0), max(y, 0), min(x + clip_img.width, width), min(y + clip_img.height, height))
+            if box[0] >= box[2] or box[1] >= box[3]:
+                continue
+            layers.append(((id(clip), (x, y), box, content), box, clip_img, (x, y)))
+        return layers
+
+    def _redraw(self, plate, layers, rect):
+        """从底板开始，在 rect 区域内按层级顺序重新叠加相交图层"""
+        self._buffer.paste(plate.crop(rect), rect[:2])
+        for _, box, clip_img, (x, y) in layers:
+            if not _intersects(box, rect):
+                continue
+            left, top = max(box[0], rect[0]), max(box[1], rect[1])
+            right, bottom = min(box[2], rect[2]), min(box[3], rect[3])
+            self._buffer.alpha_composite(clip_img, dest=(left, top),
+                                         source=(left - x, top - y, right - x, bottom - y))
+
+    def frame_function(self, t):
+        if self.is_mask or not self._dirty_rect:
+            return super().frame_function(t)
+
+        index = max(0, bisect_right(self._bounds, t) - 1)
+        clips, positions = self.static_prefix(index)
+        playing = self.playing_clips(t)
+        if tuple(_position(clip, t) for clip in clips) != positions or any(a is not b for a, b in zip(playing, clips)):
+            clips, positions = [], ()
+        plate = self._plate(clips, positions, t)
+        plate_key = tuple(zip(map(id, clips), positions))
+        layers = self._collect_layers(playing[len(clips):], t)
+
+        width, height = self.size
+        if self._buffer is None or plate_key != self._plate_key:
+            rects = [(0, 0, width, height)]
+        else:
+            # 前后两帧图层集合的差集即为需要重绘的区域
+            current = {layer[0] for layer in layers}
+            previous = set(self._layers)
+            rects = _merge_rects([key[2] for key in current ^ previous])
+            area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in rects)
+            if area > self.full_redraw_ratio * width * height:
+                rects = [(0, 0, width, height)]
+
+        if self._buffer is None:
+            self._buffer = plate.copy()
+        for rect in rects:
+            self._redraw(plate, layers, rect)
+        self._plate_key = plate_key
+        self._layers = [layer[0] for layer in layers]
+
+        return np.array(self._buffer)[:, :, :3]
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import textwrap
+import uuid
+
+from PIL import Image as PilImage, ImageDraw, ImageEnhance
+
+from astra.settings import IMG_PATH, COVER_CACHE_PATH, COVER_CACHE_MAX_BYTES
+from common.font_utils import FontRegistry
+from common.image_cache import ImageCache
+from image.models import Image
+
+logger = logging.getLogger("video")
+
+VERTICAL_SIZE = (1080, 1464)
+HORIZONTAL_SIZE = (1920, 1080)
+VERTICAL_BACKGROUND = "1b6db0a6-91fb-4401-b60e-9ec1c51976dd.png"
+HORIZONTAL_BACKGROUND = "6b24e082-f935-4664-8bd4-4c9e228d44e8.png"
+
+TITLE_COLOR = (255, 215, 0)  # 金色
+STROKE_COLOR = (0, 0, 0)  # 黑色描边
+
+
+def split_title(title, width=12):
+    """先按中英文逗号切割，再按宽度自动换行"""
+    result = []
+    for part in title.replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        result.extend(textwrap.wrap(part, width=width))
+    return result
+
+
+def split_name(name):
+    return name.split('·') if '·' in name else [name]
+
+
+def draw_stroke_text(draw, pos, text, font, fill, stroke_fill=STROKE_COLOR, stroke_width=3):
+    """Pillow 原生描边，单次绘制"""
+    draw.text(pos, text, font=font, fill=fill, stroke_width=stroke_width, stroke_fill=stroke_fill)
+
+
+class CoverRenderer:
+    """封面渲染
+
+    竖版与横版封面在一次调用中生成：压暗的背景底图按进程缓存，人物图层只裁边解码一次供两版共用，
+    描边文字使用 Pillow 原生描边单次绘制。生成结果按 (模板, 标题, 人名, 图片内容) 缓存，
+    重新生成草稿时直接复用缓存的封面文件，只新建图片记录。
+    """
+
+    version = 1
+    _backgrounds = {}
+
+    def __init__(self, template, img_utils, cache=None):
+        self.template = template
+        self.img_utils = img_utils
+        self.cache = cache or ImageCache(COVER_CACHE_PATH, COVER_CACHE_MAX_BYTES)
+        self._layers = {}
+
+    @classmethod
+    def background(cls, name, size, brightness=0.2):
+        key = (name, size, brightness)
+        if key not in cls._backgrounds:
+            bg = PilImage.open(os.path.join(IMG_PATH, name)).resize(size)
+            cls._backgrounds[key] = ImageEnhance.Brightness(bg).enhance(brightness)
+        return cls._backgrounds[key].copy()
+
+    def layer(self, path):
+        """裁掉透明边缘的人物图层，同一次渲染内横竖两版共用，调用方不可原地修改"""
+        if path not in self._layers:
+            self._layers[path] = self.img_utils.trim_image(path).convert("RGBA")
+        return self._layers[path]
+
+    def make_key(self, kind, title, names, image_paths):
+        raw = json.dumps({
+            'version': self.version,
+            'template': self.template,
+            'kind': kind,
+            'title': title,
+            'names': list(names),
+            'images': [ImageCache.source_hash(path) for path in image_paths],
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def render(self, user, title, names, image_paths, vertical, horizontal):
+        """生成竖版与横版封面并保存为图片记录，返回 (竖版封面ID, 横版封面ID)
+
+        vertical、horizontal 为无参函数，返回对应封面的 PIL 图片，仅在缓存未命中时调用。
+        """
+        ids = []
+        for kind, func in (('vertical', vertical), ('horizontal', horizontal)):
+            path = self.cache.get(self.make_key(kind, title, names, image_paths), func)
+            ids.append(self.save(path, user))
+        return tuple(ids)
+
+    @staticmethod
+    def save(cover_path, user):
+        image_id = uuid.uuid4()
+        image_name = f'{image_id}.png'
+        file_path = os.path.join(IMG_PATH, image_name)
+        # 优先硬链接，删除视频封面不会影响缓存；跨磁盘时退化为复制
+        try:
+            os.link(cover_path, file_path)
+        except OSError:
+            shutil.copy2(cover_path, file_path)
+
+        with PilImage.open(file_path) as img:
+            width, height = img.size
+            mode = img.mode
+        spec = {
+            'format': 'png',
+            'mode': mode,
+            'size': os.path.getsize(file_path)
+        }
+
+        Image(
+            id=image_id,
+            img_name=image_name,
+            category='normal',
+            img_path=IMG_PATH,
+            width=width,
+            height=height,
+            creator=user,
+            spec=spec
+        ).save()
+
+        return image_id
+
+    def draw_title(self, cover, title, font_size, text_y, width=12):
+        """标题按行居中绘制"""
+        draw = ImageDraw.Draw(cover)
+        font = FontRegistry.get("msyhbd.ttc", font_size)
+        line_height = font.getbbox("A")[3] - font.getbbox("A")[1] + 30
+        for line in split_title(title, width=width):
+            bbox = draw.textbbox((0, 0), line, font=font)
+            text_x = (cover.width - (bbox[2] - bbox[0])) // 2
+            draw_stroke_text(draw, (text_x, text_y), line, font, TITLE_COLOR)
+            text_y += line_height
+
+    def draw_names(self, cover, main_name, compared_name, font_size, text_base_y):
+        """左右两侧人名，以竖线分隔，多行人名整体垂直居中"""
+        draw = ImageDraw.Draw(cover)
+        name_font = FontRegistry.get("msyhbd.ttc", font_size)
+        vs_font = FontRegistry.get("ARLRDBD.TTF", font_size)
+
+        main_lines = split_name(main_name)
+        compared_lines = split_name(compared_name)
+
+        line_height = name_font.getbbox("测试")[3] - name_font.getbbox("测试")[1]
+        line_spacing = 20
+        main_total_height = len(main_lines) * line_height + max(len(main_lines) - 1, 0) * line_spacing
+        compared_total_height = len(compared_lines) * line_height + max(len(compared_lines) - 1, 0) * line_spacing
+        total_name_height = max(main_total_height, compared_total_height)
+
+        vs_text = "|"
+        vs_bbox = draw.textbbox((0, 0), vs_text, font=vs_font)
+        vs_w = vs_bbox[2] - vs_bbox[0]
+        vs_h = vs_bbox[3] - vs_bbox[1]
+
+        left_block_center_x = cover.width // 2 - vs_w // 2 - 20
+        right_block_center_x = cover.width // 2 + vs_w // 2 + 20
+        main_start_y = text_base_y + (total_name_height - main_total_height) // 2
+        compared_start_y = text_base_y + (total_name_height - compared_total_height) // 2
+
+        for i, line in enumerate(main_lines):
+            lw = draw.textbbox((0, 0), line, font=name_font)[2]
+            y = main_start_y + i * (line_height + line_spacing)
+            draw_stroke_text(draw, (left_block_center_x - lw, y), line, name_font, TITLE_COLOR)
+
+        for i, line in enumerate(compared_lines):
+            y = compared_start_y + i * (line_height + line_spacing)
+            draw_stroke_text(draw, (right_block_center_x, y), line, name_font, TITLE_COLOR)
+
+        vs_x = (cover.width - vs_w) // 2
+        vs_y = text_base_y + (total_name_height - vs_h) // 2 - 10
+        draw_stroke_text(draw, (vs_x, vs_y), vs_text, vs_font, (255, 255, 255))
+
+    def single_vertical(self, title, image_path):
+        """竖版封面：人物放大两倍居中，标题叠加在中部"""
+        cover_width, cover_height = VERTICAL_SIZE
+        cover = self.background(VERTICAL_BACKGROUND, VERTICAL_SIZE)
+        img = self.layer(image_path)
+        new_w, new_h = img.width * 2, img.height * 2
+        img = img.resize((new_w, new_h), PilImage.LANCZOS)
+        cover.paste(img, ((cover_width - new_w) // 2, (cover_height - new_h) // 2), img)
+        self.draw_title(cover, title, 90, cover_height // 2 - 150)
+        return cover
+
+    def paste_pair(self, cover, image_paths, offset):
+        """横版封面左右两侧人物，等高缩放后分别位于 1/4 与 3/4 处"""
+        width, height = cover.size
+        target_height = height - 100
+        for index, path in enumerate(image_paths[:2]):
+            body = self.layer(path)
+            new_w = int(body.width * target_height / body.height)
+            body = body.resize((new_w, target_height), PilImage.LANCZOS)
+            if index == 0:
+                x = width // 4 - new_w // 2 + offset
+            else:
+                x = width * 3 // 4 - new_w // 2 - offset
+            cover.paste(body, (x, 50), body)
+
+    def pair_horizontal(self, title, image_paths, offset=30):
+        """横版封面：左右两名人物，标题位于黄金分割线"""
+        cover = self.background(HORIZONTAL_BACKGROUND, HORIZONTAL_SIZE)
+        self.paste_pair(cover, image_paths, offset)
+        self.draw_title(cover, title, 120, int(cover.height * (1 - 0.618)))
+        return cover
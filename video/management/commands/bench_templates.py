@@ -0,0 +1,379 @@
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import traceback
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image as PilImage, ImageDraw, ImageFont
+from pydub import AudioSegment
+
+from astra.settings import BASE_DIR, IMG_PATH, SOUND_PATH, TTS_PATH
+from voice.text_to_speech import Speech, TTSBase
+
+logger = logging.getLogger("video")
+
+BENCH_USER = 'bench'
+BENCH_TTS_ORIGIN = 'BENCH_TTS'
+# 本地假TTS按字数生成静音，语速与真人配音大致相当
+BENCH_TTS_SECONDS_PER_CHAR = 0.22
+
+START_TEXT = '今天我们来看一组数据，谁才是联盟最稳定的得分手，答案可能出乎你的意料'
+CONTENT_TEXT = '他本赛季场均贡献二十七分，投篮命中率接近五成，关键时刻依然值得信赖'
+
+
+class BenchTTS(TTSBase):
+    """基准测试用的本地TTS，按文本长度生成静音音频，不访问 IndexTTS 与 edge-tts"""
+
+    def generate_speech(self, text, speaker_id, creator, video_id='', sound_id=None):
+        from voice.models import Tts
+
+        if not sound_id:
+            sound_id = str(uuid.uuid4())
+        duration = round(max(1, len(text)) * BENCH_TTS_SECONDS_PER_CHAR, 3)
+        AudioSegment.silent(duration=int(duration * 1000), frame_rate=24000).export(
+            os.path.join(TTS_PATH, f'{sound_id}.wav'), format='wav')
+        tts = Tts(id=sound_id, format='wav', txt=text, speaker_id=speaker_id, video_id=video_id,
+                  duration=duration, creator=creator)
+        tts.save()
+        return tts
+
+
+class BenchFixtures:
+    """合成的图片、静音背景音乐与配音员，所有模板共用，结束后统一删除"""
+
+    def __init__(self):
+        self.images = []
+        self.sound = None
+        self.speaker = None
+
+    def player_image(self, index):
+        """透明底的人物剪影，四周留白以覆盖裁边逻辑"""
+        img = PilImage.new('RGBA', (600, 900), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        color = (60 + index * 40 % 180, 90 + index * 25 % 150, 200 - index * 30 % 150, 255)
+        draw.ellipse((220, 80, 380, 260), fill=color)
+        draw.rounded_rectangle((150, 270, 450, 820), radius=60, fill=color)
+        draw.text((260, 500), str(index), fill=(255, 255, 255, 255), font=ImageFont.load_default())
+        return img
+
+    @staticmethod
+    def background_image():
+        img = PilImage.new('RGB', (1920, 1080))
+        draw = ImageDraw.Draw(img)
+        for y in range(0, 1080, 8):
+            draw.rectangle((0, y, 1920, y + 8), fill=(20, 40 + y * 120 // 1080, 80))
+        return img
+
+    def add_image(self, img, fmt='png'):
+        from image.models import Image
+
+        image_id = uuid.uuid4()
+        image_name = f'{image_id}.{fmt}'
+        path = os.path.join(IMG_PATH, image_name)
+        img.save(path)
+        Image(id=image_id, img_name=image_name, img_path=IMG_PATH, width=img.width, height=img.height,
+              origin='基准测试', creator=BENCH_USER, spec={'format': fmt, 'mode': img.mode,
+                                                       'size': os.path.getsize(path)}).save()
+        self.images.append(image_id)
+        return image_id, path
+
+    def setup(self, players=5):
+        from voice.models import Sound, Speaker
+
+        self.players = [self.add_image(self.player_image(i)) for i in range(players)]
+        self.background, _ = self.add_image(self.background_image(), fmt='jpg')
+
+        sound_id = uuid.uuid4()
+        sound_name = f'{sound_id}.wav'
+        AudioSegment.silent(duration=30 * 1000, frame_rate=44100).export(
+            os.path.join(SOUND_PATH, sound_name), format='wav')
+        self.sound = Sound.objects.create(id=sound_id, sound_path=sound_name, name='静音', desc='基准测试',
+                                          category='BGM', creator=BENCH_USER)
+        self.speaker = Speaker.objects.create(name='bench', origin=BENCH_TTS_ORIGIN, creator=BENCH_USER)
+        return self
+
+    def teardown(self):
+        from image.models import Image
+        from voice.models import Sound, Speaker
+
+        # Image 的 pre_delete 信号会一并删除图片文件
+        for image in Image.objects.filter(id__in=self.images):
+            image.delete()
+        if self.sound:
+            path = os.path.join(SOUND_PATH, self.sound.sound_path)
+            if os.path.exists(path):
+                os.remove(path)
+            Sound.objects.filter(id=self.sound.id).delete()
+        if self.speaker:
+            Speaker.objects.filter(id=self.speaker.id).delete()
+
+    def common(self, title):
+        return {
+            'title': title,
+            'start_text': START_TEXT,
+            'bgm': str(self.sound.id),
+            'reader': str(self.speaker.id),
+        }
+
+    def player_content(self, count, name_key='chinese_name', by_id=True):
+        content = []
+        for i, (image_id, path) in enumerate(self.players[:count]):
+            content.append({
+                'text': CONTENT_TEXT,
+                'image_path': str(image_id) if by_id else path,
+                name_key: f'球员·{i + 1}号',
+                'draft': f'2015年第{i + 1}顺位',
+                'key_note': f'{27 - i}.{i}分',
+                'stats': f'{27 - i}.1分 7.{i}板 5.{i}助',
+                'accuracy': f'4{i}.5% 3{i}.2% 8{i}.0%',
+            })
+        return content
+
+    def player_compare(self):
+        data = {'得分': 27.1, '篮板': 7.4, '助攻': 5.2, '投篮': 48.3, '失误': 3.1, '出战场次': 72}
+        sides = {}
+        for key, (image_id, path) in zip(('main', 'compared'), self.players[:2]):
+            sides[key] = {
+                'avatar': path,
+                'body': path,
+                'name': '主队·球员' if key == 'main' else '客队·球员',
+                'draft': '2015年第1顺位',
+                'key_note': '三届全明星',
+                'game_result': '52胜30负',
+                'data': {item: round(value * (0.9 if key == 'compared' else 1), 1) for item, value in data.items()},
+                'season': '2024-25',
+            }
+        return {**self.common('球员数据对比基准'), 'copywriting': CONTENT_TEXT, **sides}
+
+    def player_list(self):
+        return {**self.common('球员榜单基准'), 'background': str(self.background),
+                'content': self.player_content(5)}
+
+    def player_list2(self):
+        return {**self.common('竖版球员榜单基准'), 'background': str(self.background),
+                'content': self.player_content(3)}
+
+    def three_player_compare(self):
+        return {**self.common('三人对比基准'), 'background': str(self.background),
+                'content': self.player_content(3, name_key='name', by_id=False)}
+
+    def parameters(self, template_name):
+        """按模板类名返回参数，没有对应合成参数的模板返回 None"""
+        builders = {
+            'PlayerCompare': self.player_compare,
+            'PlayerList': self.player_list,
+            'PlayerList2': self.player_list2,
+            'ThreePlayerCompare': self.three_player_compare,
+        }
+        builder = builders.get(template_name)
+        return builder() if builder else None
+
+
+@contextmanager
+def isolated_caches(cache_root):
+    """把 TTS、图片、背景音乐与封面缓存指向 cache_root 下的空目录，结束后恢复
+
+    合成素材是固定的，共用持久缓存时第二次运行会全部命中，耗时无法与上一次比较。
+    缓存类的目录是构造参数的默认值，这里替换默认值，封面缓存目录在 cover_renderer 模块中读取。
+    """
+    from common.image_cache import ImageCache
+    from video import cover_renderer
+    from voice.bgm_cache import BgmCache
+    from voice.tts_cache import TtsCache
+
+    saved = {}
+    for name, cache_class in (('tts', TtsCache), ('image', ImageCache), ('bgm', BgmCache)):
+        path = os.path.join(cache_root, name)
+        os.makedirs(path, exist_ok=True)
+        defaults = cache_class.__init__.__defaults__
+        saved[cache_class] = defaults
+        cache_class.__init__.__defaults__ = (path,) + defaults[1:]
+    cover_path = os.path.join(cache_root, 'cover')
+    os.makedirs(cover_path, exist_ok=True)
+    cover_cache_path = cover_renderer.COVER_CACHE_PATH
+    cover_renderer.COVER_CACHE_PATH = cover_path
+    try:
+        yield
+    finally:
+        for cache_class, defaults in saved.items():
+            cache_class.__init__.__defaults__ = defaults
+        cover_renderer.COVER_CACHE_PATH = cover_cache_path
+
+
+def run_template(subclass, parameters, profile, cache_root, conn):
+    """子进程：按 render_job 的方式渲染一个模板并回传统计，峰值内存只反映本模板
+
+    cache_root 不为空时各级缓存指向该目录，从冷缓存开始渲染；为空时使用持久缓存。
+    """
+    instance = subclass()
+    instance.profile = profile
+    truetype = ImageFont.truetype
+
+    def counted_truetype(*args, **kwargs):
+        instance.timer.count('font_loads')
+        return truetype(*args, **kwargs)
+
+    video_id = str(uuid.uuid4())
+    result = {'status': 'success'}
+    # 字体文件加载次数计入当前阶段，逐帧加载字体等回归会直接体现在 encode 阶段的计数上
+    ImageFont.truetype = counted_truetype
+    try:
+        with isolated_caches(cache_root) if cache_root else nullcontext():
+            instance.timer.switch('setup')
+            try:
+                instance.process(BENCH_USER, video_id, parameters)
+            except Exception as e:
+                result = {'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+                logger.error(traceback.format_exc())
+            # 基准只测冷启动渲染，失败也不保留工作区，避免下次运行复用中间产物
+            instance.close_workspace(success=True)
+            instance.timer.finish()
+    finally:
+        ImageFont.truetype = truetype
+
+    timing = instance.timer.to_dict()
+    result.update({
+        'video_id': video_id,
+        'wall_seconds': timing['total'],
+        'stages': timing['stages'],
+        'peak_rss_mb': timing['peak_rss_mb'],
+        'peak_child_rss_mb': timing['peak_child_rss_mb'],
+    })
+    encode = timing['stages'].get('encode')
+    if encode and encode['seconds']:
+        result['render_fps'] = round(encode['counts'].get('frames', 0) / encode['seconds'], 2)
+    output_path = instance.get_output_path(video_id)
+    if os.path.exists(output_path):
+        result['output_path'] = output_path
+        result['output_bytes'] = os.path.getsize(output_path)
+    conn.send(result)
+    conn.close()
+
+
+def cleanup_video(video_id, output_path=None):
+    """删除基准渲染产生的视频、封面、参数与配音记录"""
+    from image.models import Image
+    from video.models import Video, Parameters
+    from voice.models import Tts
+
+    if output_path and os.path.exists(output_path):
+        os.remove(output_path)
+    for tts in Tts.objects.filter(video_id=video_id):
+        path = os.path.join(TTS_PATH, f'{tts.id}.{tts.format}')
+        if os.path.exists(path):
+            os.remove(path)
+        tts.delete()
+    video = Video.objects.filter(id=video_id).first()
+    if video is None:
+        return
+    for image in Image.objects.filter(id__in=[i for i in (video.cover, video.vertical_cover) if i]):
+        image.delete()
+    Parameters.objects.filter(id=video.param_id).delete()
+    video.delete()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = '使用合成素材与本地假TTS逐个渲染视频模板，输出各阶段耗时、渲染帧率、峰值内存与成片大小的JSON报告'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', action='append', dest='templates', default=[],
+                            help='只测试指定模板类名，可重复传入')
+        parser.add_argument('--profile', default='final', help='渲染配置：final 或 preview')
+        parser.add_argument('--output', default='bench_templates.json', help='JSON报告路径')
+        parser.add_argument('--keep', action='store_true', help='保留生成的视频与合成素材')
+        parser.add_argument('--warm', action='store_true',
+                            help='使用持久的TTS、图片、背景音乐与封面缓存；默认每个模板都从空缓存开始')
+
+    def handle(self, *args, **options):
+        from django.db import connections
+        from video.template_registry import TemplateRegistry
+        from video.video_templates.video_template import RENDER_PROFILES
+
+        profile = options['profile']
+        if profile not in RENDER_PROFILES:
+            raise CommandError(f"渲染配置不存在：{profile}")
+        subclasses = sorted(TemplateRegistry.methods().values(), key=lambda subclass: subclass.__name__)
+        if options['templates']:
+            subclasses = [subclass for subclass in subclasses if subclass.__name__ in options['templates']]
+            if not subclasses:
+                raise CommandError(f"模板不存在：{', '.join(options['templates'])}")
+
+        Speech.register_backend(BENCH_TTS_ORIGIN, BenchTTS)
+        fixtures = BenchFixtures().setup()
+        context = multiprocessing.get_context('fork')
+        report = {
+            'revision': git_revision(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'profile': profile,
+            'caches': 'warm' if options['warm'] else 'cold',
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'templates': {},
+        }
+        cache_dir = None if options['warm'] else tempfile.TemporaryDirectory(prefix='bench_caches_')
+        try:
+            for subclass in subclasses:
+                name = subclass.__name__
+                parameters = fixtures.parameters(name)
+                if parameters is None:
+                    report['templates'][name] = {'status': 'skipped', 'reason': '没有合成参数'}
+                    self.stdout.write(f"{name}: 跳过，没有合成参数")
+                    continue
+
+                # fork 出来的子进程不能复用父进程的数据库连接
+                connections.close_all()
+                # 每个模板一个空的缓存目录，模板之间也不共享缓存
+                cache_root = os.path.join(cache_dir.name, name) if cache_dir else None
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=run_template,
+                                          args=(subclass, parameters, profile, cache_root, sender))
+                process.start()
+                sender.close()
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    result = {'status': 'failed', 'error': '渲染进程异常退出'}
+                process.join()
+                if process.exitcode:
+                    result.setdefault('exitcode', process.exitcode)
+
+                # 视频ID与路径每次不同，不写入报告，保证报告可以直接 diff
+                video_id = result.pop('video_id', None)
+                output_path = result.pop('output_path', None)
+                if video_id and not options['keep']:
+                    cleanup_video(video_id, output_path)
+                report['templates'][name] = result
+                self.stdout.write(self.summary(name, result))
+        finally:
+            if not options['keep']:
+                fixtures.teardown()
+            if cache_dir:
+                cache_dir.cleanup()
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        self.stdout.write(f"基准报告已写入 {options['output']}")
+
+    @staticmethod
+    def summary(name, result):
+        if result['status'] != 'success':
+            return f"{name}: 失败，{result.get('error')}"
+        stages = '，'.join(f"{stage} {entry['seconds']}s" for stage, entry in sorted(result['stages'].items()))
+        return (f"{name}: 总耗时 {result['wall_seconds']}s（{stages}），{result.get('render_fps')} fps，"
+                f"峰值内存 {result['peak_rss_mb']}MB，成片 {result.get('output_bytes', 0)} 字节")
@@ -0,0 +1,156 @@
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+
+from astra.settings import RENDER_WORKSPACE_GC_INTERVAL, RENDER_ADMISSION_POLL
+from video.render_admission import RenderAdmission
+from video.render_cancel import RenderCancel
+from video.render_queue import RenderQueue
+from video.render_workspace import RenderWorkspace
+
+logger = logging.getLogger("video")
+
+
+def worker_main(index, poll_timeout, profile='final'):
+    """渲染子进程入口：循环消费渲染队列，profile 为 preview 时消费预览队列"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+    from django.db import close_old_connections, connections
+    from image.cutout_job import CutoutJob
+    from video.video_templates.video_template import VideoTemplate
+
+    # fork 出来的子进程不能复用父进程的数据库连接
+    connections.close_all()
+
+    # 收到 SIGTERM 后处理完当前任务再退出，Ctrl+C 交由主进程处理
+    stopped = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    template = VideoTemplate()
+    VideoTemplate.warm_fonts()
+    queue = RenderQueue.for_profile(profile)
+    admission = RenderAdmission()
+    logger.info(f"渲染进程{index}已启动，队列：{queue.queue_key}")
+
+    while not stopped:
+        try:
+            job = queue.dequeue(poll_timeout, admission.host, os.getpid())
+        except Exception:
+            logger.error(traceback.format_exc())
+            time.sleep(poll_timeout)
+            continue
+        if not job:
+            continue
+        close_old_connections()
+        job_id = queue.job_id(job)
+        # 排队或等待资源期间已取消的任务直接跳过，名额立即交给下一个任务
+        cancel = RenderCancel(job_id)
+        if cancel.requested():
+            VideoTemplate.mark_cancelled(job_id)
+            queue.done(job)
+            logger.info(f"视频{job_id}已取消，跳过渲染")
+            continue
+        try:
+            estimate = admission.estimate(job)
+        except Exception:
+            logger.error(traceback.format_exc())
+            estimate = {'cores': 1, 'memory_mb': 0, 'disk_mb': 0, 'duration': 0}
+        # 资源不足时持有任务等待，收到退出信号则放回队首
+        if not admission.wait(job_id, estimate, RENDER_ADMISSION_POLL,
+                              stopped=lambda: bool(stopped) or cancel.requested()):
+            if cancel.requested():
+                VideoTemplate.mark_cancelled(job_id)
+                queue.done(job)
+            else:
+                queue.requeue(job)
+            continue
+        try:
+            if job.get('kind') == 'batch':
+                template.render_batch_job(job)
+            elif job.get('kind') == 'cutout':
+                CutoutJob(job_id).run()
+            else:
+                template.render_job(job)
+        except Exception:
+            logger.error(f"渲染进程{index}处理视频{job_id}失败")
+        finally:
+            admission.release(job_id)
+            queue.done(job)
+            close_old_connections()
+    logger.info(f"渲染进程{index}已退出")
+
+
+class Command(BaseCommand):
+    help = '启动视频渲染进程池，消费 TemplateView.post 提交的渲染任务'
+
+    def add_arguments(self, parser):
+        from django.conf import settings
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'RENDER_WORKER_NUM', 2),
+                            help='渲染进程数')
+        parser.add_argument('--preview-workers', type=int,
+                            default=getattr(settings, 'RENDER_PREVIEW_WORKER_NUM', 1),
+                            help='预览渲染进程数')
+        parser.add_argument('--timeout', type=int, default=getattr(settings, 'RENDER_QUEUE_TIMEOUT', 5),
+                            help='队列阻塞等待时间（秒）')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        preview_workers = max(0, options['preview_workers'])
+        timeout = max(1, options['timeout'])
+        # 正式渲染与预览渲染分组，预览进程只消费预览队列
+        slots = [(index, 'final') for index in range(workers)]
+        slots += [(workers + index, 'preview') for index in range(preview_workers)]
+        processes = {}
+        stopped = []
+
+        def stop(signum, frame):
+            stopped.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f"启动 {workers} 个渲染进程，{preview_workers} 个预览渲染进程")
+        last_gc = 0
+        admission = RenderAdmission()
+        admission.register()
+        queue = RenderQueue()
+        queue.release_worker(admission.host)
+        queue.migrate_legacy()
+        try:
+            while not stopped:
+                if time.time() - last_gc > RENDER_WORKSPACE_GC_INTERVAL:
+                    last_gc = time.time()
+                    try:
+                        RenderWorkspace.gc()
+                    except Exception:
+                        logger.error(traceback.format_exc())
+                for index, profile in slots:
+                    process = processes.get(index)
+                    if process is not None and process.is_alive():
+                        continue
+                    if process is not None:
+                        logger.warning(f"渲染进程{index}异常退出，退出码：{process.exitcode}，重新拉起")
+                        admission.release_pid(process.pid)
+                        queue.release_worker(admission.host, process.pid)
+                    process = multiprocessing.Process(target=worker_main, args=(index, timeout, profile))
+                    process.start()
+                    processes[index] = process
+                time.sleep(1)
+        finally:
+            for process in processes.values():
+                if process.is_alive():
+                    process.terminate()
+            for process in processes.values():
+                process.join()
+            admission.unregister()
+            queue.release_worker(admission.host)
+            self.stdout.write("渲染进程池已停止")
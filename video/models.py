@@ -21,7 +21,8 @@ class Video(models.Model):
     title = models.CharField(max_length=30)
     creator = models.CharField(max_length=16)
     result = models.CharField(max_length=16,
-                              choices=[('Process', '视频生成中'), ('Fail', '视频生成失败'), ('Success', '生成成功')])
+                              choices=[('Process', '视频生成中'), ('Fail', '视频生成失败'), ('Success', '生成成功'),
+                                       ('Cancelled', '已取消')])
     video_path = models.TextField(null=True, blank=True)
     cover = models.CharField(null=True, blank=True, verbose_name='视频横版封面')
     vertical_cover = models.CharField(null=True, blank=True, verbose_name='视频竖版封面')
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from astra.settings import TMP_PATH, RENDER_SEGMENT_PROCESSES, RENDER_MIN_SEGMENT_SECONDS
+
+logger = logging.getLogger("video")
+
+# 待渲染的合成片段，fork 出的子进程直接继承，避免序列化包含 lambda 的 clip
+_clip = None
+
+
+def _render_segment(path, start_frame, end_frame, fps, codec, preset, ffmpeg_params, video_id=None, total_frames=0):
+    """子进程：逐帧渲染 [start_frame, end_frame) 区间为独立视频片段（无音频）"""
+    from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+    from video.progress import RenderProgress
+    from video.render_cancel import RenderCancel, RenderCancelled
+
+    progress = RenderProgress(video_id) if video_id else None
+    cancel = RenderCancel(video_id) if video_id else None
+    # 每渲染约 1 秒的帧累加一次已完成帧数
+    step = max(1, int(fps))
+    # 先写临时文件，完整编码后再重命名，续跑时按文件是否存在判断分段是否完成
+    root, ext = os.path.splitext(path)
+    part_path = f"{root}.part{ext}"
+    with FFMPEG_VideoWriter(part_path, _clip.size, fps, codec=codec, preset=preset, threads=1,
+                            ffmpeg_params=ffmpeg_params) as writer:
+        try:
+            for index in range(start_frame, end_frame):
+                frame = _clip.get_frame(index / fps)
+                if frame.dtype != 'uint8':
+                    frame = frame.astype('uint8')
+                writer.write_frame(frame)
+                done = index - start_frame + 1
+                if progress and (done % step == 0 or index == end_frame - 1):
+                    progress.add_frames(done % step or step, total_frames)
+                    cancel.check()
+        except RenderCancelled:
+            # 直接结束 ffmpeg，不等它编码完缓冲中的帧，未完成的临时文件随后删除
+            writer.proc.kill()
+            writer.proc.wait()
+            writer.proc = None
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+    os.replace(part_path, path)
+    return path
+
+
+def _render_audio(path, audio_fps, audio_codec, audio_bitrate):
+    """子进程：整段导出音轨，最终只封装一次"""
+    root, ext = os.path.splitext(path)
+    part_path = f"{root}.part{ext}"
+    _clip.audio.write_audiofile(part_path, fps=audio_fps, codec=audio_codec, bitrate=audio_bitrate, logger=None)
+    os.replace(part_path, path)
+    return path
+
+
+class ParallelRenderer:
+    """按时间切片并行渲染视频
+
+    合成后的时间轴按帧号切成 N 段，进程池中以相同编码参数分别编码，
+    再用 ffmpeg concat 流复制无损拼接，音轨单独导出后一次性封装。
+    传入 work_dir 时分段结果保存在其中且失败后不删除，重试时已编码完成的分段与音轨直接复用。
+    """
+
+    def __init__(self, processes=RENDER_SEGMENT_PROCESSES, min_segment_seconds=RENDER_MIN_SEGMENT_SECONDS):
+        self.processes = max(1, processes or os.cpu_count() or 1)
+        self.min_segment_seconds = min_segment_seconds
+
+    def plan(self, duration, fps):
+        """返回各分段的 (起始帧, 结束帧)，片段过短时减少分段数"""
+        total_frames = int(duration * fps)
+        count = min(self.processes, max(1, int(duration // self.min_segment_seconds)))
+        bounds = [total_frames * i // count for i in range(count + 1)]
+        return [(bounds[i], bounds[i + 1]) for i in range(count) if bounds[i + 1] > bounds[i]]
+
+    def write(self, clip, output_path, fps=30, codec="libx264", audio_codec="aac", audio_bitrate="192k",
+              audio_fps=44100, preset="medium", ffmpeg_params=None, video_id=None, work_dir=None):
+        segments = self.plan(clip.duration, fps)
+        if len(segments) <= 1:
+            bar_logger = 'bar'
+            if video_id:
+                from video.video_templates.video_template import MyBarLogger
+                bar_logger = MyBarLogger(video_id)
+            # 临时音轨放在 TMP_PATH 下，渲染失败或取消时一并删除
+            temp_audiofile = os.path.join(TMP_PATH, f"{uuid.uuid4().hex}.m4a")
+            try:
+                clip.write_videofile(output_path, fps=fps, codec=codec, audio_codec=audio_codec,
+                                     audio_bitrate=audio_bitrate, audio_fps=audio_fps, preset=preset,
+                                     ffmpeg_params=ffmpeg_params, temp_audiofile=temp_audiofile, logger=bar_logger)
+            finally:
+                if os.path.exists(temp_audiofile):
+                    os.remove(temp_audiofile)
+            return output_path
+
+        global _clip
+        begin = time.time()
+        resumable = work_dir is not None
+        if resumable:
+            # 分段目录按编码参数命名，参数变化后不会复用旧分段
+            signature = json.dumps([clip.size, fps, codec, preset, ffmpeg_params, audio_codec, audio_bitrate, audio_fps,
+                                    segments])
+            work_dir = os.path.join(work_dir, f"segments_{hashlib.sha256(signature.encode()).hexdigest()[:16]}")
+        else:
+            work_dir = os.path.join(TMP_PATH, f"segments_{uuid.uuid4().hex}")
+        os.makedirs(work_dir, exist_ok=True)
+        ext = os.path.splitext(output_path)[1] or '.mp4'
+        audio_path = os.path.join(work_dir, 'audio.m4a') if clip.audio is not None else None
+        segment_paths = [os.path.join(work_dir, f"{index:04d}{ext}") for index in range(len(segments))]
+        pending = [index for index, path in enumerate(segment_paths) if not os.path.exists(path)]
+        if len(pending) < len(segments):
+            logger.info(f"复用已完成的分段{len(segments) - len(pending)}/{len(segments)}：{work_dir}")
+
+        # 子进程会继承数据库连接，先关闭，由父进程按需重连
+        from django.db import connections
+        connections.close_all()
+
+        total_frames = segments[-1][1]
+        if video_id:
+            from video.progress import RenderProgress
+            progress = RenderProgress(video_id)
+            progress.reset_frames()
+            progress.publish('render')
+            reused = sum(end - start for index, (start, end) in enumerate(segments) if index not in pending)
+            if reused:
+                progress.add_frames(reused, total_frames)
+
+        _clip = clip
+        try:
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=max(1, len(pending)), mp_context=context) as executor:
+                audio_future = None
+                if audio_path and not os.path.exists(audio_path):
+                    audio_future = executor.submit(_render_audio, audio_path, audio_fps, audio_codec, audio_bitrate)
+                futures = [
+                    executor.submit(_render_segment, segment_paths[index], *segments[index], fps, codec, preset,
+                                    ffmpeg_params, video_id, total_frames)
+                    for index in pending
+                ]
+                for future in futures:
+                    future.result()
+                if audio_future:
+                    audio_future.result()
+
+            self.concat(segment_paths, audio_path, output_path, work_dir)
+            logger.info(f"并行渲染完成：{output_path}，分段数：{len(segments)}，耗时：{time.time() - begin:.2f}s")
+            return output_path
+        except Exception:
+            if resumable:
+                logger.warning(f"并行渲染失败，已完成的分段保留在{work_dir}，重试时复用")
+            raise
+        finally:
+            _clip = None
+            if not resumable:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    @staticmethod
+    def concat(segment_paths, audio_path, output_path, work_dir):
+        """ffmpeg concat 流复制拼接片段并封装音轨，不重新编码"""
+        from moviepy.config import FFMPEG_BINARY
+
+        list_path = os.path.join(work_dir, 'segments.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for path in segment_paths:
+                f.write(f"file '{path}'\n")
+
+        cmd = [FFMPEG_BINARY, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path]
+        if audio_path:
+            cmd += ['-i', audio_path, '-map', '0:v', '-map', '1:a']
+        cmd += ['-c', 'copy', output_path]
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"视频片段拼接失败：{result.stderr.decode('utf-8', errors='ignore')}")
@@ -0,0 +1,125 @@
+import json
+import logging
+import time
+
+from astra.settings import RENDER_PROGRESS_INTERVAL, RENDER_PROGRESS_HEARTBEAT, RENDER_PROGRESS_TTL
+from common.redis_tools import ControlRedis, RedisInfo
+
+logger = logging.getLogger("video")
+
+PROGRESS_CHANNEL = 'video:progress:{}'
+PROGRESS_LAST_KEY = 'video:progress:{}:last'
+PROGRESS_FRAMES_KEY = 'video:progress:{}:frames'
+
+# 各阶段在整体进度（0-100）中的区间，与 Video.process 的 0.2、1.0 节点对应
+STAGES = {
+    'queued': (0, 0),
+    'prepare': (0, 20),
+    'render': (20, 100),
+    'success': (100, 100),
+    'failed': (100, 100),
+    'cancelled': (100, 100),
+}
+FINISHED_STAGES = ('success', 'failed', 'cancelled')
+
+
+class RenderProgress:
+    """渲染进度推送
+
+    进度事件按 video_id 发布到 Redis 频道，同一阶段内按时间间隔节流，阶段切换时立即发布；
+    最近一次事件另存一份，供刚建立连接的订阅者立即拿到当前进度。
+    """
+
+    def __init__(self, video_id, min_interval=RENDER_PROGRESS_INTERVAL):
+        self.video_id = video_id
+        self.min_interval = min_interval
+        self.redis = ControlRedis()
+        self._last_time = 0
+        self._stage = None
+        self._stage_start = time.time()
+
+    def publish(self, stage, stage_progress=0.0, force=False):
+        """发布进度事件，stage_progress 为当前阶段内的进度（0-100）"""
+        now = time.time()
+        if stage != self._stage:
+            self._stage = stage
+            self._stage_start = now
+            force = True
+        if not force and now - self._last_time < self.min_interval:
+            return
+
+        stage_progress = max(0.0, min(100.0, stage_progress))
+        low, high = STAGES[stage]
+        elapsed = now - self._stage_start
+        eta = None
+        if 0 < stage_progress < 100:
+            eta = round(elapsed * (100 - stage_progress) / stage_progress, 1)
+        event = json.dumps({
+            'video_id': str(self.video_id),
+            'stage': stage,
+            'stage_progress': round(stage_progress, 2),
+            'progress': round(low + (high - low) * stage_progress / 100, 2),
+            'eta': eta,
+            'time': now,
+        })
+        try:
+            pipe = self.redis.conn.pipeline()
+            pipe.set(PROGRESS_LAST_KEY.format(self.video_id), event, ex=RENDER_PROGRESS_TTL)
+            pipe.publish(PROGRESS_CHANNEL.format(self.video_id), event)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"视频{self.video_id}进度推送失败：{e}")
+        self._last_time = now
+
+    @staticmethod
+    def last(video_id):
+        """最近一次进度事件，没有时返回 None"""
+        return ControlRedis().get_key(PROGRESS_LAST_KEY.format(video_id))
+
+    def reset_frames(self):
+        self.redis.delete_key(PROGRESS_FRAMES_KEY.format(self.video_id))
+
+    def add_frames(self, count, total):
+        """分段并行渲染时各子进程累加已完成帧数，按总帧数换算渲染阶段进度"""
+        key = PROGRESS_FRAMES_KEY.format(self.video_id)
+        try:
+            pipe = self.redis.conn.pipeline()
+            pipe.incrby(key, count)
+            pipe.expire(key, RENDER_PROGRESS_TTL)
+            done = pipe.execute()[0]
+        except Exception as e:
+            logger.warning(f"视频{self.video_id}进度推送失败：{e}")
+            return
+        self.publish('render', done * 100 / total if total else 100)
+
+    @staticmethod
+    async def stream(video_id, heartbeat=RENDER_PROGRESS_HEARTBEAT):
+        """SSE 事件流：先推送最近一次进度，再转发频道中的新事件，渲染结束后关闭"""
+        import redis.asyncio as aioredis
+
+        client = aioredis.Redis(host=RedisInfo.HOST_IP, port=RedisInfo.HOST_PORT, password=RedisInfo.PASSWORD)
+        pubsub = client.pubsub()
+        channel = PROGRESS_CHANNEL.format(video_id)
+        try:
+            # 先订阅再读取最近一次进度，避免两者之间的事件丢失
+            await pubsub.subscribe(channel)
+            last = await client.get(PROGRESS_LAST_KEY.format(video_id))
+            if last:
+                yield f"event: progress\ndata: {last.decode()}\n\n"
+                if json.loads(last)['stage'] in FINISHED_STAGES:
+                    return
+
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+                if message is None:
+                    # 心跳注释行，防止代理断开空闲连接
+                    yield ": keepalive\n\n"
+                    continue
+                data = message['data'].decode()
+                yield f"event: progress\ndata: {data}\n\n"
+                if json.loads(data)['stage'] in FINISHED_STAGES:
+                    return
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+            await client.aclose()
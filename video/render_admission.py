@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+
+from astra.settings import (MEDIA_ROOT, RENDER_HOST_CORES, RENDER_HOST_MEMORY_MB, RENDER_DISK_RESERVE_MB,
+                            RENDER_MEMORY_BASE_MB, RENDER_MEMORY_PER_PROCESS_MB, RENDER_SECONDS_PER_CHAR,
+                            RENDER_OUTPUT_MB_PER_SECOND, RENDER_ESTIMATE_HISTORY, RENDER_ESTIMATE_CACHE_TTL,
+                            REMBG_SESSION_NUM)
+from common.redis_tools import ControlRedis
+from video.stage_timer import MEMORY_VERSION, STAGES_SPEC_KEY, percentile
+
+logger = logging.getLogger("video")
+
+HOSTS_KEY = 'astra:render:hosts'
+BUDGET_KEY = 'astra:render:host:{}:budget'
+RUNNING_KEY = 'astra:render:host:{}:running'
+WAITING_KEY = 'astra:render:host:{}:waiting'
+
+# 已占用资源加上本任务的预估不超过预算时登记为运行中；本机没有运行中的任务时总是放行，避免大任务永远排不上
+ADMIT_SCRIPT = """
+local running = redis.call('HVALS', KEYS[1])
+local need = cjson.decode(ARGV[2])
+local cores, memory, disk = 0, 0, 0
+for _, raw in ipairs(running) do
+    local job = cjson.decode(raw)
+    cores = cores + job.cores
+    memory = memory + job.memory_mb
+    disk = disk + job.disk_mb
+end
+if #running > 0 and (cores + need.cores > tonumber(ARGV[3]) or memory + need.memory_mb > tonumber(ARGV[4])
+        or disk + need.disk_mb > tonumber(ARGV[5])) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+# 1080p 画面的像素数，单进程内存按画面像素数等比折算
+FULL_HD_PIXELS = 1920 * 1080
+
+# 各模板按历史渲染记录得到的内存峰值，渲染进程内缓存
+_history = {}
+
+
+def host_memory_mb():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+
+
+class RenderAdmission:
+    """渲染准入控制
+
+    按模板、画面方向与预估时长估算每个任务占用的 CPU 核数、内存与临时磁盘空间，
+    本机已准入任务的预估之和加上新任务不超过预算时才开始渲染，否则渲染进程持有任务等待资源释放。
+    各主机的预算、运行中与等待中的任务记录在 Redis，供队列监控接口汇总。
+    """
+
+    def __init__(self, host=None):
+        self.host = host or socket.gethostname()
+        self.redis = ControlRedis()
+        self.running_key = RUNNING_KEY.format(self.host)
+        self.waiting_key = WAITING_KEY.format(self.host)
+
+    def budget(self):
+        """本机预算，磁盘预算为临时目录所在磁盘当前空闲空间扣除保留空间"""
+        free_mb = shutil.disk_usage(MEDIA_ROOT).free // (1024 * 1024)
+        return {
+            'cores': RENDER_HOST_CORES or os.cpu_count() or 1,
+            'memory_mb': RENDER_HOST_MEMORY_MB or int(host_memory_mb() * 0.75),
+            'disk_mb': max(0, free_mb - RENDER_DISK_RESERVE_MB),
+        }
+
+    def register(self):
+        """渲染进程池启动时登记本机并清除上次运行遗留的记录"""
+        pipe = self.redis.conn.pipeline()
+        pipe.sadd(HOSTS_KEY, self.host)
+        pipe.set(BUDGET_KEY.format(self.host), json.dumps(self.budget()))
+        pipe.delete(self.running_key, self.waiting_key)
+        pipe.execute()
+
+    def unregister(self):
+        pipe = self.redis.conn.pipeline()
+        pipe.srem(HOSTS_KEY, self.host)
+        pipe.delete(BUDGET_KEY.format(self.host), self.running_key, self.waiting_key)
+        pipe.execute()
+
+    @staticmethod
+    def estimate(job):
+        """预估任务占用的资源：{cores, memory_mb, disk_mb, duration}"""
+        from video.parallel_render import ParallelRenderer
+        from video.template_registry import TemplateRegistry
+        from video.video_templates.video_template import RENDER_PROFILES, VideoTemplate
+
+        profile = job.get('profile', 'final')
+        if job.get('kind') == 'batch':
+            # 批次任务只做配音与图片预处理
+            return {'cores': 1, 'memory_mb': RENDER_MEMORY_BASE_MB, 'disk_mb': 0, 'duration': 0}
+        if job.get('kind') == 'cutout':
+            # 抠图按会话数并发推理
+            return {'cores': REMBG_SESSION_NUM, 'memory_mb': RENDER_MEMORY_BASE_MB, 'disk_mb': 0, 'duration': 0}
+
+        template_class = TemplateRegistry.methods().get(job.get('template_id'))
+        instance = template_class() if template_class else VideoTemplate()
+        width, height = instance.get_size(instance.orientation) or (1920, 1080)
+        try:
+            chars = sum(len(text) for text in instance.narration_texts(job.get('parameters') or {}))
+        except Exception:
+            chars = 0
+        # 视频时长以配音为主，另加开场留白与结尾定格
+        duration = chars * RENDER_SECONDS_PER_CHAR + 2
+
+        settings = RENDER_PROFILES.get(profile, RENDER_PROFILES['final'])
+        processes = len(ParallelRenderer().plan(duration, settings['fps'])) if settings['parallel'] else 1
+        process_mb = RENDER_MEMORY_PER_PROCESS_MB * width * height / FULL_HD_PIXELS
+        memory_mb = RENDER_MEMORY_BASE_MB + processes * process_mb
+
+        history = RenderAdmission.history(job.get('template_id'), profile)
+        if history:
+            # 子进程 fork 自主进程，RSS 含与主进程共享的页，按此估算偏保守
+            memory_mb = max(memory_mb, history['peak_rss_mb'] + processes * history['peak_child_rss_mb'])
+
+        # 分段文件与拼接后的成片各占一份
+        disk_mb = 2 * duration * RENDER_OUTPUT_MB_PER_SECOND.get(profile, RENDER_OUTPUT_MB_PER_SECOND['final'])
+        return {'cores': processes, 'memory_mb': int(memory_mb), 'disk_mb': int(disk_mb) + 1,
+                'duration': round(duration, 1)}
+
+    @staticmethod
+    def history(template_id, profile):
+        """最近成功渲染记录中主进程与单个子进程内存峰值的 p95，按渲染采样的记录不足时返回 None"""
+        from video.models import Parameters, Video
+
+        key = (template_id, profile)
+        cached = _history.get(key)
+        if cached and time.time() - cached[0] < RENDER_ESTIMATE_CACHE_TTL:
+            return cached[1]
+        param_ids = Parameters.objects.filter(template_id=template_id).values('id')
+        rows = Video.objects.filter(
+            param_id__in=param_ids, result='Success', spec__render_profile=profile, spec__has_key=STAGES_SPEC_KEY
+        ).order_by('-create_time').values_list(f'spec__{STAGES_SPEC_KEY}', flat=True)[:RENDER_ESTIMATE_HISTORY]
+        peaks, children = [], []
+        for timing in rows:
+            # 旧口径的峰值是渲染进程整个生命周期的峰值，只增不减，跳过
+            if not timing or timing.get('memory_version') != MEMORY_VERSION:
+                continue
+            stage_peaks = [entry['peak_rss_mb'] for entry in (timing.get('stages') or {}).values()
+                           if entry.get('peak_rss_mb')]
+            if stage_peaks:
+                peaks.append(max(stage_peaks))
+                children.append(timing.get('peak_child_rss_mb') or 0)
+        result = None
+        if len(peaks) >= 5:
+            result = {'peak_rss_mb': percentile(peaks, 95), 'peak_child_rss_mb': percentile(children, 95)}
+        _history[key] = (time.time(), result)
+        return result
+
+    def admit(self, job_id, estimate):
+        budget = self.budget()
+        entry = json.dumps({**estimate, 'pid': os.getpid(), 'since': time.time()})
+        return bool(self.redis.conn.eval(ADMIT_SCRIPT, 1, self.running_key, job_id, entry,
+                                         budget['cores'], budget['memory_mb'], budget['disk_mb']))
+
+    def wait(self, job_id, estimate, poll=1, stopped=None):
+        """等待资源直到准入，stopped() 返回真时放弃等待并返回 False"""
+        if self.admit(job_id, estimate):
+            return True
+        logger.info(f"视频{job_id}等待渲染资源，预估：{estimate}")
+        self.redis.conn.hset(self.waiting_key, job_id, json.dumps({**estimate, 'pid': os.getpid(), 'since': time.time()}))
+        try:
+            while not (stopped and stopped()):
+                time.sleep(poll)
+                if self.admit(job_id, estimate):
+                    return True
+            return False
+        finally:
+            self.redis.conn.hdel(self.waiting_key, job_id)
+
+    def release(self, job_id):
+        self.redis.conn.hdel(self.running_key, job_id)
+
+    def release_pid(self, pid):
+        """渲染进程异常退出后释放其占用的资源"""
+        for key in (self.running_key, self.waiting_key):
+            for job_id, raw in self.redis.conn.hgetall(key).items():
+                if json.loads(raw).get('pid') == pid:
+                    self.redis.conn.hdel(key, job_id)
+
+    @staticmethod
+    def jobs(key):
+        jobs = []
+        for job_id, raw in ControlRedis().conn.hgetall(key).items():
+            jobs.append({'video_id': job_id.decode(), **json.loads(raw)})
+        return sorted(jobs, key=lambda job: job['since'])
+
+    @staticmethod
+    def metrics():
+        """各主机的预算、已占用资源、运行中与等待中的任务"""
+        redis = ControlRedis()
+        hosts = []
+        for host in sorted(name.decode() for name in redis.conn.smembers(HOSTS_KEY)):
+            budget = redis.get_key(BUDGET_KEY.format(host)) or {}
+            running = RenderAdmission.jobs(RUNNING_KEY.format(host))
+            waiting = RenderAdmission.jobs(WAITING_KEY.format(host))
+            used = {name: sum(job[name] for job in running) for name in ('cores', 'memory_mb', 'disk_mb')}
+            hosts.append({'host': host, 'budget': budget, 'used': used, 'running': running, 'waiting': waiting})
+        return hosts
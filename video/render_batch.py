@@ -0,0 +1,99 @@
+import json
+import logging
+import time
+import uuid
+
+from astra.settings import RENDER_BATCH_TTL
+from common.redis_tools import ControlRedis
+from video.progress import PROGRESS_LAST_KEY, STAGES, FINISHED_STAGES
+
+logger = logging.getLogger("video")
+
+BATCH_KEY = 'astra:render:batch:{}'
+
+
+class RenderBatch:
+    """同一模板批量生成视频的状态
+
+    提交时预先分配各视频的 video_id，批次信息保存在 Redis；
+    共享准备完成后各视频作为普通渲染任务入队，批次进度由各视频最近一次进度事件汇总。
+    """
+
+    def __init__(self, batch_id):
+        self.batch_id = batch_id
+        self.key = BATCH_KEY.format(batch_id)
+        self.redis = ControlRedis()
+
+    @classmethod
+    def create(cls, user, template_id, profile, video_ids):
+        batch = cls(str(uuid.uuid4()))
+        batch.save({
+            'batch_id': batch.batch_id,
+            'user': user,
+            'template_id': template_id,
+            'profile': profile,
+            'video_ids': video_ids,
+            'state': 'preparing',
+            'shared': None,
+            'created': time.time(),
+        })
+        return batch
+
+    def load(self):
+        return self.redis.get_key(self.key)
+
+    def save(self, info):
+        self.redis.conn.set(self.key, json.dumps(info), ex=RENDER_BATCH_TTL)
+
+    def update(self, **fields):
+        info = self.load()
+        if info is None:
+            return
+        info.update(fields)
+        self.save(info)
+
+    def progress(self):
+        """汇总批次内各视频的阶段与进度，批次不存在时返回 None"""
+        from video.models import Video
+
+        info = self.load()
+        if info is None:
+            return None
+        video_ids = info['video_ids']
+        videos = {}
+        events = self.redis.conn.mget([PROGRESS_LAST_KEY.format(video_id) for video_id in video_ids])
+        for video_id, event in zip(video_ids, events):
+            if event:
+                event = json.loads(event)
+                videos[video_id] = {'stage': event['stage'], 'progress': event['progress']}
+
+        # 进度事件过期后按数据库中的视频状态补齐
+        missing = [video_id for video_id in video_ids if video_id not in videos]
+        if missing:
+            for row in Video.objects.filter(id__in=missing).values('id', 'result', 'process'):
+                stage = {'Success': 'success', 'Fail': 'failed', 'Cancelled': 'cancelled'}.get(row['result'], 'render')
+                progress = 100 if stage in FINISHED_STAGES else round(row['process'] * 100, 2)
+                videos[str(row['id'])] = {'stage': stage, 'progress': progress}
+
+        counts = dict.fromkeys(STAGES, 0)
+        items = []
+        for video_id in video_ids:
+            item = videos.get(video_id, {'stage': 'queued', 'progress': 0})
+            counts[item['stage']] += 1
+            items.append({'video_id': video_id, **item})
+        finished = sum(counts[stage] for stage in FINISHED_STAGES)
+        state = info['state']
+        if state != 'preparing':
+            state = 'finished' if finished == len(video_ids) else 'rendering'
+        return {
+            'batch_id': self.batch_id,
+            'template_id': info['template_id'],
+            'profile': info['profile'],
+            'state': state,
+            'total': len(video_ids),
+            'finished': finished,
+            'counts': counts,
+            'progress': round(sum(item['progress'] for item in items) / len(items), 2) if items else 100,
+            'shared': info['shared'],
+            'videos': items,
+        }
@@ -0,0 +1,50 @@
+import logging
+import time
+
+from astra.settings import RENDER_CANCEL_TTL, RENDER_CANCEL_CHECK_INTERVAL
+from common.redis_tools import ControlRedis
+
+logger = logging.getLogger("video")
+
+CANCEL_KEY = 'astra:render:cancel:{}'
+
+
+class RenderCancelled(Exception):
+    """渲染已被用户取消"""
+
+
+class RenderCancel:
+    """渲染取消标记
+
+    取消接口在 Redis 中设置标记，渲染进程在阶段切换与逐帧渲染时检查，发现标记后抛出 RenderCancelled 结束渲染。
+    """
+
+    def __init__(self, video_id, interval=RENDER_CANCEL_CHECK_INTERVAL):
+        self.video_id = video_id
+        self.key = CANCEL_KEY.format(video_id)
+        self.interval = interval
+        self.redis = ControlRedis()
+        self._last_check = 0
+
+    def request(self):
+        self.redis.conn.set(self.key, 1, ex=RENDER_CANCEL_TTL)
+
+    def requested(self):
+        return bool(self.redis.conn.exists(self.key))
+
+    def clear(self):
+        self.redis.delete_key(self.key)
+
+    def check(self, force=True):
+        """已取消时抛出 RenderCancelled，force 为 False 时按间隔节流，供逐帧回调使用；Redis 不可用时不影响渲染"""
+        now = time.time()
+        if not force and now - self._last_check < self.interval:
+            return
+        self._last_check = now
+        try:
+            cancelled = self.requested()
+        except Exception as e:
+            logger.warning(f"视频{self.video_id}取消标记读取失败：{e}")
+            return
+        if cancelled:
+            raise RenderCancelled(f"视频{self.video_id}已取消")
@@ -0,0 +1,86 @@
+import json
+import logging
+import time
+
+from astra.settings import RENDER_DEDUP_WINDOW
+from common.redis_tools import ControlRedis
+from video.progress import FINISHED_STAGES, RenderProgress
+from video.render_cancel import RenderCancel
+from video.render_workspace import render_fingerprint
+
+logger = logging.getLogger("video")
+
+LEASE_KEY = 'astra:render:inflight:{}:{}'
+
+# 租约仍是读取时的值才替换，两个请求同时接管失效租约时只有一个成功
+REPLACE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+    return 1
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RenderDedup:
+    """相同渲染请求的合并
+
+    按 (模板, 参数, 渲染配置) 的指纹为每个用户加一个 Redis 租约，租约记录首个请求的 video_id，
+    RENDER_DEDUP_WINDOW 秒内重复提交时直接返回该视频：排队或生成中的复用同一个任务，已生成的返回成品；
+    该视频失败或已取消时由新请求接管租约重新渲染。
+    """
+
+    def __init__(self, user, template_id, parameters, profile, window=RENDER_DEDUP_WINDOW):
+        self.key = LEASE_KEY.format(user, render_fingerprint(template_id, parameters, profile))
+        self.window = window
+        self.redis = ControlRedis()
+        self.lease = None
+
+    def acquire(self, video_id):
+        """为 video_id 取得租约返回 None；已有相同请求时返回其状态 {video_id, result}"""
+        lease = json.dumps({'video_id': video_id, 'time': time.time()})
+        while True:
+            if self.redis.set_lock(self.key, lease, self.window):
+                self.lease = lease
+                return None
+            raw = self.redis.conn.get(self.key)
+            if raw is None:
+                continue
+            holder = json.loads(raw)['video_id']
+            result = self.state(holder)
+            if result is not None:
+                return {'video_id': holder, 'result': result}
+            if self.redis.conn.eval(REPLACE_SCRIPT, 1, self.key, raw, lease, self.window):
+                logger.info(f"视频{holder}已失败或取消，相同请求重新渲染：{video_id}")
+                self.lease = lease
+                return None
+
+    def release(self):
+        """租约仍属于本请求时删除，入队失败后不再挡住后续请求"""
+        if self.lease is not None:
+            self.redis.conn.eval(RELEASE_SCRIPT, 1, self.key, self.lease)
+            self.lease = None
+
+    @staticmethod
+    def state(video_id):
+        """视频仍可复用时返回 Video.result（排队中为 Process），失败、已取消或正在取消、记录已丢失时返回 None"""
+        from video.models import Video
+
+        result = Video.objects.filter(id=video_id).values_list('result', flat=True).first()
+        if result == 'Process' and RenderCancel(video_id).requested():
+            # 取消后立即重新提交时不能复用这个即将结束的任务
+            return None
+        if result is not None:
+            return result if result in ('Success', 'Process') else None
+        # 入队时已创建视频记录，没有记录的（升级前入队的任务）按最近的进度事件判断
+        last = RenderProgress.last(video_id)
+        if last is None or last['stage'] in FINISHED_STAGES:
+            return None
+        return 'Process'
@@ -0,0 +1,277 @@
+import json
+import logging
+import time
+import uuid
+
+from astra.settings import (RENDER_USER_WEIGHTS, RENDER_USER_MAX_RUNNING, RENDER_USER_MAX_RUNNING_OVERRIDES,
+                            RENDER_USER_MAX_PREVIEW_RUNNING)
+from common.redis_tools import ControlRedis
+
+logger = logging.getLogger("video")
+
+QUEUE_PREFIX = 'astra:render:queue'
+# 优先级从高到低：交互式预览、正式渲染、批量生成
+PRIORITY_CLASSES = ('preview', 'final', 'batch')
+# 旧版本的先进先出队列，进程池启动时把其中遗留的任务迁移到新队列
+LEGACY_QUEUE_KEYS = ('astra:render:queue', 'astra:render:queue:preview')
+
+USERS_KEY = QUEUE_PREFIX + ':{}:users'  # 有排队任务的用户，分数为虚拟时间
+USER_QUEUE_KEY = QUEUE_PREFIX + ':{}:user:{}'
+VTIME_KEY = QUEUE_PREFIX + ':{}:vtime'
+RUNNING_KEY = QUEUE_PREFIX + ':running'  # 各用户运行中的正式与批量任务数，两个优先级共用一个上限
+PREVIEW_RUNNING_KEY = QUEUE_PREFIX + ':preview_running'  # 各用户运行中的预览任务数，单独计算上限
+LEGACY_RUNNING_KEYS = tuple(QUEUE_PREFIX + f':{priority}:running' for priority in PRIORITY_CLASSES)
+RUNNING_JOBS_KEY = QUEUE_PREFIX + ':running_jobs'  # 运行中的任务及其所在主机、进程
+SIGNAL_KEY = QUEUE_PREFIX + ':{}:signal'
+SIGNAL_MAX = 100
+
+# 新加入的用户从当前虚拟时间开始计，空闲很久的用户不会积累优先权
+ENQUEUE_SCRIPT = """
+local score = redis.call('GET', KEYS[4]) or '0'
+redis.call(ARGV[3], KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[2], 'NX', score, ARGV[2])
+redis.call('LPUSH', KEYS[3], '1')
+redis.call('LTRIM', KEYS[3], 0, tonumber(ARGV[4]) - 1)
+return 1
+"""
+
+# 按优先级依次查看各类任务，同一类中虚拟时间最小且未达到并发上限的用户先出队，出队后按权重推进该用户的虚拟时间；
+# 预览任务按用户单独计数，正式与批量任务合计计数。
+# KEYS：运行数（正式与批量）、运行数（预览）、运行中任务，各优先级的用户集合与虚拟时间，之后为各用户的子队列；
+# ARGV[5] 给出各优先级中用户子队列在 KEYS 中的下标，调用前才加入的用户本次跳过，入队信号会触发下一次出队
+DEQUEUE_SCRIPT = """
+local classes = cjson.decode(ARGV[1])
+local default_cap = tonumber(ARGV[2])
+local caps = cjson.decode(ARGV[3])
+local weights = cjson.decode(ARGV[4])
+local lists = cjson.decode(ARGV[5])
+local preview_cap = tonumber(ARGV[8])
+for c, class in ipairs(classes) do
+    local users_key = KEYS[2 + c * 2]
+    local vtime_key = KEYS[3 + c * 2]
+    local running_key = KEYS[1]
+    if class == 'preview' then
+        running_key = KEYS[2]
+    end
+    local users = redis.call('ZRANGE', users_key, 0, -1, 'WITHSCORES')
+    for i = 1, #users, 2 do
+        local user = users[i]
+        local index = lists[class][user]
+        local cap = tonumber(caps[user] or default_cap)
+        if class == 'preview' then
+            cap = preview_cap
+        end
+        local running = tonumber(redis.call('HGET', running_key, user) or '0')
+        if index and (cap <= 0 or running < cap) then
+            local list_key = KEYS[index]
+            local job = redis.call('LPOP', list_key)
+            if job then
+                local decoded = cjson.decode(job)
+                local score = tonumber(users[i + 1])
+                redis.call('SET', vtime_key, score)
+                redis.call('HINCRBY', running_key, user, 1)
+                redis.call('HSET', KEYS[3], decoded.video_id or decoded.batch_id or decoded.job_id, cjson.encode({
+                    class = class, user = user, host = ARGV[6], pid = tonumber(ARGV[7])}))
+                if redis.call('LLEN', list_key) == 0 then
+                    redis.call('ZREM', users_key, user)
+                else
+                    redis.call('ZADD', users_key, score + 1 / tonumber(weights[user] or 1), user)
+                end
+                return job
+            end
+            redis.call('ZREM', users_key, user)
+        end
+    end
+end
+return false
+"""
+
+
+class RenderQueue:
+    """视频渲染任务队列，基于 Redis，由 render_worker 进程消费
+
+    任务分为预览、正式、批量三个优先级，高优先级有任务时先处理；
+    同一优先级内每个用户（Video.creator）一个子队列，按加权公平分享轮流出队，单个用户的运行中任务数不超过上限，
+    一个用户提交大量草稿不会让其他用户一直排队。预览任务单独计算上限，批量渲染占满名额时仍能预览。
+    """
+
+    def __init__(self, classes=PRIORITY_CLASSES):
+        self.classes = tuple(classes)
+        self.redis = ControlRedis()
+
+    @classmethod
+    def for_profile(cls, profile):
+        """预览进程只处理预览任务，保证预览延迟；正式渲染进程按优先级处理全部任务"""
+        return cls(('preview',) if profile == 'preview' else PRIORITY_CLASSES)
+
+    @property
+    def queue_key(self):
+        return f"{QUEUE_PREFIX}:{'|'.join(self.classes)}"
+
+    @staticmethod
+    def priority_of(job):
+        if job.get('priority') in PRIORITY_CLASSES:
+            return job['priority']
+        return 'preview' if job.get('profile') == 'preview' else 'final'
+
+    @staticmethod
+    def job_id(job):
+        return job.get('video_id') or job.get('batch_id') or job.get('job_id')
+
+    def push(self, job, front=False):
+        priority = self.priority_of(job)
+        user = str(job.get('user'))
+        self.redis.conn.eval(ENQUEUE_SCRIPT, 4, USER_QUEUE_KEY.format(priority, user), USERS_KEY.format(priority),
+                             SIGNAL_KEY.format(priority), VTIME_KEY.format(priority),
+                             json.dumps(job), user, 'LPUSH' if front else 'RPUSH', SIGNAL_MAX)
+
+    def enqueue(self, user, parameters, video_id=None, profile='final', param_id=None, priority=None):
+        job = {
+            'video_id': video_id or str(uuid.uuid4()),
+            'param_id': param_id,
+            'user': user,
+            'template_id': parameters.get('template_id'),
+            'parameters': parameters,
+            'profile': profile,
+            'priority': priority or ('preview' if profile == 'preview' else 'final'),
+            'enqueue_time': time.time()
+        }
+        self.push(job)
+        logger.info(f"视频{job['video_id']}已加入渲染队列，模板：{job['template_id']}，优先级：{job['priority']}")
+        return job
+
+    def enqueue_batch(self, user, template_id, batch_id, jobs, profile='final'):
+        """批量生成任务：渲染进程先完成共享准备，再把 jobs 中的各视频作为批量优先级的普通任务入队"""
+        job = {
+            'kind': 'batch',
+            'batch_id': batch_id,
+            'user': user,
+            'template_id': template_id,
+            'jobs': jobs,
+            'profile': profile,
+            'priority': 'batch',
+            'enqueue_time': time.time()
+        }
+        self.push(job)
+        logger.info(f"批次{batch_id}已加入渲染队列，模板：{template_id}，视频数：{len(jobs)}")
+        return job
+
+    def enqueue_cutout(self, user, job_id):
+        """抠图任务：按预览优先级入队，rembg 会话常驻在渲染进程中，不占用 Web 进程"""
+        job = {
+            'kind': 'cutout',
+            'job_id': job_id,
+            'user': user,
+            'priority': 'preview',
+            'enqueue_time': time.time()
+        }
+        self.push(job)
+        logger.info(f"抠图任务{job_id}已加入渲染队列")
+        return job
+
+    def dequeue(self, timeout=5, host='', pid=0):
+        """取出下一个任务并计入该用户的运行中任务数，没有可执行的任务时最多等待 timeout 秒"""
+        job = self._pop(host, pid)
+        if job is None:
+            # 入队或任务结束时会发出信号，收到信号后再尝试一次
+            self.redis.conn.blpop([SIGNAL_KEY.format(priority) for priority in self.classes], timeout=timeout)
+            job = self._pop(host, pid)
+        return job
+
+    def _pop(self, host, pid):
+        keys = [RUNNING_KEY, PREVIEW_RUNNING_KEY, RUNNING_JOBS_KEY]
+        for priority in self.classes:
+            keys += [USERS_KEY.format(priority), VTIME_KEY.format(priority)]
+        lists = {}
+        for priority in self.classes:
+            lists[priority] = {}
+            for user in self.redis.conn.zrange(USERS_KEY.format(priority), 0, -1):
+                keys.append(USER_QUEUE_KEY.format(priority, user.decode()))
+                lists[priority][user.decode()] = len(keys)
+        raw = self.redis.conn.eval(DEQUEUE_SCRIPT, len(keys), *keys, json.dumps(list(self.classes)),
+                                   RENDER_USER_MAX_RUNNING,
+                                   json.dumps({str(k): v for k, v in RENDER_USER_MAX_RUNNING_OVERRIDES.items()}),
+                                   json.dumps({str(k): v for k, v in RENDER_USER_WEIGHTS.items()}),
+                                   json.dumps(lists), host, pid, RENDER_USER_MAX_PREVIEW_RUNNING)
+        return json.loads(raw) if raw else None
+
+    def done(self, job):
+        """任务结束，释放该用户的并发名额并唤醒等待中的渲染进程"""
+        self._release(self.job_id(job), str(job.get('user')), self.priority_of(job))
+
+    def _release(self, job_id, user, priority):
+        if not self.redis.conn.hdel(RUNNING_JOBS_KEY, job_id):
+            return
+        # 预览单独计数；正式与批量共用名额，唤醒这两个优先级等待中的渲染进程
+        if priority == 'preview':
+            running_key, priorities = PREVIEW_RUNNING_KEY, ('preview',)
+        else:
+            running_key, priorities = RUNNING_KEY, tuple(p for p in PRIORITY_CLASSES if p != 'preview')
+        pipe = self.redis.conn.pipeline()
+        pipe.hincrby(running_key, user, -1)
+        for signal in priorities:
+            pipe.lpush(SIGNAL_KEY.format(signal), '1')
+            pipe.ltrim(SIGNAL_KEY.format(signal), 0, SIGNAL_MAX - 1)
+        count = pipe.execute()[0]
+        if count <= 0:
+            self.redis.conn.hdel(running_key, user)
+
+    def remove(self, user, job_id):
+        """从该用户各优先级的队列中移出尚未开始的任务，返回是否移出；已被渲染进程取出时返回 False"""
+        for priority in self.classes:
+            key = USER_QUEUE_KEY.format(priority, user)
+            for raw in self.redis.query_list(key):
+                if self.job_id(json.loads(raw)) == job_id and self.redis.conn.lrem(key, 1, raw):
+                    return True
+        return False
+
+    def requeue(self, job):
+        """放回该用户队列的队首，渲染进程退出前未开始的任务交给其他进程"""
+        self.done(job)
+        self.push(job, front=True)
+
+    def release_worker(self, host, pid=None):
+        """渲染进程异常退出或进程池重启后，释放其名下运行中任务占用的并发名额"""
+        for job_id, raw in self.redis.conn.hgetall(RUNNING_JOBS_KEY).items():
+            entry = json.loads(raw)
+            if entry['host'] == host and (pid is None or entry['pid'] == pid):
+                self._release(job_id.decode(), entry['user'], entry['class'])
+
+    def migrate_legacy(self):
+        # 旧版本按优先级分别计数的运行中任务数不再使用
+        self.redis.conn.delete(*LEGACY_RUNNING_KEYS)
+        moved = 0
+        for key in LEGACY_QUEUE_KEYS:
+            if self.redis.conn.type(key) != b'list':
+                continue
+            while True:
+                job = self.redis.get_left_list(key)
+                if job is None:
+                    break
+                self.push(job)
+                moved += 1
+        if moved:
+            logger.info(f"已迁移旧渲染队列中的任务{moved}个")
+        return moved
+
+    def size(self):
+        return sum(stats['pending'] for stats in self.stats().values())
+
+    def stats(self):
+        """各优先级排队与运行中的任务数，以及各用户的排队数与运行数"""
+        running = [json.loads(raw) for raw in self.redis.conn.hvals(RUNNING_JOBS_KEY)]
+        result = {}
+        for priority in self.classes:
+            users = {}
+            for user in self.redis.conn.zrange(USERS_KEY.format(priority), 0, -1):
+                user = user.decode()
+                users[user] = {'pending': self.redis.query_len(USER_QUEUE_KEY.format(priority, user)), 'running': 0}
+            for entry in running:
+                if entry['class'] == priority:
+                    users.setdefault(entry['user'], {'pending': 0, 'running': 0})['running'] += 1
+            result[priority] = {
+                'pending': sum(item['pending'] for item in users.values()),
+                'running': sum(item['running'] for item in users.values()),
+                'users': users,
+            }
+        return result
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from astra.settings import RENDER_WORKSPACE_PATH, RENDER_WORKSPACE_TTL
+
+logger = logging.getLogger("video")
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def render_fingerprint(template_id, parameters, profile):
+    """(模板, 参数, 渲染配置) 的规范化哈希，参数键顺序不影响结果"""
+    raw = json.dumps({'template_id': template_id, 'parameters': parameters, 'profile': profile},
+                     sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class RenderWorkspace:
+    """可续跑的渲染工作区
+
+    工作区按 video_id 命名，每个视频独占一个目录，重试沿用 video_id 时落在同一目录；
+    清单记录 (模板, 参数, 渲染配置) 的指纹，指纹变化时丢弃旧的中间产物。
+    临时图片、分段编码结果等中间产物保存在其中，清单文件记录已完成的阶段与产物。
+    渲染成功后删除；失败时保留，超过 RENDER_WORKSPACE_TTL 未使用的由 gc 清理。
+    """
+
+    def __init__(self, key, root=RENDER_WORKSPACE_PATH):
+        self.key = key
+        self.path = os.path.join(root, key)
+        self.manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        self.manifest = None
+
+    @classmethod
+    def open(cls, video_id, template_id, parameters, profile, param_id=None):
+        workspace = cls(str(video_id))
+        fingerprint = render_fingerprint(template_id, parameters, profile)
+        manifest = workspace._load()
+        if manifest is not None and manifest.get('fingerprint') != fingerprint:
+            logger.info(f"渲染工作区{workspace.key}的参数已变化，丢弃旧的中间产物")
+            workspace.remove()
+            manifest = None
+        os.makedirs(workspace.path, exist_ok=True)
+        workspace.manifest = manifest or {
+            'key': workspace.key,
+            'fingerprint': fingerprint,
+            'template_id': template_id,
+            'profile': profile,
+            'created': time.time(),
+            'attempts': 0,
+            'param_ids': [],
+            'stages': {},
+        }
+        workspace.manifest['attempts'] += 1
+        if param_id and str(param_id) not in workspace.manifest['param_ids']:
+            workspace.manifest['param_ids'].append(str(param_id))
+        workspace._save()
+        if workspace.manifest['attempts'] > 1:
+            logger.info(f"续跑渲染工作区{workspace.key}，第{workspace.manifest['attempts']}次，"
+                        f"已完成阶段：{list(workspace.manifest['stages'])}")
+        return workspace
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save(self):
+        self.manifest['updated'] = time.time()
+        tmp_path = f'{self.manifest_path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.manifest_path)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def completed(self, stage):
+        """已完成阶段记录的数据，未完成返回 None"""
+        return self.manifest['stages'].get(stage)
+
+    def complete(self, stage, **data):
+        self.manifest['stages'][stage] = {**data, 'time': time.time()}
+        self._save()
+
+    def artifact(self, name, build):
+        """返回工作区内的产物路径，清单中没有记录或文件缺失时调用 build(path) 生成
+
+        build 先写入临时文件再原子重命名，中途失败不会留下不完整的产物。
+        """
+        path = self.file(name)
+        artifacts = self.manifest.setdefault('artifacts', {})
+        if name in artifacts and os.path.isfile(path):
+            return path
+        root, ext = os.path.splitext(path)
+        tmp_path = f'{root}.{uuid.uuid4().hex}.part{ext}'
+        try:
+            build(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        artifacts[name] = time.time()
+        self._save()
+        return path
+
+    def touch(self):
+        self._save()
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    @staticmethod
+    def gc(ttl=RENDER_WORKSPACE_TTL, root=RENDER_WORKSPACE_PATH):
+        """删除超过 ttl 秒未更新的工作区，返回删除数量"""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if not os.path.isdir(path):
+                continue
+            manifest_path = os.path.join(path, MANIFEST_NAME)
+            try:
+                last_used = os.path.getmtime(manifest_path if os.path.exists(manifest_path) else path)
+            except FileNotFoundError:
+                continue
+            if now - last_used > ttl:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+                logger.info(f"渲染工作区过期清理：{name}")
+        return removed
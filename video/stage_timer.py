@@ -0,0 +1,265 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from astra.settings import RENDER_MEMORY_SAMPLE_INTERVAL
+
+STAGES_SPEC_KEY = 'stages'
+# 内存统计口径的版本，按渲染采样之前的记录是渲染进程生命周期内的峰值，不能用于估算
+MEMORY_VERSION = 2
+
+
+def proc_status_kb(pid='self'):
+    """读取 /proc/<pid>/status 中的内存字段（KB），没有 /proc（非 Linux）或进程已退出时返回空字典"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            lines = f.readlines()
+    except OSError:
+        return {}
+    result = {}
+    for line in lines:
+        if line.startswith('Vm'):
+            name, _, value = line.partition(':')
+            result[name] = int(value.split()[0])
+    return result
+
+
+def rss_mb(pid='self'):
+    """进程当前的常驻内存（MB），取不到时返回 None"""
+    rss = proc_status_kb(pid).get('VmRSS')
+    return None if rss is None else round(rss / 1024, 1)
+
+
+def peak_rss_mb():
+    """本进程自上次 reset_peak_rss 以来的内存峰值（MB），取不到时返回 None"""
+    hwm = proc_status_kb().get('VmHWM')
+    return None if hwm is None else round(hwm / 1024, 1)
+
+
+def reset_peak_rss():
+    """把本进程的 VmHWM 重置为当前 RSS，内核不支持时返回 False"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def child_pids(pid):
+    try:
+        tasks = os.listdir(f'/proc/{pid}/task')
+    except OSError:
+        return []
+    pids = []
+    for tid in tasks:
+        try:
+            with open(f'/proc/{pid}/task/{tid}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def tree_rss_mb(pid):
+    """进程及其所有子孙进程当前常驻内存之和（MB）"""
+    total, stack = 0.0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss_mb(current) or 0
+        stack.extend(child_pids(current))
+    return total
+
+
+class MemorySampler:
+    """后台线程定时采样本进程与各子进程的常驻内存
+
+    渲染进程常驻运行，getrusage 的 ru_maxrss 是整个进程生命周期的峰值，一次大任务之后所有视频都会记成同一个峰值。
+    这里每个阶段开始时重置 VmHWM，阶段结束时读取，得到本阶段的峰值；
+    子进程（分段渲染进程连同它启动的 ffmpeg）按子树合计采样，只记录本次渲染期间单个子进程的峰值。
+    """
+
+    def __init__(self, interval=RENDER_MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.pid = os.getpid()
+        self.self_peak = None
+        self.child_peak = None
+        self._hwm = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._hwm = reset_peak_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='memory-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.sample()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        current = rss_mb(self.pid)
+        if current is not None:
+            self.self_peak = max(self.self_peak or 0, current)
+        for child in child_pids(self.pid):
+            self.child_peak = max(self.child_peak or 0, round(tree_rss_mb(child), 1))
+
+    def take(self):
+        """返回上次调用以来本进程的内存峰值并重新开始统计，取不到时返回 None"""
+        self.sample()
+        peaks = [value for value in (self.self_peak, peak_rss_mb() if self._hwm else None) if value is not None]
+        self.self_peak = None
+        self._hwm = reset_peak_rss()
+        return max(peaks) if peaks else None
+
+
+class StageTimer:
+    """渲染阶段计时
+
+    模板在 process 中按顺序调用 switch 切换当前阶段，或用 with stage(...) 临时进入某个阶段，
+    同名阶段多次进入时累加。各阶段只计自身耗时，嵌套阶段的时间不计入外层，所有阶段耗时之和即总耗时。
+    每个阶段另记录计数（TTS 调用数、片段数、帧数等）与本阶段内主进程的内存峰值，
+    另记录本次渲染中单个子进程的内存峰值，渲染结束后写入 Video.spec['stages']。
+    on_switch 在每次进入阶段前调用，可在阶段边界检查取消等状态，抛出的异常直接传给模板。
+    """
+
+    def __init__(self, on_switch=None):
+        self.on_switch = on_switch
+        self.stages = {}
+        self._active = None
+        self._since = None
+        self._stack = []
+        self.memory = MemorySampler()
+
+    def _entry(self, name):
+        return self.stages.setdefault(name, {'seconds': 0.0, 'counts': {}})
+
+    def _accrue(self, now):
+        if self._active is None:
+            return
+        entry = self._entry(self._active)
+        entry['seconds'] += now - self._since
+        peak = self.memory.take()
+        if peak is not None:
+            # 同名阶段多次进入时取各次的最大值
+            entry['peak_rss_mb'] = max(entry.get('peak_rss_mb') or 0, peak)
+
+    def switch(self, name):
+        """结束当前阶段并开始 name 阶段"""
+        if self.on_switch:
+            self.on_switch(name)
+        now = time.perf_counter()
+        self._accrue(now)
+        self.memory.start()
+        self._active, self._since = name, now
+        self._entry(name)
+
+    def finish(self):
+        now = time.perf_counter()
+        self._accrue(now)
+        self._active, self._since = None, None
+        self.memory.stop()
+
+    @contextmanager
+    def stage(self, name):
+        """临时进入 name 阶段，退出后回到原阶段"""
+        previous = self._active
+        self.switch(name)
+        self._stack.append(previous)
+        try:
+            yield self
+        finally:
+            now = time.perf_counter()
+            self._accrue(now)
+            self._active, self._since = self._stack.pop(), now
+
+    def count(self, key, n=1, stage=None):
+        """累加计数，默认计入当前阶段"""
+        stage = stage or self._active
+        if stage is None:
+            return
+        counts = self._entry(stage)['counts']
+        counts[key] = counts.get(key, 0) + n
+
+    def to_dict(self):
+        stages = {}
+        for name, entry in self.stages.items():
+            stages[name] = {**entry, 'seconds': round(entry['seconds'], 3)}
+        peaks = [entry['peak_rss_mb'] for entry in self.stages.values() if entry.get('peak_rss_mb') is not None]
+        return {
+            'total': round(sum(entry['seconds'] for entry in self.stages.values()), 3),
+            'peak_rss_mb': max(peaks) if peaks else None,
+            'peak_child_rss_mb': self.memory.child_peak,
+            'memory_version': MEMORY_VERSION,
+            'stages': stages,
+        }
+
+    def save(self, video_id):
+        """写入 Video.spec，保留 spec 中的其他字段"""
+        from video.models import Video
+
+        if not self.stages:
+            return
+        video = Video.objects.filter(id=video_id).only('spec').first()
+        if video is None:
+            return
+        spec = video.spec or {}
+        spec[STAGES_SPEC_KEY] = self.to_dict()
+        Video.objects.filter(id=video_id).update(spec=spec)
+
+
+def percentile(values, p):
+    """最近秩法百分位数"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(values):
+    return {'p50': round(percentile(values, 50), 3), 'p95': round(percentile(values, 95), 3)}
+
+
+def aggregate(rows):
+    """rows 为 (模板ID, Video.spec['stages']) 序列，返回各模板总耗时及各阶段耗时、内存、计数的 p50/p95"""
+    samples = {}
+    for template_id, timing in rows:
+        if not timing or not timing.get('stages'):
+            continue
+        template = samples.setdefault(template_id, {'total': [], 'stages': {}})
+        template['total'].append(timing.get('total', 0))
+        for name, entry in timing['stages'].items():
+            stage = template['stages'].setdefault(name, {'seconds': [], 'peak_rss_mb': [], 'counts': {}})
+            stage['seconds'].append(entry.get('seconds', 0))
+            if entry.get('peak_rss_mb') is not None:
+                stage['peak_rss_mb'].append(entry['peak_rss_mb'])
+            for key, value in (entry.get('counts') or {}).items():
+                stage['counts'].setdefault(key, []).append(value)
+
+    result = {}
+    for template_id, template in samples.items():
+        stages = {}
+        for name, stage in template['stages'].items():
+            stages[name] = {
+                'renders': len(stage['seconds']),
+                'seconds': summarize(stage['seconds']),
+                'peak_rss_mb': summarize(stage['peak_rss_mb']) if stage['peak_rss_mb'] else None,
+                'counts': {key: summarize(values) for key, values in stage['counts'].items()},
+            }
+        result[template_id] = {
+            'renders': len(template['total']),
+            'total': summarize(template['total']),
+            'stages': stages,
+        }
+    return result
@@ -0,0 +1,145 @@
+import logging
+import threading
+import uuid
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from common.redis_tools import ControlRedis
+from tag.models import Tag
+from video.models import TemplateTags
+
+logger = logging.getLogger("video")
+
+TEMPLATE_TAGS_KEY = 'video:template_tags'
+TEMPLATE_TAGS_VERSION_KEY = 'video:template_tags:version'
+
+
+class TemplateRegistry:
+    """视频模板注册表
+
+    模板元数据只在首次访问时收集一次，模板实例不创建文本、图片、语音等工具对象；
+    模板标签用一次查询全部取出，缓存在进程内与 Redis 中，标签变化时由 invalidate 统一失效。
+    """
+
+    _lock = threading.Lock()
+    _methods = None
+    _metadata = None
+    _tags = None
+    _tags_version = None
+
+    @staticmethod
+    def template_id(subclass):
+        return str(uuid.uuid3(uuid.NAMESPACE_DNS, subclass.__name__))
+
+    @classmethod
+    def methods(cls):
+        """模板ID到模板类的映射"""
+        if cls._methods is None:
+            from video.video_templates.video_template import VideoTemplate
+
+            cls._methods = {cls.template_id(subclass): subclass for subclass in VideoTemplate.__subclasses__()}
+        return cls._methods
+
+    @classmethod
+    def metadata(cls):
+        """模板静态元数据，不含标签，不访问数据库"""
+        if cls._metadata is None:
+            with cls._lock:
+                if cls._metadata is None:
+                    metadata = []
+                    for template_id, subclass in cls.methods().items():
+                        instance = subclass()
+                        metadata.append({
+                            "template_id": template_id,
+                            "name": instance.name,
+                            "desc": instance.desc,
+                            "template_type": instance.video_type,
+                            "parameters": instance.parameters,
+                            "orientation": instance.orientation,
+                            "demo": instance.demo,
+                        })
+                        logger.info(f"register {instance.name}")
+                    cls._metadata = metadata
+        return cls._metadata
+
+    @classmethod
+    def names(cls):
+        return {item['template_id']: item['name'] for item in cls.metadata()}
+
+    @classmethod
+    def load_tags(cls):
+        """一次查询取出全部模板标签，返回 {模板ID: [标签]}"""
+        tags = Tag.objects.filter(id=OuterRef('tag_id'))
+        rows = TemplateTags.objects.filter(template_id__in=list(cls.methods().keys())).annotate(
+            tag_name=Subquery(tags.values('tag_name')[:1]),
+            parent=Subquery(tags.values('parent')[:1]),
+            category=Subquery(tags.values('category')[:1]),
+        ).values('template_id', 'tag_id', 'tag_name', 'parent', 'category')
+
+        result = {}
+        for row in rows:
+            if row['tag_name'] is None:
+                continue
+            result.setdefault(str(row['template_id']), []).append({
+                'id': str(row['tag_id']),
+                'tag_name': row['tag_name'],
+                'parent': row['parent'],
+                'category': row['category']
+            })
+        return result
+
+    @classmethod
+    def tags(cls):
+        """模板标签：进程内缓存以 Redis 中的版本号校验，Redis 未命中时才查询数据库"""
+        try:
+            redis = ControlRedis()
+            version = redis.get_key(TEMPLATE_TAGS_VERSION_KEY)
+        except Exception:
+            logger.warning("读取模板标签缓存版本失败，使用进程内缓存")
+            if cls._tags is None:
+                cls._tags = cls.load_tags()
+            return cls._tags
+        if cls._tags is not None and version is not None and version == cls._tags_version:
+            return cls._tags
+
+        cached = redis.get_key(TEMPLATE_TAGS_KEY) if version else None
+        if cached and cached.get('version') == version:
+            tags = cached['tags']
+        else:
+            tags = cls.load_tags()
+            version = version or uuid.uuid4().hex
+            redis.set_key(TEMPLATE_TAGS_KEY, {'version': version, 'tags': tags})
+            redis.set_key(TEMPLATE_TAGS_VERSION_KEY, version)
+        cls._tags, cls._tags_version = tags, version
+        return tags
+
+    @classmethod
+    def templates(cls):
+        tags = cls.tags()
+        return [{**item, 'tags': tags.get(item['template_id'], [])} for item in cls.metadata()]
+
+    @classmethod
+    def invalidate(cls):
+        """模板标签变化后调用，所有进程在下次访问时重新加载"""
+        cls._tags, cls._tags_version = None, None
+        try:
+            redis = ControlRedis()
+            redis.delete_key(TEMPLATE_TAGS_KEY)
+            redis.set_key(TEMPLATE_TAGS_VERSION_KEY, uuid.uuid4().hex)
+        except Exception:
+            logger.warning("清除模板标签缓存失败")
+
+
+# 事务提交后再更新版本号，否则并发的读取可能在提交前用旧数据重新填充缓存
+@receiver([post_save, post_delete], sender=TemplateTags)
+def template_tags_changed(sender, **kwargs):
+    transaction.on_commit(TemplateRegistry.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    if instance.category == 'VIDEO':
+        transaction.on_commit(TemplateRegistry.invalidate)
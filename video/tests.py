@@ -1 +1,138 @@
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+from moviepy import CompositeVideoClip, ImageClip, VideoClip, vfx
+
+from video.compositor import FlattenedCompositeVideoClip, DirtyRectCompositeVideoClip, interval_clips
+
+
+class CompositorTest(SimpleTestCase):
+    """压平/脏矩形合成输出需与 moviepy CompositeVideoClip 逐像素一致"""
+
+    size = (320, 180)
+    duration = 3
+    fps = 30
+
+    def make_layers(self):
+        rng = np.random.default_rng(0)
+        width, height = self.size
+        card = rng.integers(0, 255, (60, 90, 4), dtype=np.uint8)
+        return [
+            ImageClip(rng.integers(0, 255, (height, width, 3), dtype=np.uint8)).with_duration(self.duration),
+            ImageClip(card).with_start(0.5).with_duration(2).with_position((20, 30)),
+            ImageClip(card).with_duration(self.duration).with_position(('center', 'center')),
+            # 发牌式移动卡片，部分移出画面
+            ImageClip(card).with_duration(self.duration).with_position(lambda t: (int(120 * t) - 60, 100 - int(40 * t))),
+            ImageClip(card).with_start(1).with_duration(1.5).with_effects([vfx.CrossFadeIn(0.5)]).with_position((200, 80)),
+            # 逐帧变化尺寸的精灵图，如打字机标题
+            VideoClip(lambda t: np.full((10 + int(t * 10), 40, 4), int(t * 80) % 255, dtype=np.uint8),
+                      duration=self.duration).with_position((270, -5)),
+            ImageClip(card[:, :, :3].copy(), transparent=False).with_start(2).with_duration(1)
+            .with_position(lambda t: (150, 120 + int(t * 30))),
+        ]
+
+    def assert_same_frames(self, cls):
+        layers = self.make_layers()
+        expected = CompositeVideoClip(layers, size=self.size).with_duration(self.duration)
+        actual = cls(layers, size=self.size, fps=self.fps).with_duration(self.duration)
+        # 顺序取帧后再乱序取帧，验证缓冲区复用不依赖帧顺序
+        frames = list(range(self.duration * self.fps)) + [45, 3, 80, 62]
+        for index in frames:
+            t = index / self.fps
+            np.testing.assert_array_equal(actual.get_frame(t), expected.get_frame(t), err_msg=f"t={t}")
+
+    def test_flattened_matches_moviepy(self):
+        self.assert_same_frames(FlattenedCompositeVideoClip)
+
+    def test_dirty_rect_matches_moviepy(self):
+        self.assert_same_frames(DirtyRectCompositeVideoClip)
+
+    def make_canvas_layers(self):
+        """模板式图层：整幅画布大小的动画图层，大部分像素透明，只有一小块随时间变化"""
+        rng = np.random.default_rng(1)
+        width, height = self.size
+
+        def info_card(t):
+            # 信息卡 1 秒后出现，之后保持不变
+            frame = np.zeros((height, width, 4), dtype=np.uint8)
+            if t >= 1:
+                frame[20:60, 20:120] = (200, 40, 40, 255)
+            return frame
+
+        def typewriter(t):
+            # 打字机标题每 0.2 秒多出一个字
+            frame = np.zeros((height, width, 4), dtype=np.uint8)
+            frame[140:160, 10:10 + 8 * min(int(t / 0.2), 30)] = (255, 255, 255, 200)
+            return frame
+
+        def watermark(t):
+            frame = np.zeros((height, width, 4), dtype=np.uint8)
+            frame[height - 20:height - 5, width - 50:width - 5] = (255, 255, 255, 120)
+            return frame
+
+        return [
+            ImageClip(rng.integers(0, 255, (height, width, 3), dtype=np.uint8)).with_duration(self.duration),
+            VideoClip(info_card, duration=self.duration).with_position((0, 0)),
+            VideoClip(typewriter, duration=self.duration).with_position((0, 0)),
+            VideoClip(watermark, duration=self.duration).with_position((0, 0)),
+        ]
+
+    def test_dirty_rect_partial_redraw_with_canvas_layers(self):
+        layers = self.make_canvas_layers()
+        expected = CompositeVideoClip(layers, size=self.size).with_duration(self.duration)
+        actual = DirtyRectCompositeVideoClip(layers, size=self.size, fps=self.fps).with_duration(self.duration)
+        width, height = self.size
+        redraws = []
+        redraw = actual._redraw
+
+        def record(plate, frame_layers, rect):
+            redraws[-1].append(rect)
+            return redraw(plate, frame_layers, rect)
+
+        actual._redraw = record
+        for index in range(self.duration * self.fps):
+            t = index / self.fps
+            redraws.append([])
+            np.testing.assert_array_equal(actual.get_frame(t), expected.get_frame(t), err_msg=f"t={t}")
+
+        # 只有第一帧整帧重绘，其余帧只重绘变化的区域，画面不变的帧不重绘
+        full = [index for index, rects in enumerate(redraws) if (0, 0, width, height) in rects]
+        self.assertEqual(full, [0])
+        self.assertTrue(any(not rects for rects in redraws))
+        for rects in redraws[1:]:
+            self.assertLess(sum((r[2] - r[0]) * (r[3] - r[1]) for r in rects), 0.2 * width * height)
+
+    def test_interval_clips_match_frame_function(self):
+        width, height = self.size
+
+        def make_frame(t):
+            # 0.5 秒后出现标签，1~2 秒进度条逐帧变长，之后保持不变
+            frame = np.zeros((height, width, 4), dtype=np.uint8)
+            if t >= 0.5:
+                frame[10:30, 10:60] = (255, 255, 255, 180)
+            frame[100:120, 20:20 + int(100 * min(max(t - 1, 0), 1))] = (200, 40, 40, 255)
+            return frame
+
+        background = ImageClip(np.full((height, width, 3), 90, dtype=np.uint8)).with_duration(self.duration)
+        clips = interval_clips(make_frame, self.duration, animated=[(1, 2)], changes=[0.5])
+        self.assertEqual([type(clip) for clip in clips], [ImageClip, VideoClip, ImageClip])
+        expected = CompositeVideoClip([background, VideoClip(make_frame, duration=self.duration)], size=self.size)
+        actual = DirtyRectCompositeVideoClip([background, *clips], size=self.size, fps=self.fps)
+        for index in range(self.duration * self.fps):
+            t = index / self.fps
+            np.testing.assert_array_equal(actual.get_frame(t), expected.get_frame(t), err_msg=f"t={t}")
+
+    def test_scaled_composites_at_reduced_size(self):
+        from PIL import Image
+
+        for layers in (self.make_layers(), self.make_canvas_layers()):
+            full = DirtyRectCompositeVideoClip(layers, size=self.size, fps=self.fps).with_duration(self.duration)
+            half = full.scaled(0.5)
+            self.assertEqual(tuple(half.size), (160, 90))
+            self.assertEqual(half.duration, self.duration)
+            # 各图层分别缩放后合成，与整帧合成后再缩放只在边缘与取整处略有差异
+            for index in range(0, self.duration * self.fps, 5):
+                t = index / self.fps
+                frame = half.get_frame(t)
+                self.assertEqual(frame.shape, (90, 160, 3))
+                expected = Image.fromarray(full.get_frame(t)).resize(half.size, Image.Resampling.BILINEAR)
+                self.assertLess(np.abs(frame.astype(int) - np.array(expected).astype(int)).mean(), 8, f"t={t}")
@@ -5,7 +5,8 @@ from video.views import (
     VideoAssetUploadView, VideoAssetListView, VideoAssetDeleteView, VideoAssetPlayView, VideoAssetEditView,
     DraftListView, DraftDetailView, DraftDeleteView, VideoCoverUploadView, VideoUploadView,
     # 新增导入
-    VideoCreateView, VideoBatchDeleteView
+    VideoCreateView, VideoBatchDeleteView, VideoStageStatsView, VideoRetryView, VideoCancelView,
+    VideoBatchGenerateView, VideoBatchProgressView, RenderQueueStatsView, video_progress_stream
 )
 
 urlpatterns = [
@@ -17,6 +18,13 @@ urlpatterns = [
     path('upload/', VideoUploadView.as_view(), name='video-upload'),
     path('download/<str:video_id>/', VideoView.as_view(), name='download-video'),
     path('detail/<str:video_id>/', VideoDetailView.as_view(), name='video-detail'),
+    path('progress/<str:video_id>/stream/', video_progress_stream, name='video-progress-stream'),
+    path('stats/stages/', VideoStageStatsView.as_view(), name='video-stage-stats'),
+    path('stats/render/', RenderQueueStatsView.as_view(), name='video-render-stats'),
+    path('retry/', VideoRetryView.as_view(), name='video-retry'),
+    path('cancel/', VideoCancelView.as_view(), name='video-cancel'),
+    path('batch/', VideoBatchGenerateView.as_view(), name='video-batch-generate'),
+    path('batch/<str:batch_id>/', VideoBatchProgressView.as_view(), name='video-batch-progress'),
     path('', VideoListView.as_view(), name='video-list'),
     path('delete/', VideoDeleteView.as_view(), name='video-delete'),
     path('batch-delete/', VideoBatchDeleteView.as_view(), name='video-batch-delete'),
@@ -143,7 +143,7 @@ class ImagesToVideo1(VideoTemplate):
 
         reader = parameters.get('reader')
         self.default_speaker = reader
-        Video(creator=user, title=project_name, video_type=self.video_type, result='Process', process=0.0, id=video_id, param_id=param_id).save()
+        self.save_video(user, video_id, project_name, None, param_id)
         try:
             draft_folder = self.get_draft_folder(user)
             self.generate_draft(draft_folder, project_name)
@@ -165,8 +165,8 @@ class ImagesToVideo1(VideoTemplate):
 
             start_time = 0.5
             logger.info(f"视频{video_id}开始处理开场部分")
-            for txt in start_content_list:
-                tts = self.speech.chat_tts(txt, reader, user, video_id)
+            start_ttses = self.tts_many(start_content_list, reader, user, video_id)
+            for txt, tts in zip(start_content_list, start_ttses):
                 this_duration = tts.duration
                 audio_segment = draft.Audio_segment(os.path.join(self.tts_path, f"{tts.id}.{tts.format}"),
                                                     trange(f"{start_time}s", f"{this_duration}s"))
@@ -250,6 +250,10 @@ class ImagesToVideo1(VideoTemplate):
 
             content_time = start_time
 
+            # 所有正文分段一次性并发合成，再按顺序回填到各段内容
+            content_ttses = iter(self.tts_many(
+                [txt for item in content for txt in item.get('text').split('，')], reader, user, video_id))
+
             for i, item in enumerate(content):
                 images = item.get('images')
 
@@ -258,7 +262,7 @@ class ImagesToVideo1(VideoTemplate):
                 section_time = 0
                 section_start_time = content_time
                 for txt in text.split('，'):
-                    tts = self.speech.chat_tts(txt, reader, user, video_id)
+                    tts = next(content_ttses)
                     this_duration = tts.duration
                     subtitle_start = content_time
                     section_time += this_duration
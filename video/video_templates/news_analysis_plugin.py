@@ -30,6 +30,7 @@ class NewsAnalysisPlugin(VideoTemplate):
     5. 调用多个AI进行客观评价
     6. 生成卡片图片存储到素材库
     """
+    creates_video = False
 
     def __init__(self):
         super().__init__()
@@ -1,31 +1,39 @@
 import logging
 import os
-import shutil
 import time
 import traceback
 import uuid
 
 import numpy as np
-from PIL import Image as PilImage, ImageDraw, ImageFont, ImageEnhance
+from PIL import Image as PilImage, ImageDraw, ImageEnhance
 from moviepy import *
-from moviepy.audio.fx import AudioFadeOut
-from pydub import AudioSegment
 
-from astra.settings import VIDEO_PATH, LOGO_PATH, IMG_PATH, TMP_PATH
+from astra.settings import LOGO_PATH
+from common.audio_utils import NarrationAssembler
+from common.font_utils import FontRegistry
+from common.typewriter_utils import TypewriterEffect
 from image.models import Image
 from video.models import Video
+from video.compositor import DirtyRectCompositeVideoClip, interval_clips
+from video.cover_renderer import CoverRenderer, VERTICAL_SIZE, HORIZONTAL_SIZE, VERTICAL_BACKGROUND, \
+    HORIZONTAL_BACKGROUND, TITLE_COLOR, draw_stroke_text
 from video.video_templates.video_template import VideoTemplate, VideoOrientation
+from voice.bgm_cache import BgmCache
 from voice.models import Sound
 
 logger = logging.getLogger("video")
 
-title_font = ImageFont.truetype('STXINWEI.TTF', 40)
-name_font = ImageFont.truetype('STXINWEI.TTF', 36)
-data_font = ImageFont.truetype('STXINWEI.TTF', 30)
+TITLE_FONT = ('STXINWEI.TTF', 40)
+NAME_FONT = ('STXINWEI.TTF', 36)
+DATA_FONT = ('STXINWEI.TTF', 30)
 background_color = '#ffffff'
 
 
 class PlayerCompare(VideoTemplate):
+    fonts = VideoTemplate.fonts + [TITLE_FONT, NAME_FONT, DATA_FONT, ('STXINWEI.TTF', 90), ('msyhbd.ttc', 80), ('msyhbd.ttc', 120),
+                                   ('ARLRDBD.TTF', 80), ('ARLRDBD.TTF', 120)]
+    # 视频总时长比配音长 1 秒
+    bgm_padding = 1
 
     def __init__(self):
         super().__init__()
@@ -226,6 +234,15 @@ class PlayerCompare(VideoTemplate):
         self.video_type = 'Regular'
         self.tmps = None
 
+    def narration_texts(self, parameters):
+        return self.text_utils.split_text(parameters.get('start_text', '').replace('·', ''))
+
+    def prepare_images(self, parameters):
+        for key in ('main', 'compared'):
+            data = parameters.get(key) or {}
+            self.img_utils.resize_and_crop_path(data['avatar'], 390, 255)
+            self.resize_body(data['body'])
+
     def process(self, user, video_id, parameters):
         """实现带字幕和音频同步的视频生成
 
@@ -237,9 +254,7 @@ class PlayerCompare(VideoTemplate):
 
         begin = time.time()  # 记录开始时间
 
-        self.tmps = os.path.join(TMP_PATH, video_id)
-        if not os.path.exists(self.tmps):
-            os.mkdir(self.tmps)
+        self.tmps = self.open_workspace(video_id, parameters)
         logger.info(f"视频生成请求参数：{parameters}")
         project_name = parameters.get('title')
         param_id = self.save_parameters(self.template_id, user, project_name, parameters)
@@ -256,66 +271,47 @@ class PlayerCompare(VideoTemplate):
         main_body_path = main_data['body']
         compared_body_path = compared_data['body']
 
-        resized_main_avatar_path = os.path.join(self.tmps, 'resized_main_avatar.png')
-        avatar_img = PilImage.open(main_avatar_path)
-        resized_img = self.img_utils.resize_and_crop(avatar_img, 390, 255)
-        resized_img.save(resized_main_avatar_path)
-
-        resized_compared_avatar_path = os.path.join(self.tmps, 'resized_compared_avatar.png')
-        avatar_img = PilImage.open(compared_avatar_path)
-        resized_img = self.img_utils.resize_and_crop(avatar_img, 390, 255)
-        resized_img.save(resized_compared_avatar_path)
-
-        trim_main_body_path = os.path.join(self.tmps, 'trim_main_body.png')
-
-        self.resize_body(main_body_path, trim_main_body_path)
+        # 头像缩放裁剪与半身像裁边结果按源图内容缓存，同一球员图片只处理一次
+        self.timer.switch('assets')
+        resized_main_avatar_path = self.img_utils.resize_and_crop_path(main_avatar_path, 390, 255)
+        resized_compared_avatar_path = self.img_utils.resize_and_crop_path(compared_avatar_path, 390, 255)
 
-        trim_compared_body_path = os.path.join(self.tmps, 'trim_compared_body.png')
+        trim_main_body_path = self.resize_body(main_body_path)
+        trim_compared_body_path = self.resize_body(compared_body_path)
 
-        self.resize_body(compared_body_path, trim_compared_body_path)
-
-        output_path = os.path.join(VIDEO_PATH, f"{video_id}.mp4")
+        output_path = self.get_output_path(video_id)
 
         reader = parameters.get('reader')
         self.default_speaker = reader
 
-        Video(creator=user, title=f"{project_name}",
-              content=copywriting + "\n\n", video_type=self.video_type,
-              result='Process',
-              process=0.0, id=video_id, param_id=param_id).save()
+        self.save_video(user, video_id, f"{project_name}", copywriting + "\n\n", param_id)
         try:
-            vertical_cover = self.generate_vertical_cover(project_name, main_data.get('name'), compared_data.get('name'), trim_main_body_path,
-                                                          trim_compared_body_path, user)
-            Video.objects.filter(id=video_id).update(vertical_cover=vertical_cover)
-
-            horizontal_cover = self.generate_horizontal_cover(main_data.get('name'), compared_data.get('name'), trim_main_body_path,
-                                                              trim_compared_body_path, user)
-            Video.objects.filter(id=video_id).update(cover=horizontal_cover)
+            with self.timer.stage('cover'):
+                vertical_cover, horizontal_cover = self.resumable('cover', lambda: self.generate_covers(
+                    project_name, main_data.get('name'), compared_data.get('name'),
+                    trim_main_body_path, trim_compared_body_path, user), valid=self.images_exist)
+            Video.objects.filter(id=video_id).update(vertical_cover=vertical_cover, cover=horizontal_cover)
 
             _cover = Image.objects.get(id=vertical_cover)
             cover_img_path = os.path.join(self.img_path, _cover.img_name)
             segments = self.text_utils.split_text(start_text)
 
-            subtitlers = []
+            subtitles = self.subtitler.track((self.width, self.height))
             start = 0.5
-            final_audio = AudioSegment.silent(duration=0)
+            narration = NarrationAssembler()
 
-            for i, sg in enumerate(segments):
-                tts = self.speech.chat_tts(sg, reader, user, video_id)
+            ttses = self.tts_many(segments, reader, user, video_id)
+            for i, (sg, tts) in enumerate(zip(segments, ttses)):
                 tts_path = os.path.join(self.tts_path, f'{tts.id}.{tts.format}')
-                audio = AudioSegment.from_file(tts_path).fade_in(200).fade_out(200)
-                for text_clip in self.subtitler.text_clip(sg, start, tts.duration, 1310, self.width):
-                    subtitlers.append(text_clip)
+                subtitles.add(sg, start, tts.duration, 1310, self.width)
+                narration.add_speech(tts_path, tts.duration)
                 if i == 0:
-                    final_audio = audio
                     start += tts.duration
                 else:
-                    final_audio = final_audio.append(audio, crossfade=200)
                     start += tts.duration - 0.2
-            audio_path = os.path.join(self.tmps, "merged_tts.mp3")
-            final_audio.export(audio_path, format="mp3")
 
             Video.objects.filter(id=video_id).update(process=0.2)
+            self.timer.switch('compose')
 
             data = {
                 "main": {
@@ -342,16 +338,16 @@ class PlayerCompare(VideoTemplate):
                                            trim_main_body_path, trim_compared_body_path,
                                            cover_img_path,
                                            output_path, data,
-                                           audio_path,  # 开场音频文件
-                                           subtitlers,
-                                           os.path.join(self.sound_path, bgm_sound.sound_path)  # 背景音乐路径
+                                           narration,  # 开场旁白
+                                           subtitles,
+                                           bgm_sound  # 背景音乐
                                            )
             # 获取生成的视频文件大小
             video_size = 0
             if os.path.exists(output_path):
                 video_size = os.path.getsize(output_path)
 
-            Video.objects.filter(id=video_id).update(result='Success', process=1.0, video_path=f"/media/videos/{video_id}.mp4",
+            Video.objects.filter(id=video_id).update(result='Success', process=1.0, video_path=self.get_video_url(video_id),
                                                      cost=time.time() - begin, size=video_size)
         except Exception as e:
             logger.error(traceback.format_exc())
@@ -359,27 +355,27 @@ class PlayerCompare(VideoTemplate):
             if os.path.exists(output_path):
                 os.remove(output_path)
             raise e
-        finally:
-            if os.path.exists(self.tmps):
-                shutil.rmtree(self.tmps)
 
-    def resize_body(self, image_path, save_path, max_width=350, max_height=600):
-        img = self.img_utils.trim_image(image_path)
-        w, h = img.size
+    def resize_body(self, image_path, max_width=350, max_height=600):
+        """裁边并等比缩小半身像，返回缓存中的图片路径"""
 
-        # 如果在限制范围内，直接保存
-        if w <= max_width and h <= max_height:
-            img.save(save_path)
-            return
+        def build(path):
+            img = self.img_utils.trim_image(path)
+            w, h = img.size
 
-        # 计算缩放比例（取最小的，保证都不超）
-        scale = min(max_width / w, max_height / h)
+            # 如果在限制范围内，直接保存
+            if w <= max_width and h <= max_height:
+                return img
 
-        new_w = int(w * scale)
-        new_h = int(h * scale)
+            # 计算缩放比例（取最小的，保证都不超）
+            scale = min(max_width / w, max_height / h)
+
+            new_w = int(w * scale)
+            new_h = int(h * scale)
 
-        resized_img = img.resize((new_w, new_h), PilImage.LANCZOS)
-        resized_img.save(save_path)
+            return img.resize((new_w, new_h), PilImage.LANCZOS)
+
+        return self.img_utils.cache.derive(image_path, 'resize_body', {'max_size': [max_width, max_height]}, build)
 
     def create_deal_animation(self, img_path, final_position, start_time, duration, total_duration, brightness=1.0):
         """
@@ -417,70 +413,40 @@ class PlayerCompare(VideoTemplate):
 
     def create_name_typewriter_effect(self, data, start_time, total_duration):
         """
-        创建球员姓名打字机效果
+        创建球员姓名打字机效果，返回主/对比球员两个姓名图层
         """
+        clips = []
+        for key, center_x, fill in (('main', 225, (255, 60, 60)), ('compared', 675, 'yellow')):
+            name = data.get(key).get('name')
+            typewriter = TypewriterEffect(name, *NAME_FONT, fill=fill)
 
-        def make_frame(t):
-            img = PilImage.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
-            draw = ImageDraw.Draw(img)
-
-            # 只在开始时间后才显示
-            if t >= start_time:
-                main = data.get('main')
-                compared = data.get('compared')
-
-                # 计算当前应该显示的文字长度
-                progress = min(1, (t - start_time) / 1)  # 名字打字效果持续1秒（你可以调整）
+            # 只在开始时间后才显示，名字打字效果持续1秒
+            def state(t, name=name):
+                if t < start_time:
+                    return 0, 1.0, 0
+                progress = min(1, (t - start_time) / 1)
+                return int(len(name) * progress), 1.0, 0
 
-                # 主球员名字打字效果
-                main_name = main.get('name')
-                main_chars_to_show = int(len(main_name) * progress)
-                current_main_text = main_name[:main_chars_to_show]
-                main_mask = name_font.getmask(current_main_text)
-                draw.text((225 - int(main_mask.size[0]) / 2, 315), text=current_main_text, font=name_font, fill=(255, 60, 60))
+            def anchor(txt, font, draw, center_x=center_x):
+                return center_x - int(font.getmask(txt).size[0]) / 2, 315
 
-                # 对比球员名字打字效果
-                compared_name = compared.get('name')
-                compared_chars_to_show = int(len(compared_name) * progress)
-                current_compared_text = compared_name[:compared_chars_to_show]
-                compared_mask = name_font.getmask(current_compared_text)
-                draw.text((675 - int(compared_mask.size[0]) / 2, 315), text=current_compared_text, font=name_font, fill='yellow')
-
-            return np.array(img)
-
-        return VideoClip(make_frame, duration=total_duration)
+            clips.append(typewriter.make_clip(state, anchor, total_duration))
+        return clips
 
     # 创建打字机效果，并在完成后保持显示
-    def create_typewriter_effect(self, text, position, duration, total_duration, bg_points=None):
+    def create_typewriter_effect(self, text, position, duration, total_duration):
         """
         创建打字机效果，并在完成后保持显示
         """
+        typewriter = TypewriterEffect(text, *TITLE_FONT, fill="gold")
 
-        # 创建临时函数来生成每一帧
-        def make_frame(t):
-            # 创建新的图像
-            img = PilImage.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
-            draw = ImageDraw.Draw(img)
-
-            # 绘制梯形背景（如果提供了背景点）
-            if bg_points:
-                draw.polygon(bg_points, fill="#66666")
-
-            # 计算当前应该显示的文字长度
+        def state(t):
+            # 计算当前应该显示的文字长度，动画完成后显示完整文字
             if t < duration:
-                progress = min(1, t / duration)
-                chars_to_show = int(len(text) * progress)
-                current_text = text[:chars_to_show]
-            else:
-                current_text = text  # 动画完成后显示完整文字
-
-            # 绘制文字
+                return int(len(text) * min(1, t / duration)), 1.0, 0
+            return len(text), 1.0, 0
 
-            draw.text(position, current_text, font=title_font, fill="gold")
-
-            return np.array(img)
-
-        return VideoClip(make_frame, duration=total_duration)
+        return typewriter.make_clip(state, lambda txt, font, draw: position, total_duration)
 
     # 创建静态梯形背景
     def create_static_background(self, bg_points, total_duration, title_y, hex_height):
@@ -488,20 +454,20 @@ class PlayerCompare(VideoTemplate):
         创建静态梯形背景
         """
 
-        def make_frame(t):
-            img = PilImage.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
-            draw = ImageDraw.Draw(img)
-            draw.line([(30, title_y + hex_height / 2), (870, title_y + hex_height / 2)], fill=background_color, width=2)
-            draw.polygon(bg_points, fill="#333333")
-            return np.array(img)
-
-        return VideoClip(make_frame, duration=total_duration)
+        # 画面不随时间变化，只绘制一次，合成时可压平到背景底板
+        img = PilImage.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        draw.line([(30, title_y + hex_height / 2), (870, title_y + hex_height / 2)], fill=background_color, width=2)
+        draw.polygon(bg_points, fill="#333333")
+        return ImageClip(np.array(img)).with_duration(total_duration)
 
     # 创建球员信息显示效果（在所有图片到达后显示）
     def create_player_info_effect(self, data, start_time, total_duration):
         """
-        创建球员信息显示效果
+        创建球员信息显示效果，start_time 之后画面不变，返回片段列表
         """
+        name_font = FontRegistry.get(*NAME_FONT)
+        data_font = FontRegistry.get(*DATA_FONT)
 
         background_color = '#ffffff'
 
@@ -544,11 +510,11 @@ class PlayerCompare(VideoTemplate):
 
             return np.array(img)
 
-        return VideoClip(make_frame, duration=total_duration)
+        return interval_clips(make_frame, total_duration, changes=[start_time])
 
     def create_data_bar_effect(self, data, start_time, total_duration):
         """
-        绘制数据对比的进度条与（弱化的）槽边框，自上而下逐个出现。
+        绘制数据对比的进度条与（弱化的）槽边框，自上而下逐个出现，全部出现后画面不变，返回片段列表。
         """
         # 颜色（弱化透明度）
 
@@ -649,12 +615,13 @@ class PlayerCompare(VideoTemplate):
                     draw_right_bar(img, bar_y, right_target, right_bar_color)
             return np.array(img)
 
-        return VideoClip(make_frame, duration=total_duration)
+        return interval_clips(make_frame, total_duration, animated=[(start_time, start_time + len(data_items) * 0.2)])
 
     def create_data_text_effect(self, data, start_time, total_duration):
         """
-        绘制数据对比的文字（类别标签与左右数值），自上而下逐个出现。
+        绘制数据对比的文字（类别标签与左右数值），自上而下逐个出现，全部出现后画面不变，返回片段列表。
         """
+        data_font = FontRegistry.get(*DATA_FONT)
         background_color = '#ffffff'
         bar_y_start = 600
         bar_height = 40
@@ -729,15 +696,16 @@ class PlayerCompare(VideoTemplate):
                               text=compared_data_text, font=data_font, fill=fill_color)
             return np.array(img)
 
-        return VideoClip(make_frame, duration=total_duration)
+        return interval_clips(make_frame, total_duration, animated=[(start_time, start_time + len(data_items) * 0.2)])
 
     # 主函数
     def create_video_with_effects(self, title, main_avatar_path, compared_avatar_path, main_body_path, compared_body_path, cover_img_path,
                                   output_path, data,
-                                  audio_path, subtitlers, bg_music_path):
+                                  narration, subtitles, bgm_sound):
         # 竖版视频尺寸
         video_size = (self.width, self.height)
-        audio_clip = AudioFileClip(audio_path).with_start(0.5)
+        title_font = FontRegistry.get(*TITLE_FONT)
+        audio_clip = self.narration_clip(narration).with_start(0.5)
         # 设置持续时间
         total_duration = audio_clip.duration + 1  # 总时长延长到30秒，因为数据对比需要时间
         animation_duration = 2  # 动画效果时长2秒
@@ -772,30 +740,29 @@ class PlayerCompare(VideoTemplate):
             text=title,
             position=(title_x, title_y + 20),
             duration=animation_duration,
-            total_duration=total_duration,
-            bg_points=None
+            total_duration=total_duration
         )
 
         # 创建球员信息显示效果
-        player_info_clip = self.create_player_info_effect(
+        player_info_clips = self.create_player_info_effect(
             data=data,
             start_time=info_start_time + 1,
             total_duration=total_duration
         )
         # 创建球员姓名打字机效果
-        name_typewriter_clip = self.create_name_typewriter_effect(
+        name_typewriter_clips = self.create_name_typewriter_effect(
             data=data,
             start_time=info_start_time,
             total_duration=total_duration
         )
 
         # 创建数据对比效果（拆分为进度条与文字两层）
-        data_bar_clip = self.create_data_bar_effect(
+        data_bar_clips = self.create_data_bar_effect(
             data=data,
             start_time=data_start_time,
             total_duration=total_duration
         )
-        data_text_clip = self.create_data_text_effect(
+        data_text_clips = self.create_data_text_effect(
             data=data,
             start_time=data_start_time,
             total_duration=total_duration
@@ -925,14 +892,15 @@ class PlayerCompare(VideoTemplate):
         cover_img = cover_img.resize((self.width, self.height))
         cover_clip = ImageClip(np.array(cover_img)).with_duration(0.1)
 
+        # logo 与文字不变，只绘制一次，逐帧在副本上画边框
+        watermark_base = PilImage.new("RGBA", (850, 80), (0, 0, 0, 0))
+        logo_img = PilImage.open(os.path.join(LOGO_PATH, 'logo.png')).resize((80, 80)).convert("RGBA")
+        watermark_base.paste(logo_img, (465, 0), mask=logo_img)
+        ImageDraw.Draw(watermark_base).text((535, 20), text='数据之言', font=title_font, fill='white')
+
         def make_watermark_frame(t):
-            img = PilImage.new("RGBA", (850, 80), (0, 0, 0, 0))
+            img = watermark_base.copy()
             draw = ImageDraw.Draw(img)
-            # paste logo
-            logo_img = PilImage.open(os.path.join(LOGO_PATH, 'logo.png')).resize((80, 80)).convert("RGBA")
-            img.paste(logo_img, (465, 0), mask=logo_img)
-            # paste text
-            draw.text((535, 20), text='数据之言', font=title_font, fill='white')
 
             x0, y0, x1, y1 = 460, 0, 709, 79
             # 边框动画
@@ -955,43 +923,42 @@ class PlayerCompare(VideoTemplate):
 
             return np.array(img)
 
-        watermark_clip = VideoClip(make_watermark_frame, duration=total_duration).with_position((50, video_size[1] - 200))
+        # 边框每 10 秒一轮：前 2 秒逐帧描边，之后完整边框与无边框各自保持不变
+        cycles = range(0, int(np.ceil(total_duration)), 10)
+        watermark_clips = interval_clips(make_watermark_frame, total_duration,
+                                         animated=[(start, start + 2) for start in cycles],
+                                         changes=[start + 5 for start in cycles],
+                                         position=(50, video_size[1] - 200))
 
-        final_video = CompositeVideoClip([
+        final_video = DirtyRectCompositeVideoClip([
             background,
             cover_clip,
             main_avatar_anim,
             compared_avatar_anim,
             static_bg_clip.with_position((0, 0)),  # 静态梯形背景
-            typewriter_clip.with_position((0, 0)),  # 标题打字机文字
-            name_typewriter_clip.with_position((0, 0)),  # 球员姓名打字机
-            player_info_clip.with_position((0, 0)),  # 球员信息（在图片之前）
+            typewriter_clip,  # 标题打字机文字
+            *name_typewriter_clips,  # 球员姓名打字机
+            *player_info_clips,  # 球员信息（在图片之前）
             main_body_back,  # 后层（变暗）主体全身照，在最底层（背景之上）
             compared_body_back,  # 后层（变暗）对比主体全身照
-            data_bar_clip.with_position((0, 0)),  # 进度条在后层照片前
-            data_text_clip.with_position((0, 0)),  # 数值文字
+            *data_bar_clips,  # 进度条在后层照片前
+            *data_text_clips,  # 数值文字
             main_body_front,  # 前层（正常）主体全身照，最后淡入覆盖一切
             compared_body_front,  # 前层（正常）对比主体全身照
-            watermark_clip,
-            *subtitlers
+            *watermark_clips,
+            *subtitles.clips()
         ], size=video_size).with_duration(total_duration)
         # 背景音乐：全程，匹配总时长
-        bg_music = AudioFileClip(bg_music_path).with_volume_scaled(0.1).with_duration(total_duration)
-        bg_music = bg_music.with_effects([AudioFadeOut(1)])
+        # 背景音乐底轨已预先循环拼接并调好音量，按音乐与时长档位缓存
+        bg_music = BgmCache().bed(bgm_sound.id, os.path.join(self.sound_path, bgm_sound.sound_path), total_duration,
+                                  volume=0.1, fade=1)
         # 合并音轨
         final_audio = CompositeAudioClip([audio_clip, bg_music])
         final_video = final_video.with_audio(final_audio)
 
         # 输出
         try:
-            final_video.write_videofile(
-                output_path,
-                fps=30,
-                codec="libx264",
-                audio_codec="aac",
-                audio_bitrate="192k",
-                ffmpeg_params=["-crf", "18", "-preset", "slow", "-pix_fmt", "yuv420p"]
-            )
+            self.write_video(final_video, output_path)
         finally:
             try:
                 if hasattr(audio_clip, "close"):
@@ -1022,251 +989,45 @@ class PlayerCompare(VideoTemplate):
         new_h = int(h * scale)
         return img.resize((new_w, new_h), PilImage.LANCZOS)
 
-    def generate_vertical_cover(self, title, main_name, compared_name, main_img, compared_img, user):
-        width, height = 1080, 1464
+    def generate_covers(self, title, main_name, compared_name, main_img, compared_img, user):
+        """生成竖版与横版封面，返回 (竖版封面ID, 横版封面ID)"""
+        renderer = CoverRenderer(self.__class__.__name__, self.img_utils)
+        return renderer.render(
+            user, title, [main_name, compared_name], [main_img, compared_img],
+            vertical=lambda: self.draw_vertical_cover(renderer, title, main_name, compared_name, main_img, compared_img),
+            horizontal=lambda: self.draw_horizontal_cover(renderer, main_name, compared_name, main_img, compared_img))
 
-        bg = PilImage.open(os.path.join(self.img_path, "1b6db0a6-91fb-4401-b60e-9ec1c51976dd.png")).resize((width, height))
-        enhancer = ImageEnhance.Brightness(bg)
-        bg = enhancer.enhance(0.2)
+    def draw_vertical_cover(self, renderer, title, main_name, compared_name, main_img, compared_img):
+        width, height = VERTICAL_SIZE
+        bg = renderer.background(VERTICAL_BACKGROUND, VERTICAL_SIZE)
 
-        draw = ImageDraw.Draw(bg)
         font_path = "msyhbd.ttc"
         if not os.path.exists(font_path):
             font_path = "STXINWEI.TTF"
-
-        title_font = ImageFont.truetype(font_path, 90)
-        title_color = (255, 215, 0)
-        stroke_color = (0, 0, 0)
-
-        def draw_text_with_stroke(draw_obj, pos, text, font, fill, stroke_fill, stroke_width=2, align="center"):
-            x, y = pos
-            for dx in range(-stroke_width, stroke_width):
-                for dy in range(-stroke_width, stroke_width):
-                    if dx != 0 or dy != 0:
-                        draw_obj.text((x + dx, y + dy), text, font=font, fill=stroke_fill, align=align)
-            draw_obj.text((x, y), text, font=font, fill=fill, align=align)
+        title_font = FontRegistry.get(font_path, 90)
 
         # 绘制标题
+        draw = ImageDraw.Draw(bg)
         title_bbox = draw.textbbox((0, 0), title, font=title_font)
-        title_w = title_bbox[2] - title_bbox[0]
-        title_x = (width - title_w) // 2
-        title_y = 200
-        draw_text_with_stroke(draw, (title_x, title_y), title, title_font, title_color, stroke_color, 3)
+        title_x = (width - (title_bbox[2] - title_bbox[0])) // 2
+        draw_stroke_text(draw, (title_x, 200), title, title_font, TITLE_COLOR)
 
         target_width = width // 2
         max_height = height // 2
 
-        main_body = PilImage.open(main_img).convert("RGBA")
-        main_body = self.limit_body_height(main_body, target_width, max_height)
-
-        compared_body = PilImage.open(compared_img).convert("RGBA")
-        compared_body = self.limit_body_height(compared_body, target_width, max_height)
+        main_body = self.limit_body_height(renderer.layer(main_img), target_width, max_height)
+        compared_body = self.limit_body_height(renderer.layer(compared_img), target_width, max_height)
 
         # === 人物水平居中分列 + 垂直居中对齐 ===
         bg_center_y = height // 2
-        main_y = bg_center_y - main_body.height // 2
-        compared_y = bg_center_y - compared_body.height // 2
-
-        bg.paste(main_body, (0, main_y), main_body)
-        bg.paste(compared_body, (target_width, compared_y), compared_body)
-
-        # === 文字和字体 ===
-
-        compare_title_font = ImageFont.truetype("msyhbd.ttc", 80)
-        vs_font = ImageFont.truetype("ARLRDBD.TTF", 80)
-
-        compare_title_color = (255, 215, 0)  # 金色
-        stroke_color = (0, 0, 0)
-        vs_color = (255, 255, 255)  # 白色
-
-        # === 计算文字大小 ===
-        dummy_draw = ImageDraw.Draw(bg)
-
-        def split_name(name):
-            if '·' in name:
-                return name.split('·')
-            else:
-                return [name]
-
-        main_lines = split_name(main_name)
-        compared_lines = split_name(compared_name)
-
-        # === 计算姓名文本高度（考虑左右不同行数，保持居中） ===
-        line_height = compare_title_font.getbbox("测试")[3] - compare_title_font.getbbox("测试")[1]
-        line_spacing = 20
-        main_total_height = len(main_lines) * line_height + max(len(main_lines) - 1, 0) * line_spacing
-        compared_total_height = len(compared_lines) * line_height + max(len(compared_lines) - 1, 0) * line_spacing
-        total_name_height = max(main_total_height, compared_total_height)
-
-        # === VS文字（改为竖线） ===
-        vs_text = "|"
-        vs_bbox = dummy_draw.textbbox((0, 0), vs_text, font=vs_font)
-        vs_w = vs_bbox[2] - vs_bbox[0]
-        vs_h = vs_bbox[3] - vs_bbox[1]
-
-        # === 计算左右两边姓名位置 ===
-        left_block_center_x = width // 2 - vs_w // 2 - 20
-        right_block_center_x = width // 2 + vs_w // 2 + 20
-        text_base_y = height // 2 - 150  # 稍微靠下放（原贴纸区）
-
-        draw = ImageDraw.Draw(bg)
-
-        # 左右姓名垂直居中对齐
-        main_start_y = text_base_y + (total_name_height - main_total_height) // 2
-        compared_start_y = text_base_y + (total_name_height - compared_total_height) // 2
-
-        for i, line in enumerate(main_lines):
-            lw, _ = draw.textbbox((0, 0), line, font=compare_title_font)[2:]
-            x = left_block_center_x - lw
-            y = main_start_y + i * (line_height + line_spacing)
-            draw_text_with_stroke(draw, (x, y), line, compare_title_font, compare_title_color, stroke_color, 3)
-
-        for i, line in enumerate(compared_lines):
-            x = right_block_center_x
-            y = compared_start_y + i * (line_height + line_spacing)
-            draw_text_with_stroke(draw, (x, y), line, compare_title_font, compare_title_color, stroke_color, 3)
-
-        # 绘制分隔竖线
-        vs_x = (width - vs_w) // 2
-        vs_y = text_base_y + (total_name_height - vs_h) // 2 - 10
-        draw_text_with_stroke(draw, (vs_x, vs_y), vs_text, vs_font, vs_color, stroke_color, 3)
-
-        image_id = uuid.uuid4()
-        image_name = f'{image_id}.png'
-        bg.save(os.path.join(IMG_PATH, image_name))
-        cover_size = os.path.getsize(os.path.join(IMG_PATH, image_name))
-        spec = {
-            'format': 'png',
-            'mode': 'RGBA',
-            'size': cover_size
-        }
+        bg.paste(main_body, (0, bg_center_y - main_body.height // 2), main_body)
+        bg.paste(compared_body, (target_width, bg_center_y - compared_body.height // 2), compared_body)
 
-        Image(
-            id=image_id,
-            img_name=image_name,
-            category='normal',
-            img_path=IMG_PATH,
-            width=1200,
-            height=1600,
-            creator=user,
-            spec=spec
-        ).save()
-
-        return image_id
-
-    def generate_horizontal_cover(self, main_name, compared_name, main_img, compared_img, user):
-        width, height = 1920, 1080
-
-        bg = PilImage.open(os.path.join(self.img_path, "6b24e082-f935-4664-8bd4-4c9e228d44e8.png")).resize((width, height))
-        enhancer = ImageEnhance.Brightness(bg)
-        bg = enhancer.enhance(0.2)
-
-        target_height = height - 100
-
-        main_body = PilImage.open(main_img).convert("RGBA")
-        w, h = main_body.size
-        new_w = int(w * target_height / h)
-        main_body = main_body.resize((new_w, target_height), PilImage.LANCZOS)
-        main_x = width // 4 - new_w // 2 + 30
-
-        compared_body = PilImage.open(compared_img).convert("RGBA")
-        w, h = compared_body.size
-        new_w = int(w * target_height / h)
-        compared_body = compared_body.resize((new_w, target_height), PilImage.LANCZOS)
-        compared_x = width * 3 // 4 - new_w // 2 - 30
-
-        bg.paste(main_body, (main_x, 50), main_body)
-        bg.paste(compared_body, (compared_x, 50), compared_body)
-
-        # === 绘制文字函数（带描边） ===
-        def draw_text_with_stroke(draw_obj, pos, text, font, fill, stroke_fill, stroke_width=2, align="center"):
-            x, y = pos
-            for dx in range(-stroke_width, stroke_width):
-                for dy in range(-stroke_width, stroke_width):
-                    if dx != 0 or dy != 0:
-                        draw_obj.text((x + dx, y + dy), text, font=font, fill=stroke_fill, align=align)
-            draw_obj.text((x, y), text, font=font, fill=fill, align=align)
-
-        # === 文字和字体 ===
-
-        compare_title_font = ImageFont.truetype("msyhbd.ttc", 120)
-        vs_font = ImageFont.truetype("ARLRDBD.TTF", 120)
-
-        compare_title_color = (255, 215, 0)  # 金色
-        stroke_color = (0, 0, 0)
-        vs_color = (255, 255, 255)  # 白色
-
-        # === 计算文字大小 ===
-        dummy_draw = ImageDraw.Draw(bg)
-
-        def split_name(name):
-            if '·' in name:
-                return name.split('·')
-            else:
-                return [name]
-
-        main_lines = split_name(main_name)
-        compared_lines = split_name(compared_name)
-
-        # === 计算姓名文本高度（考虑左右不同行数，保持居中） ===
-        line_height = compare_title_font.getbbox("测试")[3] - compare_title_font.getbbox("测试")[1]
-        line_spacing = 20
-        main_total_height = len(main_lines) * line_height + max(len(main_lines) - 1, 0) * line_spacing
-        compared_total_height = len(compared_lines) * line_height + max(len(compared_lines) - 1, 0) * line_spacing
-        total_name_height = max(main_total_height, compared_total_height)
-
-        # === VS文字（改为竖线） ===
-        vs_text = "|"
-        vs_bbox = dummy_draw.textbbox((0, 0), vs_text, font=vs_font)
-        vs_w = vs_bbox[2] - vs_bbox[0]
-        vs_h = vs_bbox[3] - vs_bbox[1]
-
-        # === 计算左右两边姓名位置 ===
-        left_block_center_x = width // 2 - vs_w // 2 - 20
-        right_block_center_x = width // 2 + vs_w // 2 + 20
-        text_base_y = int(height * (1 - 0.618))
-
-        draw = ImageDraw.Draw(bg)
-
-        # 左右姓名垂直居中对齐
-        main_start_y = text_base_y + (total_name_height - main_total_height) // 2
-        compared_start_y = text_base_y + (total_name_height - compared_total_height) // 2
-
-        for i, line in enumerate(main_lines):
-            lw, _ = draw.textbbox((0, 0), line, font=compare_title_font)[2:]
-            x = left_block_center_x - lw
-            y = main_start_y + i * (line_height + line_spacing)
-            draw_text_with_stroke(draw, (x, y), line, compare_title_font, compare_title_color, stroke_color, 3)
-
-        for i, line in enumerate(compared_lines):
-            x = right_block_center_x
-            y = compared_start_y + i * (line_height + line_spacing)
-            draw_text_with_stroke(draw, (x, y), line, compare_title_font, compare_title_color, stroke_color, 3)
-
-        # 绘制分隔竖线
-        vs_x = (width - vs_w) // 2
-        vs_y = text_base_y + (total_name_height - vs_h) // 2 - 10
-        draw_text_with_stroke(draw, (vs_x, vs_y), vs_text, vs_font, vs_color, stroke_color, 3)
-
-        image_id = uuid.uuid4()
-        image_name = f'{image_id}.png'
-        bg.save(os.path.join(IMG_PATH, image_name))
-        cover_size = os.path.getsize(os.path.join(IMG_PATH, image_name))
-        spec = {
-            'format': 'png',
-            'mode': 'RGBA',
-            'size': cover_size
-        }
+        renderer.draw_names(bg, main_name, compared_name, 80, height // 2 - 150)
+        return bg
 
-        Image(
-            id=image_id,
-            img_name=image_name,
-            category='normal',
-            img_path=IMG_PATH,
-            width=width,
-            height=height,
-            creator=user,
-            spec=spec
-        ).save()
-
-        return image_id
+    def draw_horizontal_cover(self, renderer, main_name, compared_name, main_img, compared_img):
+        bg = renderer.background(HORIZONTAL_BACKGROUND, HORIZONTAL_SIZE)
+        renderer.paste_pair(bg, [main_img, compared_img], 30)
+        renderer.draw_names(bg, main_name, compared_name, 120, int(bg.height * (1 - 0.618)))
+        return bg
@@ -2,28 +2,30 @@ import logging
 import math
 import os
 import re
-import shutil
-import textwrap
 import time
 import traceback
 import uuid
 
-import numpy as np
-from PIL import Image as PilImage, ImageDraw, ImageFont, ImageEnhance
+from PIL import Image as PilImage, ImageDraw, ImageEnhance
 from moviepy import *
-from moviepy.audio.fx import AudioFadeOut
-from pydub import AudioSegment
 
-from astra.settings import VIDEO_PATH, IMG_PATH, TMP_PATH
+from common.audio_utils import NarrationAssembler
+from common.font_utils import FontRegistry
+from common.typewriter_utils import TypewriterEffect
 from image.models import Image
 from video.models import Video
+from video.compositor import DirtyRectCompositeVideoClip
+from video.cover_renderer import CoverRenderer
 from video.video_templates.video_template import VideoTemplate, VideoOrientation
+from voice.bgm_cache import BgmCache
 from voice.models import Sound
 
 logger = logging.getLogger("video")
 
 
 class PlayerList(VideoTemplate):
+    fonts = VideoTemplate.fonts + [('STXINWEI.TTF', 80), ('STXINWEI.TTF', 36), ('STXINWEI.TTF', 38),
+                                   ('msyhbd.ttc', 90), ('msyhbd.ttc', 120)]
 
     def __init__(self):
         super().__init__()
@@ -154,6 +156,18 @@ class PlayerList(VideoTemplate):
         self.video_type = 'Regular'
         self.tmps = None
 
+    def narration_texts(self, parameters):
+        texts = self.text_utils.split_text(parameters.get('start_text', ''))
+        for info in parameters.get('content') or []:
+            texts += self.text_utils.split_text(info['text'])
+        return texts
+
+    def prepare_images(self, parameters):
+        if parameters.get('background'):
+            self.prepare_background(self.resolve_image(parameters['background']))
+        for info in parameters.get('content') or []:
+            self.img_utils.trim_image(self.resolve_image(info['image_path']))
+
     def process(self, user, video_id, parameters):
         """实现带字幕和音频同步的视频生成
 
@@ -165,9 +179,7 @@ class PlayerList(VideoTemplate):
 
         begin = time.time()  # 记录开始时间
 
-        self.tmps = os.path.join(TMP_PATH, video_id)
-        if not os.path.exists(self.tmps):
-            os.mkdir(self.tmps)
+        self.tmps = self.open_workspace(video_id, parameters)
         logger.info(f"视频生成请求参数：{parameters}")
         project_name = parameters.get('title')
         param_id = self.save_parameters(self.template_id, user, project_name, parameters)
@@ -181,13 +193,11 @@ class PlayerList(VideoTemplate):
         content = parameters.get('content')
         reader = parameters.get('reader')
 
-        output_path = os.path.join(VIDEO_PATH, f"{video_id}.mp4")
-        Video(creator=user, title=project_name,
-              content=start_text+ "\n\n", video_type=self.video_type,
-              result='Process',
-              process=0.0, id=video_id, param_id=param_id).save()
+        output_path = self.get_output_path(video_id)
+        self.save_video(user, video_id, project_name, start_text+ "\n\n", param_id)
 
         try:
+            self.timer.switch('assets')
             bkg = parameters.get('background')  # 获取背景图片
             if bkg:
                 bkg_img = Image.objects.get(id=bkg)
@@ -198,14 +208,14 @@ class PlayerList(VideoTemplate):
                 bg_img_path = os.path.join(self.tmps, "tmp_bg.png")
                 # 保存图片
                 image.save(bg_img_path)
-            subtitlers = []
+            subtitles = self.subtitler.track((self.width, self.height))
             # 从0.5秒开始有声音,start用来记录视频开头部分时长
             start = 0.5
-            final_audio = AudioSegment.silent(duration=0)
+            narration = NarrationAssembler()
             # 处理开场的音频和字幕
             start_segments = self.text_utils.split_text(start_text)
-            for i, sg in enumerate(start_segments):
-                tts = self.speech.chat_tts(sg, reader, user, video_id)
+            start_ttses = self.tts_many(start_segments, reader, user, video_id)
+            for i, (sg, tts) in enumerate(zip(start_segments, start_ttses)):
                 tts_path = os.path.join(self.tts_path, f'{tts.id}.{tts.format}')
                 if not os.path.isfile(tts_path):
                     fallback_exts = ['mp3', 'wav'] if tts.format != 'mp3' else ['wav']
@@ -214,32 +224,15 @@ class PlayerList(VideoTemplate):
                         if os.path.isfile(alt):
                             tts_path = alt
                             break
-                try:
-                    try:
-                        audio = AudioSegment.from_file(tts_path).fade_in(200).fade_out(200)
-                    except Exception:
-                        # 读取失败时，尝试按mp3或wav显式解码
-                        try:
-                            audio = AudioSegment.from_file(tts_path, format='mp3').fade_in(200).fade_out(200)
-                        except Exception:
-                            audio = AudioSegment.from_file(tts_path, format='wav').fade_in(200).fade_out(200)
-                except Exception:
-                    # 读取失败时，尝试按mp3或wav显式解码
-                    try:
-                        audio = AudioSegment.from_file(tts_path, format='mp3').fade_in(200).fade_out(200)
-                    except Exception:
-                        audio = AudioSegment.from_file(tts_path, format='wav').fade_in(200).fade_out(200)
-                for text_clip in self.subtitler.text_clip(sg, start, tts.duration, 780, self.width):
-                    subtitlers.append(text_clip)
+                subtitles.add(sg, start, tts.duration, 780, self.width)
+                narration.add_speech(tts_path, tts.duration)
                 if i == 0:
-                    final_audio = audio
                     start += tts.duration
                 else:
-                    final_audio = final_audio.append(audio, crossfade=200)
                     start += tts.duration - 0.2
 
             # 开场和主体内容切换前插入0.5秒静默等待
-            final_audio = final_audio.append(AudioSegment.silent(duration=500))
+            narration.add_silence(500)
             start += 0.5
 
             card_paths = []
@@ -249,13 +242,15 @@ class PlayerList(VideoTemplate):
             original_paths = []
             content_subtitler_start = start
 
-            for info in content:
-                content_duration = 0
-                text = info['text']
+            # 所有正文分段一次性并发合成，再按顺序回填到各段内容
+            content_segments = [self.text_utils.split_text(info['text']) for info in content]
+            content_ttses = iter(self.tts_many(
+                [sg for segments in content_segments for sg in segments], reader, user, video_id))
 
-                segments = self.text_utils.split_text(text)
-                for i, sg in enumerate(segments):
-                    tts = self.speech.chat_tts(sg, reader, user, video_id)
+            for info, segments in zip(content, content_segments):
+                content_duration = 0
+                for sg in segments:
+                    tts = next(content_ttses)
                     # 同样增加回退逻辑，避免扩展不一致导致解码失败
                     tts_path = os.path.join(self.tts_path, f'{tts.id}.{tts.format}')
                     if not os.path.isfile(tts_path):
@@ -266,15 +261,13 @@ class PlayerList(VideoTemplate):
                                 tts_path = alt
                                 break
 
-                    for text_clip in self.subtitler.text_clip(sg, content_subtitler_start, tts.duration, 780, self.width):
-                        subtitlers.append(text_clip)
-                    audio = AudioSegment.from_file(tts_path).fade_in(200).fade_out(200)
-                    final_audio = final_audio.append(audio, crossfade=200)
+                    subtitles.add(sg, content_subtitler_start, tts.duration, 780, self.width)
+                    narration.add_speech(tts_path, tts.duration)
                     content_duration += tts.duration - 0.2
                     content_subtitler_start += tts.duration - 0.2
 
                 # 每段内容结束增加0.5秒静默切换等待
-                final_audio = final_audio.append(AudioSegment.silent(duration=500))
+                narration.add_silence(500)
                 content_duration += 0.5
                 content_subtitler_start += 0.5
 
@@ -287,14 +280,12 @@ class PlayerList(VideoTemplate):
                 # 收集原始图片路径，以便开场展示
                 original_paths.append(card_img)
                 card_paths.append(self.build_player_card(card_img, info['chinese_name'], info['key_note'], info['stats'], info['accuracy']))
-            audio_path = os.path.join(self.tmps, "merged_tts.mp3")
-            final_audio.export(audio_path, format="mp3")
-
-            cover_id = self.generate_vertical_cover(project_name, original_paths[-1], user)
-            Video.objects.filter(id=video_id).update(vertical_cover=cover_id)
 
-            horizontal_cover_id = self.generate_horizontal_cover(project_name, original_paths[-2:], user)
-            Video.objects.filter(id=video_id).update(cover=horizontal_cover_id)
+            with self.timer.stage('cover'):
+                cover_id, horizontal_cover_id = self.resumable('cover', lambda: self.generate_covers(
+                    project_name, original_paths[-1], original_paths[-2:], user), valid=self.images_exist)
+            Video.objects.filter(id=video_id).update(vertical_cover=cover_id, cover=horizontal_cover_id)
+            self.timer.switch('compose')
 
             if start < 3:
                 start = 3
@@ -305,7 +296,6 @@ class PlayerList(VideoTemplate):
 
             font_path = "STXINWEI.TTF"
             font_size = 80
-            font = ImageFont.truetype(font_path, font_size)
 
             # ---------- 开场：五张原图顺序入场并停留 ----------
             # 固定五个位置的x坐标：0, 384, 768, 1152, 1536（视频宽度1920，间隔384）
@@ -426,33 +416,22 @@ class PlayerList(VideoTemplate):
             # ---------- 阶段2：用两秒打出标题 ----------
             duration_typing = 2
 
-            def make_frame(t):
-                num_chars = int((t / duration_typing) * len(project_name))
-                txt = project_name[:num_chars]
-                img = PilImage.new("RGBA", (self.width, self.height), (0, 0, 0, 0))
-                draw = ImageDraw.Draw(img)
+            # 白色描边、金色填充，每个前缀只绘制一次
+            typewriter = TypewriterEffect(project_name, font_path, font_size, fill=(255, 215, 0, 255),
+                                          stroke_fill=(255, 255, 255, 255), stroke_width=1)
+
+            def typing_state(t):
+                return int((t / duration_typing) * len(project_name)), 1.0, 1
+
+            def typing_anchor(txt, font, draw):
                 text_w, text_h = draw.textbbox((0, 0), txt, font=font)[2:]
-                x = (self.width - text_w) // 2
-                y = (self.height - text_h) // 2
-
-                # 描边
-                stroke_width = 1
-                stroke_color = (255, 255, 255, 255)  # 白色描边
-                fill_color = (255, 215, 0, 255)  # 金色填充
-                for dx in range(-stroke_width, stroke_width + 1):
-                    for dy in range(-stroke_width, stroke_width + 1):
-                        if dx != 0 or dy != 0:
-                            draw.text((x + dx, y + dy), txt, font=font, fill=stroke_color)
-                draw.text((x, y), txt, font=font, fill=fill_color)
-
-                return np.array(img)
-
-            typing_clip = VideoClip(make_frame, duration=duration_typing)
+                return (self.width - text_w) // 2, (self.height - text_h) // 2
+
+            typing_clip = typewriter.make_clip(typing_state, typing_anchor, duration_typing)
             clips.append(typing_clip)
 
             # ---------- 阶段3：标题上移到顶部 ----------
-            font_test = ImageFont.truetype(font_path, font_size)
-            text_w, text_h = ImageDraw.Draw(PilImage.new("RGB", (1, 1))).textbbox((0, 0), project_name, font=font_test)[2:]
+            text_w, text_h = ImageDraw.Draw(PilImage.new("RGB", (1, 1))).textbbox((0, 0), project_name, font=typewriter.font())[2:]
             target_y = (120 - text_h) // 2  # 目标顶部位置
 
             title_clip = TextClip(
@@ -501,41 +480,28 @@ class PlayerList(VideoTemplate):
 
             bg_clip = ImageClip(bg_img_path).with_duration(total_durations)
 
-            final_video = CompositeVideoClip([
+            final_video = DirtyRectCompositeVideoClip([
                 bg_clip,
                 *clips,
-                *subtitlers
+                *subtitles.clips()
             ], size=(self.width, self.height)).with_duration(content_subtitler_start + 1)
-            audio_clip = AudioFileClip(audio_path).with_start(0.5)
-            bg_music = AudioFileClip(bgm_path).with_volume_scaled(0.1)
-
-            if bg_music.duration < audio_clip.duration:
-                loops = int(audio_clip.duration // bg_music.duration) + 1
-                layered = [bg_music.with_start(i * bg_music.duration) for i in range(loops)]
-                bg_music = CompositeAudioClip(layered)
-            bg_music = bg_music.with_duration(audio_clip.duration)
-            bg_music = bg_music.with_effects([AudioFadeOut(1)])
+            audio_clip = self.narration_clip(narration).with_start(0.5)
+            # 背景音乐底轨已预先循环拼接并调好音量，按音乐与时长档位缓存
+            bg_music = BgmCache().bed(bgm_sound.id, bgm_path, audio_clip.duration, volume=0.1, fade=1)
 
             final_audio_layers = [bg_music, audio_clip]
             final_audio = CompositeAudioClip(final_audio_layers)
 
             final_video = final_video.with_audio(final_audio)
 
-            # 输出（提高清晰度：H.264 + CRF18 + 30fps）
-            final_video.write_videofile(
-                output_path,
-                fps=30,
-                codec="libx264",
-                audio_codec="aac",
-                audio_bitrate="192k",
-                ffmpeg_params=["-crf", "18", "-preset", "slow", "-pix_fmt", "yuv420p"]
-            )
+            # 输出（编码参数由渲染配置决定）
+            self.write_video(final_video, output_path)
 
             video_size = 0
             if os.path.exists(output_path):
                 video_size = os.path.getsize(output_path)
 
-            Video.objects.filter(id=video_id).update(result='Success', process=1.0, video_path=f"/media/videos/{video_id}.mp4",
+            Video.objects.filter(id=video_id).update(result='Success', process=1.0, video_path=self.get_video_url(video_id),
                                                      cost=time.time() - begin, size=video_size)
 
         except Exception as e:
@@ -545,10 +511,6 @@ class PlayerList(VideoTemplate):
                 os.remove(output_path)
             raise e
 
-        finally:
-            if os.path.exists(self.tmps):
-                shutil.rmtree(self.tmps)
-
     def draw_text_with_outline(self, draw, pos, text, font, fill, outline_color=(0, 0, 0, 255), outline_width=1):
         x, y = pos
         for dx in range(-outline_width, outline_width + 1):
@@ -582,9 +544,9 @@ class PlayerList(VideoTemplate):
         card.alpha_composite(img, (x, y))
 
         # 字体按高度比例缩放
-        font_name = ImageFont.truetype("STXINWEI.TTF", 36)
-        font_key_note = ImageFont.truetype("STXINWEI.TTF", 38)
-        font_stats = ImageFont.truetype("STXINWEI.TTF", 36)
+        font_name = FontRegistry.get("STXINWEI.TTF", 36)
+        font_key_note = FontRegistry.get("STXINWEI.TTF", 38)
+        font_stats = FontRegistry.get("STXINWEI.TTF", 36)
 
         stats_items = [s for s in re.split(r"\s+", str(stats).strip()) if s]
         if stats_items:
@@ -631,174 +593,25 @@ class PlayerList(VideoTemplate):
         return tmp_path
 
     def prepare_background(self, bg_path, target_size=None, brightness_factor=0.3):
+        """缩放并压暗背景图，返回缓存中的图片路径"""
         if target_size is None:
             target_size = (self.width, self.height)
-        img = PilImage.open(bg_path).convert("RGBA")
-        img = img.resize(target_size, PilImage.LANCZOS)
-        enhancer = ImageEnhance.Brightness(img)
-        img = enhancer.enhance(brightness_factor)
-        tmp_bg_path = os.path.join(self.tmps, "tmp_bg.png")
-        img.save(tmp_bg_path)
-        return tmp_bg_path
-
-    def ease_in_out(self, t):
-        return 3 * t ** 2 - 2 * t ** 3
-
-    def generate_vertical_cover(self, title, img_path, user):
-        cover_width, cover_height = 1080, 1464
-        title_color = (255, 215, 0)  # 金色
-        stroke_color = (0, 0, 0)  # 黑色描边
-
-        # 创建白色背景
-        cover = PilImage.open(os.path.join(self.img_path, "1b6db0a6-91fb-4401-b60e-9ec1c51976dd.png")).resize((cover_width, cover_height))
-        enhancer = ImageEnhance.Brightness(cover)
-        cover = enhancer.enhance(0.2)
-
-        # 打开原图并裁剪
-        img = self.img_utils.trim_image(img_path)
-
-        # 图片放大2倍
-        new_w, new_h = img.size[0] * 2, img.size[1] * 2
-        img = img.resize((new_w, new_h), PilImage.LANCZOS)
-
-        # 贴在背景正中间
-        img_x = (cover_width - new_w) // 2
-        img_y = (cover_height - new_h) // 2
-        cover.paste(img, (img_x, img_y), img)
-
-        # 绘制标题文字
-        draw = ImageDraw.Draw(cover)
 
-        font = ImageFont.truetype("msyhbd.ttc", 90)
+        def build(path):
+            img = PilImage.open(path).convert("RGBA")
+            img = img.resize(target_size, PilImage.LANCZOS)
+            enhancer = ImageEnhance.Brightness(img)
+            return enhancer.enhance(brightness_factor)
 
-        def split_title(title: str, width: int = 12):
-            result = []
-            # 先按中文/英文逗号切割
-            parts = title.replace("，", ",").split(",")
+        return self.img_utils.cache.derive(bg_path, 'prepare_background',
+                                           {'size': list(target_size), 'brightness': brightness_factor}, build)
 
-            for part in parts:
-                part = part.strip()
-                if not part:
-                    continue
-                # 再按宽度切割
-                wrapped = textwrap.wrap(part, width=width)
-                result.extend(wrapped)
-
-            return result
-
-        # 自动换行（每行约12字）
-        lines = split_title(title, width=12)
-        line_height = font.getbbox("A")[3] - font.getbbox("A")[1] + 30
-
-        # 标题位置（整体上移，靠图片下方偏中位置）
-        text_y = cover_height // 2 - 150
-
-        # 绘制每一行文字（居中 + 描边）
-        for line in lines:
-            bbox = draw.textbbox((0, 0), line, font=font)
-            text_w = bbox[2] - bbox[0]
-            text_x = (cover_width - text_w) // 2
-
-            # 先描边（多次偏移）
-            draw.text((text_x, text_y), line, font=font,
-                      fill=title_color, stroke_width=3, stroke_fill=stroke_color)
-            text_y += line_height
-
-        # 保存封面图片
-        image_id = uuid.uuid4()
-        image_name = f"{image_id}.png"
-        cover.save(os.path.join(IMG_PATH, image_name))
-        cover_size = os.path.getsize(os.path.join(IMG_PATH, image_name))
-        spec = {
-            'format': 'png',
-            'mode': 'RGBA',
-            'size': cover_size
-        }
-
-        Image(
-            id=image_id,
-            img_name=image_name,
-            category='normal',
-            img_path=IMG_PATH,
-            width=cover_width,
-            height=cover_height,
-            creator=user,
-            spec=spec
-        ).save()
-
-        return image_id
-
-    def generate_horizontal_cover(self, title, img_path, user):
-        width, height = 1920, 1080
-
-        bg = PilImage.open(os.path.join(self.img_path, "6b24e082-f935-4664-8bd4-4c9e228d44e8.png")).resize((width, height))
-        enhancer = ImageEnhance.Brightness(bg)
-        bg = enhancer.enhance(0.2)
-
-        target_height = height - 100
-
-        main_img = img_path[0]
-        main_body = self.img_utils.trim_image(main_img)
-        w, h = main_body.size
-        new_w = int(w * target_height / h)
-        main_body = main_body.resize((new_w, target_height), PilImage.LANCZOS)
-        main_x = width // 4 - new_w // 2 + 20
-
-        compared_img = img_path[1]
-        compared_body = self.img_utils.trim_image(compared_img)
-        w, h = compared_body.size
-        new_w = int(w * target_height / h)
-        compared_body = compared_body.resize((new_w, target_height), PilImage.LANCZOS)
-        compared_x = width * 3 // 4 - new_w // 2 - 20
-
-        bg.paste(main_body, (main_x, 50), main_body)
-        bg.paste(compared_body, (compared_x, 50), compared_body)
-
-        draw = ImageDraw.Draw(bg)
-        font = ImageFont.truetype("msyhbd.ttc", 120)
-        title_color = (255, 215, 0)
-        stroke_color = (0, 0, 0)
-
-        def split_title(title: str, width: int = 14):
-            result = []
-            parts = title.replace("，", ",").split(",")
-            for part in parts:
-                part = part.strip()
-                if not part:
-                    continue
-                wrapped = textwrap.wrap(part, width=width)
-                result.extend(wrapped)
-            return result
-
-        lines = split_title(title, width=12)
-        line_height = font.getbbox("A")[3] - font.getbbox("A")[1] + 30
-        text_y = int(height * (1 - 0.618))
-        for line in lines:
-            bbox = draw.textbbox((0, 0), line, font=font)
-            text_w = bbox[2] - bbox[0]
-            text_x = (width - text_w) // 2
-            draw.text((text_x, text_y), line, font=font, fill=title_color, stroke_width=3, stroke_fill=stroke_color)
-            text_y += line_height
-
-        image_id = uuid.uuid4()
-        image_name = f'{image_id}.png'
-        bg.save(os.path.join(IMG_PATH, image_name))
-        cover_size = os.path.getsize(os.path.join(IMG_PATH, image_name))
-        spec = {
-            'format': 'png',
-            'mode': 'RGBA',
-            'size': cover_size
-        }
+    def ease_in_out(self, t):
+        return 3 * t ** 2 - 2 * t ** 3
 
-        Image(
-            id=image_id,
-            img_name=image_name,
-            category='normal',
-            img_path=IMG_PATH,
-            width=width,
-            height=height,
-            creator=user,
-            spec=spec
-        ).save()
-
-        return image_id
+    def generate_covers(self, title, vertical_img, horizontal_imgs, user):
+        """生成竖版与横版封面，返回 (竖版封面ID, 横版封面ID)"""
+        renderer = CoverRenderer(self.__class__.__name__, self.img_utils)
+        return renderer.render(user, title, [], [vertical_img, *horizontal_imgs],
+                               vertical=lambda: renderer.single_vertical(title, vertical_img),
+                               horizontal=lambda: renderer.pair_horizontal(title, horizontal_imgs, 20))
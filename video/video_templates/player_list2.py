@@ -1,22 +1,22 @@
 import logging
 import os
-import shutil
-import textwrap
 import time
 import traceback
 import uuid
 
 import numpy as np
-from PIL import Image as PilImage, ImageDraw, ImageFont, ImageEnhance
+from PIL import Image as PilImage, ImageDraw, ImageEnhance
 from moviepy import *
-from moviepy.audio.fx import AudioFadeOut
 from moviepy.video.fx import Resize as vfx_resize
-from pydub import AudioSegment
 
-from astra.settings import VIDEO_PATH, IMG_PATH, TMP_PATH
+from common.audio_utils import NarrationAssembler
+from common.font_utils import FontRegistry
 from image.models import Image
 from video.models import Video
+from video.compositor import DirtyRectCompositeVideoClip
+from video.cover_renderer import CoverRenderer
 from video.video_templates.video_template import VideoTemplate, VideoOrientation
+from voice.bgm_cache import BgmCache
 from voice.models import Sound
 
 import os
@@ -32,6 +32,7 @@ app.prepare(ctx_id=0)
 
 class PlayerList2(VideoTemplate):
     """竖版：球员列表视频模板（重新设计开场与卡片，单人逐段展示）"""
+    fonts = VideoTemplate.fonts + [('STXINWEI.TTF', 36), ('STXINWEI.TTF', 48), ('msyhbd.ttc', 90), ('msyhbd.ttc', 120)]
 
     def __init__(self):
         super().__init__()
@@ -168,6 +169,19 @@ class PlayerList2(VideoTemplate):
         self.video_type = 'Regular'
         self.tmps = None
 
+    def narration_texts(self, parameters):
+        texts = self.text_utils.split_text(parameters.get('start_text', ''))
+        for info in parameters.get('content') or []:
+            texts += self.text_utils.split_text(info.get('text', ''))
+        return texts
+
+    def prepare_images(self, parameters):
+        if parameters.get('background'):
+            self.prepare_background(self.resolve_image(parameters['background']),
+                                    target_size=(self.width, self.height), brightness_factor=0.1)
+        for info in parameters.get('content') or []:
+            self.img_utils.trim_image(self.resolve_image(info.get('image_path')))
+
     def process(self, user, video_id, parameters):
         """竖版实现：自定义开场、单卡片逐段展示，不与横版并行展示。
         Args:
@@ -176,9 +190,7 @@ class PlayerList2(VideoTemplate):
             parameters: 参数集合
         """
         begin = time.time()
-        self.tmps = os.path.join(TMP_PATH, video_id)
-        if not os.path.exists(self.tmps):
-            os.mkdir(self.tmps)
+        self.tmps = self.open_workspace(video_id, parameters)
         logger.info(f"竖版视频生成参数：{parameters}")
 
         project_name = parameters.get('title')
@@ -192,11 +204,11 @@ class PlayerList2(VideoTemplate):
         content = parameters.get('content') or []
         reader = parameters.get('reader')
 
-        output_path = os.path.join(VIDEO_PATH, f"{video_id}.mp4")
-        Video(creator=user, title=project_name, content=start_text + "\n\n", video_type=self.video_type,
-              result='Process', process=0.0, id=video_id, param_id=param_id).save()
+        output_path = self.get_output_path(video_id)
+        self.save_video(user, video_id, project_name, start_text + "\n\n", param_id)
 
         try:
+            self.timer.switch('assets')
             # 背景
             bkg = parameters.get('background')
             if bkg:
@@ -208,14 +220,14 @@ class PlayerList2(VideoTemplate):
                 bg_img_path = os.path.join(self.tmps, "tmp_bg.png")
                 image.save(bg_img_path)
 
-            subtitlers = []
+            subtitles = self.subtitler.track((self.width, self.height))
             start = 0.5
-            final_audio = AudioSegment.silent(duration=0)
+            narration = NarrationAssembler()
 
             # 开场语音与字幕
             start_segments = self.text_utils.split_text(start_text)
             for i, sg in enumerate(start_segments):
-                tts = self.speech.chat_tts(sg, reader, user, video_id)
+                tts = self.tts(sg, reader, user, video_id)
                 tts_path = os.path.join(self.tts_path, f'{tts.id}.{tts.format}')
                 if not os.path.isfile(tts_path):
                     fallback_exts = ['mp3', 'wav'] if tts.format != 'mp3' else ['wav']
@@ -224,29 +236,14 @@ class PlayerList2(VideoTemplate):
                         if os.path.isfile(alt):
                             tts_path = alt
                             break
-                try:
-                    try:
-                        audio = AudioSegment.from_file(tts_path).fade_in(200).fade_out(200)
-                    except Exception:
-                        try:
-                            audio = AudioSegment.from_file(tts_path, format='mp3').fade_in(200).fade_out(200)
-                        except Exception:
-                            audio = AudioSegment.from_file(tts_path, format='wav').fade_in(200).fade_out(200)
-                except Exception:
-                    try:
-                        audio = AudioSegment.from_file(tts_path, format='mp3').fade_in(200).fade_out(200)
-                    except Exception:
-                        audio = AudioSegment.from_file(tts_path, format='wav').fade_in(200).fade_out(200)
-                for text_clip in self.subtitler.text_clip(sg, start, tts.duration, 1350, self.width):
-                    subtitlers.append(text_clip)
+                subtitles.add(sg, start, tts.duration, 1350, self.width)
+                narration.add_speech(tts_path, tts.duration)
                 if i == 0:
-                    final_audio = audio
                     start += tts.duration
                 else:
-                    final_audio = final_audio.append(audio, crossfade=200)
                     start += tts.duration - 0.2
 
-            final_audio = final_audio.append(AudioSegment.silent(duration=500))
+            narration.add_silence(500)
             start += 0.5
 
             content_subtitler_start = start
@@ -261,7 +258,7 @@ class PlayerList2(VideoTemplate):
                 text = info.get('text', '')
                 segments = self.text_utils.split_text(text)
                 for i, sg in enumerate(segments):
-                    tts = self.speech.chat_tts(sg, reader, user, video_id)
+                    tts = self.tts(sg, reader, user, video_id)
                     tts_path = os.path.join(self.tts_path, f'{tts.id}.{tts.format}')
                     if not os.path.isfile(tts_path):
                         fallback_exts = ['mp3', 'wav'] if tts.format != 'mp3' else ['wav']
@@ -271,14 +268,12 @@ class PlayerList2(VideoTemplate):
                                 tts_path = alt
                                 break
 
-                    for text_clip in self.subtitler.text_clip(sg, content_subtitler_start, tts.duration, 1350, self.width):
-                        subtitlers.append(text_clip)
+                    subtitles.add(sg, content_subtitler_start, tts.duration, 1350, self.width)
 
-                    audio = AudioSegment.from_file(tts_path).fade_in(200).fade_out(200)
-                    final_audio = final_audio.append(audio, crossfade=200)
+                    narration.add_speech(tts_path, tts.duration)
                     content_duration += tts.duration - 0.2
                     content_subtitler_start += tts.duration - 0.2
-                final_audio = final_audio.append(AudioSegment.silent(duration=500))
+                narration.add_silence(500)
                 content_duration += 0.5
                 content_subtitler_start += 0.5
                 content_durations.append(content_duration)
@@ -315,21 +310,19 @@ class PlayerList2(VideoTemplate):
                     'accuracy': info.get('accuracy', '')
                 })
 
-            audio_path = os.path.join(self.tmps, "merged_tts.mp3")
-            final_audio.export(audio_path, format="mp3")
             clips = []
             if original_paths:
-                cover_id = self.generate_vertical_cover(project_name, original_paths[0], user)
-                Video.objects.filter(id=video_id).update(vertical_cover=cover_id)
+                with self.timer.stage('cover'):
+                    cover_id, horizontal_cover_id = self.resumable('cover', lambda: self.generate_covers(
+                        project_name, original_paths[0], original_paths[:2], user), valid=self.images_exist)
+                Video.objects.filter(id=video_id).update(vertical_cover=cover_id, cover=horizontal_cover_id)
                 _cover = Image.objects.get(id=cover_id)
                 cover_img_path = os.path.join(self.img_path, _cover.img_name)
                 cover_img = PilImage.open(cover_img_path).convert("RGBA")
                 cover_clip = ImageClip(np.array(cover_img)).with_position(("center", "center")).with_duration(0.1)
                 clips.append(cover_clip)
-            if original_paths:
-                horizontal_cover_id = self.generate_horizontal_cover(project_name, original_paths[:2], user)
-                Video.objects.filter(id=video_id).update(cover=horizontal_cover_id)
 
+            self.timer.switch('compose')
             if start < 2:
                 start = 2
 
@@ -337,7 +330,7 @@ class PlayerList2(VideoTemplate):
 
             font_path = "STXINWEI.TTF"
             font_size = 64
-            font = ImageFont.truetype(font_path, font_size)
+            font = FontRegistry.get(font_path, font_size)
 
             # 打字标题
             duration_typing = 2
@@ -436,7 +429,7 @@ class PlayerList2(VideoTemplate):
                 # 球员姓名打字效果（持续1秒），位置 (100, 300)，图层在内容图片之下
                 player_name = panel_infos[i].get('name', '')
                 duration_typing_name = 1
-                font_name = ImageFont.truetype("STXINWEI.TTF", 48)
+                font_name = FontRegistry.get("STXINWEI.TTF", 48)
                 stroke_width = 1
                 stroke_color = (0, 0, 0, 0)
                 fill_color = (255, 255, 255, 255)
@@ -508,23 +501,16 @@ class PlayerList2(VideoTemplate):
 
             bg_clip = ImageClip(bg_img_path).with_duration(total_durations)
 
-            final_video = CompositeVideoClip([
+            final_video = DirtyRectCompositeVideoClip([
                 bg_clip,
                 *clips,
                 *start_clips,
-                *subtitlers
+                *subtitles.clips()
             ], size=(self.width, self.height)).with_duration(content_subtitler_start + 1)
 
-            audio_clip = AudioFileClip(audio_path).with_start(0.5)
-            bg_music = AudioFileClip(bgm_path).with_volume_scaled(0.1)
-
-            if bg_music.duration < audio_clip.duration:
-                loops = int(audio_clip.duration // bg_music.duration) + 1
-                layered = [bg_music.with_start(i * bg_music.duration) for i in range(loops)]
-                bg_music = CompositeAudioClip(layered)
-
-            bg_music = bg_music.with_duration(audio_clip.duration)
-            bg_music = bg_music.with_effects([AudioFadeOut(1)])
+            audio_clip = self.narration_clip(narration).with_start(0.5)
+            # 背景音乐底轨已预先循环拼接并调好音量，按音乐与时长档位缓存
+            bg_music = BgmCache().bed(bgm_sound.id, bgm_path, audio_clip.duration, volume=0.1, fade=1)
 
             final_audio_layers = [bg_music, audio_clip]
             final_audio_clip = CompositeAudioClip(final_audio_layers)
@@ -532,12 +518,7 @@ class PlayerList2(VideoTemplate):
             final_video = final_video.with_audio(final_audio_clip)
 
             # 输出
-            final_video.write_videofile(output_path,
-                                        fps=30,
-                                        codec="libx264",
-                                        audio_codec="aac",
-                                        audio_bitrate="192k",
-                                        ffmpeg_params=["-crf", "18", "-preset", "slow", "-pix_fmt", "yuv420p"])
+            self.write_video(final_video, output_path)
 
             video_size = 0
             if os.path.exists(output_path):
@@ -546,7 +527,7 @@ class PlayerList2(VideoTemplate):
             Video.objects.filter(id=video_id).update(
                 result='Success',
                 process=1.0,
-                video_path=f"/media/videos/{video_id}.mp4",
+                video_path=self.get_video_url(video_id),
                 cost=time.time() - begin,
                 size=video_size
             )
@@ -558,10 +539,6 @@ class PlayerList2(VideoTemplate):
                 os.remove(output_path)
             raise e
 
-        finally:
-            if os.path.exists(self.tmps):
-                shutil.rmtree(self.tmps)
-
     def draw_text_with_outline(self, draw, pos, text, font, fill, outline_color=(0, 0, 0, 255), outline_width=1):
         x, y = pos
         for dx in range(-outline_width, outline_width + 1):
@@ -571,15 +548,18 @@ class PlayerList2(VideoTemplate):
         draw.text(pos, text, font=font, fill=fill)
 
     def prepare_background(self, bg_path, target_size=None, brightness_factor=0.2):
+        """缩放并压暗背景图，返回缓存中的图片路径"""
         if target_size is None:
             target_size = (self.width, self.height)
-        img = PilImage.open(bg_path).convert("RGBA")
-        img = img.resize(target_size, PilImage.LANCZOS)
-        enhancer = ImageEnhance.Brightness(img)
-        img = enhancer.enhance(brightness_factor)
-        tmp_bg_path = os.path.join(self.tmps, "tmp_bg.png")
-        img.save(tmp_bg_path)
-        return tmp_bg_path
+
+        def build(path):
+            img = PilImage.open(path).convert("RGBA")
+            img = img.resize(target_size, PilImage.LANCZOS)
+            enhancer = ImageEnhance.Brightness(img)
+            return enhancer.enhance(brightness_factor)
+
+        return self.img_utils.cache.derive(bg_path, 'prepare_background',
+                                           {'size': list(target_size), 'brightness': brightness_factor}, build)
 
     def ease_in_out(self, t):
         return 3 * t ** 2 - 2 * t ** 3
@@ -595,9 +575,9 @@ class PlayerList2(VideoTemplate):
         draw = ImageDraw.Draw(img)
 
         # 文本与字体
-        font_draft = ImageFont.truetype("STXINWEI.TTF", 36)
-        font_key_note = ImageFont.truetype("STXINWEI.TTF", 48)
-        font_stats = ImageFont.truetype("STXINWEI.TTF", 36)
+        font_draft = FontRegistry.get("STXINWEI.TTF", 36)
+        font_key_note = FontRegistry.get("STXINWEI.TTF", 48)
+        font_stats = FontRegistry.get("STXINWEI.TTF", 36)
 
         # 数据
         draft_text = str(panel.get('draft', '') or '')
@@ -680,125 +660,9 @@ class PlayerList2(VideoTemplate):
 
         return PilImage.fromarray(cropped).resize((180, 600), PilImage.LANCZOS)
 
-    def generate_vertical_cover(self, title, img_path, user):
-        cover_width, cover_height = 1080, 1464
-        title_color = (255, 215, 0)
-        stroke_color = (0, 0, 0)
-        cover = PilImage.open(os.path.join(self.img_path, "1b6db0a6-91fb-4401-b60e-9ec1c51976dd.png")).resize((cover_width, cover_height))
-        enhancer = ImageEnhance.Brightness(cover)
-        cover = enhancer.enhance(0.2)
-        img = self.img_utils.trim_image(img_path)
-        new_w, new_h = img.size[0] * 2, img.size[1] * 2
-
-        img = img.resize((new_w, new_h), PilImage.LANCZOS)
-        img_x = (cover_width - new_w) // 2
-        img_y = (cover_height - new_h) // 2
-        cover.paste(img, (img_x, img_y), img)
-        draw = ImageDraw.Draw(cover)
-        font = ImageFont.truetype("msyhbd.ttc", 90)
-
-        def split_title(title: str, width: int = 12):
-            result = []
-            parts = title.replace("，", ",").split(",")
-            for part in parts:
-                part = part.strip()
-                if not part:
-                    continue
-                wrapped = textwrap.wrap(part, width=width)
-                result.extend(wrapped)
-            return result
-
-        lines = split_title(title, width=12)
-        line_height = font.getbbox("A")[3] - font.getbbox("A")[1] + 30
-        text_y = cover_height // 2 - 150
-        for line in lines:
-            bbox = draw.textbbox((0, 0), line, font=font)
-            text_w = bbox[2] - bbox[0]
-            text_x = (cover_width - text_w) // 2
-            draw.text((text_x, text_y), line, font=font, fill=title_color, stroke_width=3, stroke_fill=stroke_color)
-            text_y += line_height
-
-        image_id = uuid.uuid4()
-        image_name = f"{image_id}.png"
-        cover.save(os.path.join(IMG_PATH, image_name))
-        cover_size = os.path.getsize(os.path.join(IMG_PATH, image_name))
-        spec = {'format': 'png', 'mode': 'RGBA', 'size': cover_size}
-
-        Image(id=image_id, img_name=image_name, category='normal', img_path=IMG_PATH,
-              width=cover_width, height=cover_height, creator=user, spec=spec).save()
-        return image_id
-
-    def generate_horizontal_cover(self, title, img_path, user):
-        width, height = 1920, 1080
-
-        bg = PilImage.open(os.path.join(self.img_path, "6b24e082-f935-4664-8bd4-4c9e228d44e8.png")).resize((width, height))
-        enhancer = ImageEnhance.Brightness(bg)
-        bg = enhancer.enhance(0.2)
-
-        target_height = height - 100
-
-        main_img = img_path[0]
-        main_body = self.img_utils.trim_image(main_img)
-        w, h = main_body.size
-        new_w = int(w * target_height / h)
-        main_body = main_body.resize((new_w, target_height), PilImage.LANCZOS)
-        main_x = width // 4 - new_w // 2 + 30
-
-        compared_img = img_path[1]
-        compared_body = self.img_utils.trim_image(compared_img)
-        w, h = compared_body.size
-        new_w = int(w * target_height / h)
-        compared_body = compared_body.resize((new_w, target_height), PilImage.LANCZOS)
-        compared_x = width * 3 // 4 - new_w // 2 - 30
-
-        bg.paste(main_body, (main_x, 50), main_body)
-        bg.paste(compared_body, (compared_x, 50), compared_body)
-
-        draw = ImageDraw.Draw(bg)
-        font = ImageFont.truetype("msyhbd.ttc", 120)
-        title_color = (255, 215, 0)
-        stroke_color = (0, 0, 0)
-
-        def split_title(title: str, width: int = 14):
-            result = []
-            parts = title.replace("，", ",").split(",")
-            for part in parts:
-                part = part.strip()
-                if not part:
-                    continue
-                wrapped = textwrap.wrap(part, width=width)
-                result.extend(wrapped)
-            return result
-
-        lines = split_title(title, width=12)
-        line_height = font.getbbox("A")[3] - font.getbbox("A")[1] + 30
-        text_y = int(height * (1 - 0.618))
-        for line in lines:
-            bbox = draw.textbbox((0, 0), line, font=font)
-            text_w = bbox[2] - bbox[0]
-            text_x = (width - text_w) // 2
-            draw.text((text_x, text_y), line, font=font, fill=title_color, stroke_width=3, stroke_fill=stroke_color)
-            text_y += line_height
-
-        image_id = uuid.uuid4()
-        image_name = f'{image_id}.png'
-        bg.save(os.path.join(IMG_PATH, image_name))
-        cover_size = os.path.getsize(os.path.join(IMG_PATH, image_name))
-        spec = {
-            'format': 'png',
-            'mode': 'RGBA',
-            'size': cover_size
-        }
-
-        Image(
-            id=image_id,
-            img_name=image_name,
-            category='normal',
-            img_path=IMG_PATH,
-            width=width,
-            height=height,
-            creator=user,
-            spec=spec
-        ).save()
-
-        return image_id
+    def generate_covers(self, title, vertical_img, horizontal_imgs, user):
+        """生成竖版与横版封面，返回 (竖版封面ID, 横版封面ID)"""
+        renderer = CoverRenderer(self.__class__.__name__, self.img_utils)
+        return renderer.render(user, title, [], [vertical_img, *horizontal_imgs],
+                               vertical=lambda: renderer.single_vertical(title, vertical_img),
+                               horizontal=lambda: renderer.pair_horizontal(title, horizontal_imgs, 30))
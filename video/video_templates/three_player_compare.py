@@ -1,22 +1,22 @@
 import logging
 import os
-import shutil
-import textwrap
 import time
 import traceback
 import uuid
 
 import numpy as np
-from PIL import Image as PilImage, ImageDraw, ImageFont, ImageEnhance
+from PIL import Image as PilImage, ImageEnhance
 from moviepy import *
-from moviepy.audio.fx import AudioFadeOut
 from moviepy.video.fx import CrossFadeIn
-from pydub import AudioSegment
 
-from astra.settings import VIDEO_PATH, IMG_PATH, TMP_PATH
+from common.audio_utils import NarrationAssembler
+from common.typewriter_utils import TypewriterEffect
 from image.models import Image
 from video.models import Video
+from video.compositor import DirtyRectCompositeVideoClip
+from video.cover_renderer import CoverRenderer, HORIZONTAL_SIZE, HORIZONTAL_BACKGROUND
 from video.video_templates.video_template import VideoTemplate, VideoOrientation
+from voice.bgm_cache import BgmCache
 from voice.models import Sound
 
 logger = logging.getLogger("video")
@@ -24,6 +24,7 @@ logger = logging.getLogger("video")
 
 class ThreePlayerCompare(VideoTemplate):
     """竖版：球员列表视频模板（重新设计开场与卡片，单人逐段展示）"""
+    fonts = VideoTemplate.fonts + [('STXINWEI.TTF', 64), ('msyhbd.ttc', 90), ('msyhbd.ttc', 120)]
 
     def __init__(self):
         super().__init__()
@@ -144,6 +145,13 @@ class ThreePlayerCompare(VideoTemplate):
         self.video_type = 'Regular'
         self.tmps = None
 
+    def prepare_images(self, parameters):
+        if parameters.get('background'):
+            self.prepare_background(self.resolve_image(parameters['background']),
+                                    target_size=(self.width, self.height), brightness_factor=0.1)
+        for info in parameters.get('content') or []:
+            self.img_utils.trim_image(info.get('image_path'))
+
     def process(self, user, video_id, parameters):
         """竖版实现：自定义开场、单卡片逐段展示，不与横版并行展示。
         Args:
@@ -152,9 +160,7 @@ class ThreePlayerCompare(VideoTemplate):
             parameters: 参数集合
         """
         begin = time.time()
-        self.tmps = os.path.join(TMP_PATH, video_id)
-        if not os.path.exists(self.tmps):
-            os.mkdir(self.tmps)
+        self.tmps = self.open_workspace(video_id, parameters)
         logger.info(f"竖版视频生成参数：{parameters}")
 
         project_name = parameters.get('title')
@@ -168,11 +174,11 @@ class ThreePlayerCompare(VideoTemplate):
         content = parameters.get('content') or []
         reader = parameters.get('reader')
 
-        output_path = os.path.join(VIDEO_PATH, f"{video_id}.mp4")
-        Video(creator=user, title=project_name, content=start_text + "\n\n", video_type=self.video_type,
-              result='Process', process=0.0, id=video_id, param_id=param_id).save()
+        output_path = self.get_output_path(video_id)
+        self.save_video(user, video_id, project_name, start_text + "\n\n", param_id)
 
         try:
+            self.timer.switch('assets')
             # 背景
             bkg = parameters.get('background')
             if bkg:
@@ -185,12 +191,12 @@ class ThreePlayerCompare(VideoTemplate):
                 image.save(bg_img_path)
 
             start = 0.5
-            final_audio = AudioSegment.silent(duration=0)
+            narration = NarrationAssembler()
 
             # 开场语音与字幕
             start_segments = self.text_utils.split_text(start_text)
-            for i, sg in enumerate(start_segments):
-                tts = self.speech.chat_tts(sg, reader, user, video_id)
+            start_ttses = self.tts_many(start_segments, reader, user, video_id)
+            for i, (sg, tts) in enumerate(zip(start_segments, start_ttses)):
                 tts_path = os.path.join(self.tts_path, f'{tts.id}.{tts.format}')
                 if not os.path.isfile(tts_path):
                     fallback_exts = ['mp3', 'wav'] if tts.format != 'mp3' else ['wav']
@@ -199,37 +205,22 @@ class ThreePlayerCompare(VideoTemplate):
                         if os.path.isfile(alt):
                             tts_path = alt
                             break
-                try:
-                    try:
-                        audio = AudioSegment.from_file(tts_path).fade_in(200).fade_out(200)
-                    except Exception:
-                        try:
-                            audio = AudioSegment.from_file(tts_path, format='mp3').fade_in(200).fade_out(200)
-                        except Exception:
-                            audio = AudioSegment.from_file(tts_path, format='wav').fade_in(200).fade_out(200)
-                except Exception:
-                    try:
-                        audio = AudioSegment.from_file(tts_path, format='mp3').fade_in(200).fade_out(200)
-                    except Exception:
-                        audio = AudioSegment.from_file(tts_path, format='wav').fade_in(200).fade_out(200)
-
+                narration.add_speech(tts_path, tts.duration)
                 if i == 0:
-                    final_audio = audio
                     start += tts.duration
                 else:
-                    final_audio = final_audio.append(audio, crossfade=200)
                     start += tts.duration - 0.2
 
-            final_audio = final_audio.append(AudioSegment.silent(duration=500))
+            narration.add_silence(500)
             start += 0.5
             # 调整总时长：原有时间 + 闪烁定格时间（1+4=5秒）
             total_durations = start + 2 if start >= 6 else 8  # 增加5秒用于闪烁定格效果
 
-            vertical_cover = self.generate_vertical_cover(project_name, content[0].get('image_path'), user)
-            Video.objects.filter(id=video_id).update(vertical_cover=vertical_cover, process=0.2)
-
-            horizontal_cover = self.generate_horizontal_cover(project_name, [info.get('image_path') for info in content], user)
-            Video.objects.filter(id=video_id).update(cover=horizontal_cover)
+            with self.timer.stage('cover'):
+                vertical_cover, horizontal_cover = self.resumable('cover', lambda: self.generate_covers(
+                    project_name, [info.get('image_path') for info in content], user), valid=self.images_exist)
+            Video.objects.filter(id=video_id).update(vertical_cover=vertical_cover, cover=horizontal_cover, process=0.2)
+            self.timer.switch('compose')
 
             clips = []
 
@@ -302,7 +293,11 @@ class ThreePlayerCompare(VideoTemplate):
             impact_duration = 0.12
             impact_scale = 1.08
 
-            def make_frame(t):
+            # 黑色描边、金色填充，每个前缀/缩放状态只绘制一次
+            typewriter = TypewriterEffect(project_name, font_path, font_size, fill=(255, 215, 0, 255),
+                                          stroke_fill=(0, 0, 0, 255), stroke_width=1)
+
+            def typing_state(t):
                 # 打字阶段
                 if t < duration_typing:
                     num_chars = int((t / duration_typing) * len(project_name))
@@ -314,35 +309,13 @@ class ThreePlayerCompare(VideoTemplate):
                         scale = impact_scale - (impact_scale - 1.0) * (dt / impact_duration)
                     else:
                         scale = 1.0
+                return num_chars, scale, max(1, int(scale))
 
-                txt = project_name[:num_chars]
-
-                img = PilImage.new("RGBA", (self.width, self.height), (0, 0, 0, 0))
-                draw = ImageDraw.Draw(img)
-
-                font_scaled = ImageFont.truetype(
-                    font_path,
-                    int(font_size * scale)
-                )
-
-                text_w, _ = draw.textbbox((0, 0), txt, font=font_scaled)[2:]
-                x = (self.width - text_w) // 2
-                y = 100
-
-                stroke_width = max(1, int(scale))
-                stroke_color = (0, 0, 0, 255)
-                fill_color = (255, 215, 0, 255)
-
-                for dx in range(-stroke_width, stroke_width + 1):
-                    for dy in range(-stroke_width, stroke_width + 1):
-                        if dx or dy:
-                            draw.text((x + dx, y + dy), txt, font=font_scaled, fill=stroke_color)
-
-                draw.text((x, y), txt, font=font_scaled, fill=fill_color)
+            def typing_anchor(txt, font, draw):
+                text_w, _ = draw.textbbox((0, 0), txt, font=font)[2:]
+                return (self.width - text_w) // 2, 100
 
-                return np.array(img)
-
-            typing_clip = (VideoClip(make_frame, duration=total_durations - 0.5).with_start(0.5))
+            typing_clip = typewriter.make_clip(typing_state, typing_anchor, total_durations - 0.5).with_start(0.5)
             clips.append(typing_clip)
 
             sweep = self.create_keynote_sweep_light(
@@ -358,26 +331,17 @@ class ThreePlayerCompare(VideoTemplate):
 
             clips.append(sweep)
 
-            audio_path = os.path.join(self.tmps, "merged_tts.mp3")
-            final_audio.export(audio_path, format="mp3")
             bg_clip = ImageClip(bg_img_path).with_duration(total_durations)
 
             # 创建基础视频
-            final_video = CompositeVideoClip([
+            final_video = DirtyRectCompositeVideoClip([
                 bg_clip,
                 *clips,
             ], size=(self.width, self.height)).with_duration(total_durations)
 
-            audio_clip = AudioFileClip(audio_path).with_start(0.5)
-            bg_music = AudioFileClip(bgm_path).with_volume_scaled(0.1)
-
-            if bg_music.duration < audio_clip.duration:
-                loops = int(audio_clip.duration // bg_music.duration) + 1
-                layered = [bg_music.with_start(i * bg_music.duration) for i in range(loops)]
-                bg_music = CompositeAudioClip(layered)
-
-            bg_music = bg_music.with_duration(audio_clip.duration)
-            bg_music = bg_music.with_effects([AudioFadeOut(1)])
+            audio_clip = self.narration_clip(narration).with_start(0.5)
+            # 背景音乐底轨已预先循环拼接并调好音量，按音乐与时长档位缓存
+            bg_music = BgmCache().bed(bgm_sound.id, bgm_path, audio_clip.duration, volume=0.1, fade=1)
 
             final_audio_layers = [bg_music, audio_clip]
             final_audio_clip = CompositeAudioClip(final_audio_layers)
@@ -385,12 +349,7 @@ class ThreePlayerCompare(VideoTemplate):
             final_video = final_video.with_audio(final_audio_clip)
 
             # 输出
-            final_video.write_videofile(output_path,
-                                        fps=30,
-                                        codec="libx264",
-                                        audio_codec="aac",
-                                        audio_bitrate="192k",
-                                        ffmpeg_params=["-crf", "18", "-preset", "slow", "-pix_fmt", "yuv420p"])
+            self.write_video(final_video, output_path)
 
             video_size = 0
             if os.path.exists(output_path):
@@ -399,7 +358,7 @@ class ThreePlayerCompare(VideoTemplate):
             Video.objects.filter(id=video_id).update(
                 result='Success',
                 process=1.0,
-                video_path=f"/media/videos/{video_id}.mp4",
+                video_path=self.get_video_url(video_id),
                 cost=time.time() - begin,
                 size=video_size
             )
@@ -411,10 +370,6 @@ class ThreePlayerCompare(VideoTemplate):
                 os.remove(output_path)
             raise e
 
-        finally:
-            if os.path.exists(self.tmps):
-                shutil.rmtree(self.tmps)
-
     def create_keynote_sweep_light(
             self,
             size,
@@ -577,74 +532,34 @@ class ThreePlayerCompare(VideoTemplate):
         return final_clip
 
     def prepare_background(self, bg_path, target_size=None, brightness_factor=0.2):
+        """缩放并压暗背景图，返回缓存中的图片路径"""
         if target_size is None:
             target_size = (self.width, self.height)
-        img = PilImage.open(bg_path).convert("RGBA")
-        img = img.resize(target_size, PilImage.LANCZOS)
-        enhancer = ImageEnhance.Brightness(img)
-        img = enhancer.enhance(brightness_factor)
-        tmp_bg_path = os.path.join(self.tmps, "tmp_bg.png")
-        img.save(tmp_bg_path)
-        return tmp_bg_path
-
-    def generate_vertical_cover(self, title, img_path, user):
-        cover_width, cover_height = 1080, 1464
-        title_color = (255, 215, 0)
-        stroke_color = (0, 0, 0)
-        cover = PilImage.open(os.path.join(self.img_path, "1b6db0a6-91fb-4401-b60e-9ec1c51976dd.png")).resize((cover_width, cover_height))
-        enhancer = ImageEnhance.Brightness(cover)
-        cover = enhancer.enhance(0.2)
-        img = self.img_utils.trim_image(img_path)
-        new_w, new_h = img.size[0] * 2, img.size[1] * 2
-        img = img.resize((new_w, new_h), PilImage.LANCZOS)
-        img_x = (cover_width - new_w) // 2
-        img_y = (cover_height - new_h) // 2
-        cover.paste(img, (img_x, img_y), img)
-        draw = ImageDraw.Draw(cover)
-        font = ImageFont.truetype("msyhbd.ttc", 90)
-
-        def split_title(title: str, width: int = 12):
-            result = []
-            parts = title.replace("，", ",").split(",")
-            for part in parts:
-                part = part.strip()
-                if not part:
-                    continue
-                wrapped = textwrap.wrap(part, width=width)
-                result.extend(wrapped)
-            return result
-
-        lines = split_title(title, width=12)
-        line_height = font.getbbox("A")[3] - font.getbbox("A")[1] + 30
-        text_y = cover_height // 2 - 150
-        for line in lines:
-            bbox = draw.textbbox((0, 0), line, font=font)
-            text_w = bbox[2] - bbox[0]
-            text_x = (cover_width - text_w) // 2
-            draw.text((text_x, text_y), line, font=font, fill=title_color, stroke_width=3, stroke_fill=stroke_color)
-            text_y += line_height
-
-        image_id = uuid.uuid4()
-        image_name = f"{image_id}.png"
-        cover.save(os.path.join(IMG_PATH, image_name))
-        cover_size = os.path.getsize(os.path.join(IMG_PATH, image_name))
-        spec = {'format': 'png', 'mode': 'RGBA', 'size': cover_size}
-
-        Image(id=image_id, img_name=image_name, category='normal', img_path=IMG_PATH,
-              width=cover_width, height=cover_height, creator=user, spec=spec).save()
-        return image_id
-
-    def generate_horizontal_cover(self, title, img_path, user):
-        width, height = 1920, 1080
-
-        bg = PilImage.open(os.path.join(self.img_path, "6b24e082-f935-4664-8bd4-4c9e228d44e8.png")).resize((width, height))
-        enhancer = ImageEnhance.Brightness(bg)
-        bg = enhancer.enhance(0.2)
+
+        def build(path):
+            img = PilImage.open(path).convert("RGBA")
+            img = img.resize(target_size, PilImage.LANCZOS)
+            enhancer = ImageEnhance.Brightness(img)
+            return enhancer.enhance(brightness_factor)
+
+        return self.img_utils.cache.derive(bg_path, 'prepare_background',
+                                           {'size': list(target_size), 'brightness': brightness_factor}, build)
+
+    def generate_covers(self, title, img_path, user):
+        """生成竖版与横版封面，返回 (竖版封面ID, 横版封面ID)"""
+        renderer = CoverRenderer(self.__class__.__name__, self.img_utils)
+        return renderer.render(user, title, [], img_path,
+                               vertical=lambda: renderer.single_vertical(title, img_path[0]),
+                               horizontal=lambda: self.draw_horizontal_cover(renderer, title, img_path))
+
+    def draw_horizontal_cover(self, renderer, title, img_path):
+        width, height = HORIZONTAL_SIZE
+        bg = renderer.background(HORIZONTAL_BACKGROUND, HORIZONTAL_SIZE)
 
         target_width = int(width * 0.35)
         resized = []
         for path in img_path:
-            img = self.img_utils.trim_image(path)
+            img = renderer.layer(path)
             ow, oh = img.size
             new_h = int(oh * (target_width / ow))
             resized.append(img.resize((target_width, new_h), PilImage.LANCZOS))
@@ -666,51 +581,5 @@ class ThreePlayerCompare(VideoTemplate):
         bg.paste(right_img, (right_x, right_y), right_img)
         bg.paste(center_img, (center_x, center_y), center_img)
 
-        draw = ImageDraw.Draw(bg)
-        font = ImageFont.truetype("msyhbd.ttc", 120)
-        title_color = (255, 215, 0)
-        stroke_color = (0, 0, 0)
-
-        def split_title(title: str, width: int = 14):
-            result = []
-            parts = title.replace("，", ",").split(",")
-            for part in parts:
-                part = part.strip()
-                if not part:
-                    continue
-                wrapped = textwrap.wrap(part, width=width)
-                result.extend(wrapped)
-            return result
-
-        lines = split_title(title, width=12)
-        line_height = font.getbbox("A")[3] - font.getbbox("A")[1] + 30
-        text_y = int(height * (1 - 0.618))
-        for line in lines:
-            bbox = draw.textbbox((0, 0), line, font=font)
-            text_w = bbox[2] - bbox[0]
-            text_x = (width - text_w) // 2
-            draw.text((text_x, text_y), line, font=font, fill=title_color, stroke_width=3, stroke_fill=stroke_color)
-            text_y += line_height
-
-        image_id = uuid.uuid4()
-        image_name = f'{image_id}.png'
-        bg.save(os.path.join(IMG_PATH, image_name))
-        cover_size = os.path.getsize(os.path.join(IMG_PATH, image_name))
-        spec = {
-            'format': 'png',
-            'mode': 'RGBA',
-            'size': cover_size
-        }
-
-        Image(
-            id=image_id,
-            img_name=image_name,
-            category='normal',
-            img_path=IMG_PATH,
-            width=width,
-            height=height,
-            creator=user,
-            spec=spec
-        ).save()
-
-        return image_id
+        renderer.draw_title(bg, title, 120, int(height * (1 - 0.618)))
+        return bg
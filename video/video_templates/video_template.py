@@ -5,24 +5,44 @@ import shutil
 import traceback
 import uuid
 from enum import Enum
+from functools import cached_property
 
-from moviepy import AudioFileClip, CompositeAudioClip
+import numpy as np
+from moviepy.audio.AudioClip import AudioArrayClip
 from proglog import ProgressBarLogger
 
 from account.models import SystemSettings
 from astra import settings
-from astra.settings import FONTS_PATH, SOUND_PATH, VIDEO_PATH, IMG_PATH, TTS_PATH
+from astra.settings import FONTS_PATH, SOUND_PATH, VIDEO_PATH, IMG_PATH, TTS_PATH, PREVIEW_PATH, RENDER_BATCH_MAX_VIDEOS
 from common.exceptions import BusinessException
+from common.font_utils import FontRegistry
 from common.image_utils import ImageUtils
 from common.redis_tools import ControlRedis
 from common.subtitler_utils import SubtitlerUtils
 from common.text_utils import TextUtils
-from tag.models import Tag
-from video.models import Parameters, TemplateTags
+from image.models import Image
+from video.models import Parameters
+from video.parallel_render import ParallelRenderer
+from video.progress import RenderProgress
+from video.render_batch import RenderBatch
+from video.render_cancel import RenderCancel, RenderCancelled
+from video.render_dedup import RenderDedup
+from video.render_queue import RenderQueue
+from video.render_workspace import RenderWorkspace
+from video.stage_timer import StageTimer
+from video.template_registry import TemplateRegistry
+from voice.bgm_cache import BgmCache
+from voice.models import Sound, Tts
 from voice.text_to_speech import Speech
 
 logger = logging.getLogger("video")
 
+# 渲染配置：final 为正式导出；preview 为快速预览，在半分辨率画布上合成、15fps、ultrafast 编码，不做切片并行
+RENDER_PROFILES = {
+    'final': {'scale': 1.0, 'fps': 30, 'crf': 18, 'preset': 'slow', 'parallel': True},
+    'preview': {'scale': 0.5, 'fps': 15, 'crf': 28, 'preset': 'ultrafast', 'parallel': False},
+}
+
 
 class VideoOrientation(Enum):
     HORIZONTAL = 0  # 横版视频
@@ -40,12 +60,26 @@ class InputType(Enum):
 
 
 class VideoTemplate:
+    # 模板渲染用到的 (字体, 字号)，渲染进程启动时预加载
+    fonts = [('STXINWEI', 40)]
+    # 背景音乐底轨的音量与相对配音时长的延长秒数，与 process 中 BgmCache().bed 的参数一致，批量生成时据此预先生成底轨
+    bgm_volume = 0.1
+    bgm_padding = 0
+    # 模板是否生成视频记录，入队时据此预先创建 Video
+    creates_video = True
+
     def __init__(self):
         self.template_id = str(uuid.uuid3(uuid.NAMESPACE_DNS, self.__class__.__name__))
         self.img_path = IMG_PATH
         self.sound_path = SOUND_PATH
         self.tts_path = TTS_PATH
         self.movie_path = VIDEO_PATH
+        self.profile = 'final'
+        self.video_id = None
+        self.param_id = None
+        self.workspace = None
+        self.cancel = None
+        self.timer = StageTimer(on_switch=self.checkpoint)
         self.font = os.path.join(FONTS_PATH, 'STXINWEI.TTF')
         self.name = ''
         self.desc = ''
@@ -53,62 +87,377 @@ class VideoTemplate:
         self.orientation = VideoOrientation.HORIZONTAL.name
         self.parameters = {}
         self.demo = None
-        self.templates = []
-        self.methods = {}
-        self.text_utils = TextUtils()
-        self.img_utils = ImageUtils()
-        self.subtitler = SubtitlerUtils()
-        self.speech = Speech()
+
+    # 以下工具对象在渲染时才创建，收集模板元数据时不会构造
+    @cached_property
+    def text_utils(self):
+        return TextUtils()
+
+    @cached_property
+    def img_utils(self):
+        return ImageUtils()
+
+    @cached_property
+    def subtitler(self):
+        return SubtitlerUtils()
+
+    @cached_property
+    def speech(self):
+        return Speech()
+
+    @cached_property
+    def redis_control(self):
         # redis 记录视频生成进度
-        self.redis_control = ControlRedis()
+        return ControlRedis()
 
     def generate_video(self, user, parameters):
+        """将生成请求放入渲染队列，由 render_worker 进程异步生成，立即返回 video_id"""
         template_id = parameters.get('template_id')
-        if template_id not in self.methods.keys():
+        if template_id not in TemplateRegistry.methods():
             return 'Method not found'
+        profile = parameters.get('render_profile') or 'final'
+        if profile not in RENDER_PROFILES:
+            raise BusinessException(f"渲染配置不存在：{profile}")
+        # 重复提交（双击、前端重试）复用窗口期内相同请求的视频，不再重复渲染
         video_id = str(uuid.uuid4())
-        logger.info("生成视频封面完成")
-        try:
-            self.methods[template_id]().process(user, video_id, parameters)
+        dedup = RenderDedup(user, template_id, parameters, profile)
+        existing = dedup.acquire(video_id)
+        if existing is not None:
+            logger.info(f"相同渲染请求复用视频{existing['video_id']}，状态：{existing['result']}")
             return {
-                'video_id': video_id,
-                'parameters': parameters
+                'video_id': existing['video_id'],
+                'parameters': parameters,
+                'duplicate': True,
+                'result': existing['result']
             }
+        instance = TemplateRegistry.methods()[template_id]()
+        param_id = instance.create_video(user, video_id, parameters, profile)
+        progress = RenderProgress(video_id)
+        progress.publish('queued')
+        try:
+            job = RenderQueue.for_profile(profile).enqueue(user, parameters, video_id=video_id, profile=profile,
+                                                           param_id=param_id)
+        except Exception:
+            dedup.release()
+            self.mark_failed(video_id)
+            raise
+        return {
+            'video_id': job['video_id'],
+            'parameters': parameters
+        }
+
+    def render_job(self, job):
+        """在渲染进程中执行队列任务"""
+        template_id = job.get('template_id')
+        video_id = job.get('video_id')
+        methods = TemplateRegistry.methods()
+        if template_id not in methods:
+            logger.error(f"视频{video_id}的模板不存在：{template_id}")
+            return
+        logger.info(f"开始渲染视频{video_id}，模板：{template_id}，渲染配置：{job.get('profile', 'final')}")
+        progress = RenderProgress(video_id)
+        progress.publish('prepare')
+        instance = methods[template_id]()
+        instance.profile = job.get('profile', 'final')
+        instance.video_id = video_id
+        instance.param_id = job.get('param_id')
+        instance.cancel = RenderCancel(video_id)
+        try:
+            instance.timer.switch('setup')
+            instance.process(job.get('user'), video_id, job.get('parameters'))
+        except RenderCancelled:
+            logger.info(f"视频{video_id}已取消")
+            # 保留已完成的中间产物，重试时续跑，长期不用由工作区清理删除
+            instance.close_workspace(success=False)
+            self.mark_cancelled(video_id)
+            return
         except Exception as e:
             logger.error(traceback.format_exc())
+            instance.close_workspace(success=False)
+            # 准备阶段（参数、图片、配音）出错时模板还未标记失败
+            self.mark_failed(video_id)
             raise e
+        finally:
+            instance.save_timings(video_id)
+        instance.close_workspace(success=True)
+        progress.publish('success', 100)
+
+    @staticmethod
+    def cancel_video(user, video_id):
+        """取消排队中或渲染中的视频：仍在队列中的任务直接移出，渲染中的任务设置取消标记，由渲染进程在下一个检查点结束"""
+        from video.models import Video
+        video = Video.objects.filter(id=video_id, creator=user).first()
+        if video is None:
+            raise BusinessException("视频不存在")
+        if video.result != 'Process':
+            raise BusinessException("视频不在生成中，无法取消")
+        RenderCancel(video_id).request()
+        if RenderQueue().remove(user, video_id):
+            VideoTemplate.mark_cancelled(video_id)
+        logger.info(f"视频{video_id}已请求取消")
+        return {'video_id': video_id}
+
+    def create_video(self, user, video_id, parameters, profile):
+        """入队时创建参数与视频记录，排队中的视频即可在列表中查看和取消，准备阶段失败也能重试；返回参数ID"""
+        from video.models import Video
+        if not self.creates_video:
+            return None
+        title = parameters.get('title') or ''
+        param_id = self.save_parameters(self.template_id, user, title, parameters)
+        Video(id=video_id, creator=user, title=title, video_type=self.video_type, result='Process', process=0.0,
+              param_id=param_id, spec={'render_profile': profile}).save()
+        return param_id
+
+    def save_video(self, user, video_id, title, content, param_id):
+        """渲染开始时更新入队时创建的视频记录，直接调用 process（如基准测试）时新建"""
+        from video.models import Video
+        Video.objects.update_or_create(id=video_id, defaults={
+            'creator': user, 'title': title, 'content': content, 'video_type': self.video_type, 'result': 'Process',
+            'process': 0.0, 'param_id': param_id, 'spec': {'render_profile': self.profile}})
+
+    @staticmethod
+    def mark_failed(video_id):
+        from video.models import Video
+        Video.objects.filter(id=video_id, result='Process').update(result='Fail')
+        RenderProgress(video_id).publish('failed')
+
+    @staticmethod
+    def mark_cancelled(video_id):
+        from video.models import Video
+        Video.objects.filter(id=video_id).update(result='Cancelled')
+        RenderCancel(video_id).clear()
+        RenderProgress(video_id).publish('cancelled')
+
+    def checkpoint(self, stage=None):
+        """阶段切换时检查取消标记"""
+        if self.cancel is not None:
+            self.cancel.check()
+
+    def generate_batch(self, user, template_id, parameter_sets, profile='final'):
+        """同一模板批量生成视频：预先分配 video_id 并提交批次任务，立即返回批次ID"""
+        if template_id not in TemplateRegistry.methods():
+            raise BusinessException(f"模板不存在：{template_id}")
+        if profile not in RENDER_PROFILES:
+            raise BusinessException(f"渲染配置不存在：{profile}")
+        if not isinstance(parameter_sets, list) or not parameter_sets:
+            raise BusinessException("批量生成参数不能为空")
+        if len(parameter_sets) > RENDER_BATCH_MAX_VIDEOS:
+            raise BusinessException(f"单个批次最多生成{RENDER_BATCH_MAX_VIDEOS}个视频")
+        jobs = [{'video_id': str(uuid.uuid4()),
+                 'parameters': {**parameters, 'template_id': template_id, 'render_profile': profile}}
+                for parameters in parameter_sets]
+        instance = TemplateRegistry.methods()[template_id]()
+        for job in jobs:
+            job['param_id'] = instance.create_video(user, job['video_id'], job['parameters'], profile)
+        batch = RenderBatch.create(user, template_id, profile, [job['video_id'] for job in jobs])
+        RenderQueue.for_profile(profile).enqueue_batch(user, template_id, batch.batch_id, jobs, profile=profile)
+        for job in jobs:
+            RenderProgress(job['video_id']).publish('queued')
+        return {'batch_id': batch.batch_id, 'video_ids': [job['video_id'] for job in jobs]}
+
+    def render_batch_job(self, job):
+        """在渲染进程中执行批次任务：完成共享准备后把各视频放入渲染队列，由所有渲染进程并行消费"""
+        batch = RenderBatch(job['batch_id'])
+        methods = TemplateRegistry.methods()
+        shared = None
+        if job.get('template_id') in methods:
+            instance = methods[job['template_id']]()
+            instance.profile = job.get('profile', 'final')
+            try:
+                shared = instance.prepare_batch(job.get('user'), [item['parameters'] for item in job['jobs']])
+                logger.info(f"批次{job['batch_id']}共享准备完成：{shared}")
+            except Exception:
+                # 共享准备只是预热缓存，失败时各视频照常渲染
+                logger.error(traceback.format_exc())
+        queue = RenderQueue.for_profile(job.get('profile', 'final'))
+        for item in job['jobs']:
+            queue.enqueue(job.get('user'), item['parameters'], video_id=item['video_id'], profile=job.get('profile', 'final'),
+                          param_id=item.get('param_id'), priority='batch')
+        batch.update(state='rendering', shared=shared)
+
+    def narration_texts(self, parameters):
+        """配音分句，批量生成时据此预先合成去重后的配音"""
+        return self.text_utils.split_text(parameters.get('start_text', ''))
+
+    def prepare_images(self, parameters):
+        """生成模板用到的派生图片（缩放、裁边、背景压暗等）并写入图片缓存，批量生成时每组参数调用一次"""
 
-    def get_templates(self):
-        subclasses = VideoTemplate.__subclasses__()
-        for subclass in subclasses:
-            # 创建子类实例
-            instance = subclass()
-            if instance.template_id not in self.methods.keys():
-                tag_ids = TemplateTags.objects.filter(template_id=instance.template_id).values_list('tag_id', flat=True)
-
-                tags = []
-                for tag in tag_ids:
-                    tag = Tag.objects.get(id=tag)
-                    tags.append({
-                        'id': tag.id,
-                        'tag_name': tag.tag_name,
-                        'parent': tag.parent,
-                        'category': tag.category
-                    })
-                template_info = {
-                    "template_id": instance.template_id,
-                    "name": instance.name,
-                    "desc": instance.desc,
-                    "template_type": instance.video_type,
-                    "parameters": instance.parameters,
-                    "orientation": instance.orientation,
-                    "demo": instance.demo,
-                    "tags": tags
-                }
-                self.templates.append(template_info)
-                logger.info(f"register {instance.name}，info: {template_info}")
-                self.methods[instance.template_id] = subclass
-        return self.templates
+    def resolve_image(self, value):
+        """图片参数可以是文件路径或 Image ID，返回文件路径"""
+        if isinstance(value, str) and os.path.isfile(value):
+            return value
+        return os.path.join(self.img_path, Image.objects.get(id=value).img_name)
+
+    def prepare_batch(self, user, parameter_sets):
+        """批量生成前统一完成可共享的准备工作，结果写入各自的内容缓存，之后各视频渲染时直接命中
+
+        各组参数的配音分句按音色去重后合成一次；派生图片逐组生成，相同图片只处理一次；
+        背景音乐底轨按配音总时长估算档位，落在同一档位的视频共用一份。返回各项去重后的数量。
+        """
+        texts = {}
+        for parameters in parameter_sets:
+            segments = texts.setdefault(parameters.get('reader'), {})
+            for text in self.narration_texts(parameters):
+                segments[text] = None
+        durations = {}
+        for reader, segments in texts.items():
+            if not reader or not segments:
+                continue
+            ttses = self.tts_many(list(segments), reader, user)
+            for text, tts in zip(segments, ttses):
+                durations[(reader, text)] = tts.duration
+            # 配音已写入TTS缓存，渲染时各视频生成自己的 Tts 记录，预合成的记录不再需要
+            for tts in ttses:
+                path = os.path.join(self.tts_path, f'{tts.id}.{tts.format}')
+                if os.path.exists(path):
+                    os.remove(path)
+            Tts.objects.filter(id__in=[tts.id for tts in ttses]).delete()
+
+        for parameters in parameter_sets:
+            try:
+                self.prepare_images(parameters)
+            except Exception as e:
+                logger.warning(f"批量生成预处理图片失败：{e}")
+
+        beds = set()
+        sounds = {}
+        for parameters in parameter_sets:
+            bgm = parameters.get('bgm')
+            if not bgm:
+                continue
+            if bgm not in sounds:
+                sounds[bgm] = Sound.objects.get(id=bgm)
+            sound = sounds[bgm]
+            reader = parameters.get('reader')
+            seconds = sum(durations.get((reader, text), 0) for text in self.narration_texts(parameters))
+            beds.add(BgmCache().bed_path(sound.id, os.path.join(self.sound_path, sound.sound_path),
+                                         seconds + self.bgm_padding, self.bgm_volume))
+        return {
+            'videos': len(parameter_sets),
+            'tts': len(durations),
+            'tts_segments': sum(len(self.narration_texts(parameters)) for parameters in parameter_sets),
+            'bgm_beds': len(beds),
+        }
+
+    @staticmethod
+    def retry_video(user, video_id):
+        """失败的视频按原参数重新入队，沿用 video_id 与参数记录，渲染时复用工作区中已完成的中间产物"""
+        from video.models import Video
+        video = Video.objects.filter(id=video_id, creator=user).first()
+        if video is None:
+            raise BusinessException("视频不存在")
+        if video.result not in ('Fail', 'Cancelled'):
+            raise BusinessException("只有生成失败或已取消的视频可以重试")
+        params = Parameters.objects.filter(id=video.param_id).first()
+        if params is None or not params.data:
+            raise BusinessException("视频参数不存在，无法重试")
+        profile = (video.spec or {}).get('render_profile') or 'final'
+        RenderCancel(video_id).clear()
+        RenderQueue.for_profile(profile).enqueue(user, params.data, video_id=video_id, profile=profile,
+                                                 param_id=str(video.param_id))
+        Video.objects.filter(id=video_id).update(result='Process', process=0.0)
+        RenderProgress(video_id).publish('queued')
+        return {'video_id': video_id}
+
+    def open_workspace(self, video_id, parameters):
+        """打开本视频的渲染工作区，返回存放中间产物的目录"""
+        self.workspace = RenderWorkspace.open(video_id, self.template_id, parameters, self.profile, self.param_id)
+        return self.workspace.path
+
+    def close_workspace(self, success):
+        """成功后删除工作区，失败时保留供重试续跑"""
+        if self.workspace is None:
+            return
+        if success:
+            self.workspace.remove()
+        else:
+            self.workspace.touch()
+        self.workspace = None
+
+    def save_timings(self, video_id):
+        """结束计时并把各阶段耗时写入 Video.spec，失败时只记录日志"""
+        self.timer.finish()
+        try:
+            self.timer.save(video_id)
+        except Exception as e:
+            logger.warning(f"视频{video_id}阶段耗时保存失败：{e}")
+
+    def tts(self, text, reader, user, video_id=''):
+        """合成单段配音，计入 tts 阶段；续跑时复用工作区中已合成的配音"""
+        with self.timer.stage('tts'):
+            tts = self.resumed_tts([text], reader)[0]
+            if tts is None:
+                self.timer.count('calls')
+                tts = self.speech.chat_tts(text, reader, user, video_id)
+                self.record_tts([text], [tts], reader)
+            return tts
+
+    def tts_many(self, segments, reader, user, video_id=''):
+        """并发合成多段配音，计入 tts 阶段；续跑时只合成工作区中没有的分句"""
+        with self.timer.stage('tts'):
+            ttses = self.resumed_tts(segments, reader)
+            missing = [text for text, tts in zip(segments, ttses) if tts is None]
+            if missing:
+                self.timer.count('calls', len(missing))
+                generated = self.speech.chat_tts_many(missing, reader, user, video_id)
+                self.record_tts(missing, generated, reader)
+                generated = iter(generated)
+                ttses = [tts if tts is not None else next(generated) for tts in ttses]
+            return ttses
+
+    def resumed_tts(self, segments, reader):
+        """工作区中已合成且音频文件仍在的配音，与 segments 一一对应，没有的为 None"""
+        if self.workspace is None:
+            return [None] * len(segments)
+        done = (self.workspace.completed('tts') or {}).get('segments', {})
+        ids = [done.get(f'{reader}:{text}') for text in segments]
+        rows = {str(tts.id): tts for tts in Tts.objects.filter(id__in=[tts_id for tts_id in ids if tts_id])}
+        ttses = [rows.get(tts_id) if tts_id else None for tts_id in ids]
+        return [tts if tts is not None and os.path.isfile(os.path.join(self.tts_path, f'{tts.id}.{tts.format}'))
+                else None for tts in ttses]
+
+    def record_tts(self, segments, ttses, reader):
+        if self.workspace is None:
+            return
+        done = (self.workspace.completed('tts') or {}).get('segments', {})
+        done.update({f'{reader}:{text}': str(tts.id) for text, tts in zip(segments, ttses)})
+        self.workspace.complete('tts', segments=done)
+
+    def resumable(self, stage, build, valid=None):
+        """工作区记录过该阶段的结果且 valid(result) 为真时直接返回，否则执行 build() 并记录结果"""
+        if self.workspace is None:
+            return build()
+        done = self.workspace.completed(stage)
+        if done is not None and (valid is None or valid(done['result'])):
+            logger.info(f"视频{self.video_id}续跑，跳过已完成阶段：{stage}")
+            return done['result']
+        result = build()
+        self.workspace.complete(stage, result=result)
+        return result
+
+    @staticmethod
+    def images_exist(image_ids):
+        return Image.objects.filter(id__in=image_ids).count() == len(set(image_ids))
+
+    def narration_clip(self, narration):
+        """旁白音轨，续跑时读取工作区中已拼接的结果，不再逐段解码"""
+        if self.workspace is None:
+            return narration.clip()
+        path = self.workspace.artifact('narration.npy', lambda tmp_path: np.save(tmp_path, narration.build()))
+        return AudioArrayClip(np.load(path), fps=narration.frame_rate)
+
+    @staticmethod
+    def get_templates():
+        return TemplateRegistry.templates()
+
+    @staticmethod
+    def warm_fonts():
+        """预加载所有已注册模板使用的字体"""
+        fonts = set(VideoTemplate.fonts)
+        for subclass in VideoTemplate.__subclasses__():
+            fonts.update(subclass.fonts)
+        FontRegistry.warm(sorted(fonts))
+        logger.info(f"预加载字体{len(fonts)}个")
 
     def safe_copy_rename(self, src, dst_dir, new_name):
         """安全复制并重命名文件夹"""
@@ -138,15 +487,15 @@ class VideoTemplate:
             raise BusinessException('无法创建草稿，请检查路径和权限')
 
     def filter_templates(self, name=None, orientation=None, template_type=None, tag_id=None):
-        templates = self.templates
+        templates = TemplateRegistry.templates()
         if name:
             templates = [item for item in templates if name in item.get('name')]
         if orientation:
             templates = [item for item in templates if orientation == item.get('orientation')]
         if template_type:
-            templates = [item for item in templates if template_type == item.get('video_type')]
+            templates = [item for item in templates if template_type == item.get('template_type')]
         if tag_id:
-            templates = [item for item in templates if tag_id in [tag.id for tag in item.get('tags')]]
+            templates = [item for item in templates if str(tag_id) in [tag['id'] for tag in item.get('tags')]]
         return templates
 
     @staticmethod
@@ -158,7 +507,10 @@ class VideoTemplate:
             raise BusinessException("视频生成失败，请重新生成")
         else:
             video_filename = f'{video_id}.mp4'
-            video_path = os.path.join(settings.VIDEO_PATH, video_filename)
+            if (video.spec or {}).get('render_profile') == 'preview':
+                video_path = os.path.join(PREVIEW_PATH, video_filename)
+            else:
+                video_path = os.path.join(settings.VIDEO_PATH, video_filename)
 
             # 直接返回视频文件的路径或文件对象
             logger.info(f"视频{video_id}下载成功")
@@ -179,8 +531,10 @@ class VideoTemplate:
                 print(f"Failed to delete {file_path}: {e}")
         print("临时音频文件删除完成")
 
-    @staticmethod
-    def save_parameters(template_id, user, title, data):
+    def save_parameters(self, template_id, user, title, data):
+        # 重试时沿用原参数记录
+        if self.param_id and Parameters.objects.filter(id=self.param_id).update(title=title, data=data):
+            return self.param_id
         param_id = str(uuid.uuid4())
         Parameters(id=param_id, title=title, creator=user, template_id=template_id, data=data).save()
         return param_id
@@ -194,28 +548,49 @@ class VideoTemplate:
         else:
             logger.error(f"视频类型异常，{orientation}")
 
-    @staticmethod
-    def handle_final_audio(bgm_path, audio_path):
-        audio_clip = AudioFileClip(audio_path).with_start(0.5)
-        bg_music = AudioFileClip(bgm_path).with_volume_scaled(0.05)
-        if bg_music.duration < audio_clip.duration:
-            loops = int(audio_clip.duration // bg_music.duration) + 1
-            layered = [bg_music.with_start(i * bg_music.duration) for i in range(loops)]
-            bg_music = CompositeAudioClip(layered)
-        bg_music = bg_music.with_duration(audio_clip.duration)
+    def get_output_path(self, video_id):
+        """预览视频与正式视频分开存放"""
+        folder = PREVIEW_PATH if self.profile == 'preview' else self.movie_path
+        return os.path.join(folder, f"{video_id}.mp4")
+
+    def get_video_url(self, video_id):
+        if self.profile == 'preview':
+            return f"/media/videos/preview/{video_id}.mp4"
+        return f"/media/videos/{video_id}.mp4"
 
-        # --- 合成音轨 ---
-        final_audio = CompositeAudioClip([bg_music, audio_clip])
-        return final_audio
+    def write_video(self, final_video, output_path):
+        """按渲染配置导出视频，正式导出时长足够时按时间切片多进程并行渲染"""
+        profile = RENDER_PROFILES[self.profile]
+        ffmpeg_params = ["-crf", str(profile['crf']), "-pix_fmt", "yuv420p"]
+        if profile['scale'] != 1:
+            scale = profile['scale']
+            if hasattr(final_video, 'scaled'):
+                # 在缩小的画布上合成，而不是整幅合成后再缩放
+                final_video = final_video.scaled(scale)
+            else:
+                # 由 ffmpeg 缩放输出分辨率，宽高取偶数以满足 yuv420p
+                ffmpeg_params += ["-vf", f"scale=trunc(iw*{scale}/2)*2:trunc(ih*{scale}/2)*2"]
+        renderer = ParallelRenderer() if profile['parallel'] else ParallelRenderer(processes=1)
+        self.timer.count('clips', len(getattr(final_video, 'clips', ())), stage='compose')
+        with self.timer.stage('encode'):
+            self.timer.count('frames', int(final_video.duration * profile['fps']))
+            return renderer.write(final_video, output_path, fps=profile['fps'], codec="libx264", audio_codec="aac",
+                                  audio_bitrate="192k", preset=profile['preset'], ffmpeg_params=ffmpeg_params,
+                                  video_id=self.video_id,
+                                  work_dir=self.workspace.path if self.workspace else None)
 
 
 class MyBarLogger(ProgressBarLogger):
     def __init__(self, video_id):
         super().__init__()
         self.video_id = video_id
-        self.redis = ControlRedis()
+        self.progress = RenderProgress(video_id)
+        self.cancel = RenderCancel(video_id)
 
     def bars_callback(self, bar, attr, value, old_value=None):
-        # Every time the logger progress is updated, this function is called
-        percentage = (value / self.bars[bar]['total']) * 100
-        self.redis.set_key(self.video_id, round(percentage, 2))
+        # 只推送视频帧进度，音频分块进度不计入；发布频率由 RenderProgress 节流
+        if bar != 'frame_index' or attr != 'index' or not self.bars[bar]['total']:
+            return
+        self.progress.publish('render', value / self.bars[bar]['total'] * 100)
+        # 逐帧检查取消标记，取消时抛出的异常由 moviepy 关闭 ffmpeg 写入进程
+        self.cancel.check(force=False)
@@ -3,25 +3,36 @@ import os
 import shutil
 import uuid
 
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
-from django.http import FileResponse
+from django.db.models import OuterRef, Subquery
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from PIL import Image as PILImage
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from moviepy import VideoFileClip
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
 
-from astra.settings import TTS_PATH, VIDEO_PATH, IMG_PATH
+from astra.settings import TTS_PATH, VIDEO_PATH, IMG_PATH, PREVIEW_PATH, RENDER_STATS_DAYS, RENDER_STATS_MAX_VIDEOS
 from common.exceptions import BusinessException
 from common.redis_tools import ControlRedis
 from common.response import ok_response, error_response
 from image.models import Image
 from tag.models import Tag
 from video.models import Video, Parameters, VideoAssetTags
+from video.progress import RenderProgress
+from video.render_admission import RenderAdmission
+from video.render_batch import RenderBatch
+from video.render_queue import RenderQueue
+from video.stage_timer import STAGES_SPEC_KEY, aggregate
+from video.template_registry import TemplateRegistry
 from video.models import VideoAsset
 from video.serializers import VideoDetailSerializer
 from video.serializers import VideoSerializer, VideoAssetUploadSerializer, VideoAssetSerializer, VideoUploadSerializer
@@ -31,7 +42,6 @@ from voice.models import Tts
 from django.utils import timezone
 
 template = VideoTemplate()
-template.get_templates()
 
 redis_control = ControlRedis()
 logger = logging.getLogger("video")
@@ -109,7 +119,7 @@ class TemplateView(APIView):
             name = request.query_params.get('name', '')
             orientation = request.query_params.get('orientation', '')
 
-            metadata = template.filter_templates(name, orientation, tag_id)
+            metadata = template.filter_templates(name, orientation, tag_id=tag_id)
 
             # 手动实例化分页器
             paginator = CustomPagination()
@@ -124,7 +134,7 @@ class TemplateView(APIView):
             return error_response(str(e))
 
     @swagger_auto_schema(
-        operation_description="根据模板生成视频",
+        operation_description="根据模板生成视频（提交到渲染队列，立即返回video_id，由render_worker进程异步生成）",
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             required=['template_id', 'title', 'speaker', 'data'],
@@ -135,6 +145,8 @@ class TemplateView(APIView):
                 'beginning': openapi.Schema(type=openapi.TYPE_OBJECT, description='视频开头部分'),
                 'data': openapi.Schema(type=openapi.TYPE_OBJECT, description='生成素材的内容'),
                 'ending': openapi.Schema(type=openapi.TYPE_OBJECT, description='视频结尾部分'),
+                'render_profile': openapi.Schema(type=openapi.TYPE_STRING, enum=['final', 'preview'],
+                                                 description='渲染配置：final 正式导出（默认），preview 快速预览（半分辨率、15fps）'),
             }
 
         ),
@@ -162,6 +174,8 @@ class TemplateView(APIView):
             result = template.generate_video(user, data)
 
             return ok_response(result)
+        except BusinessException as e:
+            return error_response(str(e))
         except Exception:
             return error_response("视频生成失败,请查看后台日志！")
 
@@ -362,8 +376,9 @@ class VideoDeleteView(APIView):
                 draft_folder = template.get_draft_folder(request.user.id)
                 if os.path.exists(os.path.join(draft_folder, video.title)):
                     shutil.rmtree(os.path.join(draft_folder, video.title))
-                if os.path.exists(os.path.join(VIDEO_PATH, f"{video_id}.mp4")):
-                    os.remove(os.path.join(VIDEO_PATH, f"{video_id}.mp4"))
+                for folder in (VIDEO_PATH, PREVIEW_PATH):
+                    if os.path.exists(os.path.join(folder, f"{video_id}.mp4")):
+                        os.remove(os.path.join(folder, f"{video_id}.mp4"))
             except Exception:
                 return error_response("剪映草稿删除失败，你可能在剪映窗口中打开了本视频")
 
@@ -458,9 +473,10 @@ class VideoBatchDeleteView(APIView):
                     title_folder = os.path.join(draft_folder, video.title)
                     if os.path.exists(title_folder):
                         shutil.rmtree(title_folder)
-                    video_file = os.path.join(VIDEO_PATH, f"{vid}.mp4")
-                    if os.path.exists(video_file):
-                        os.remove(video_file)
+                    for folder in (VIDEO_PATH, PREVIEW_PATH):
+                        video_file = os.path.join(folder, f"{vid}.mp4")
+                        if os.path.exists(video_file):
+                            os.remove(video_file)
                 except Exception:
                     failed.append({"id": vid, "reason": "剪映草稿删除失败，可能在剪映窗口中打开了本视频"})
                     continue
@@ -518,6 +534,308 @@ class VideoDetailView(APIView):
             return error_response(str(e))
 
 
+async def video_progress_stream(request, video_id):
+    """SSE 推送视频渲染进度，需运行在 ASGI 服务下
+
+    EventSource 无法设置请求头，除 Session 外也支持通过 ?token= 传入 Token；只能订阅自己的视频。
+    事件数据：{video_id, stage, stage_progress, progress, eta, time}，stage 为 success/failed 时流结束。
+    """
+    user = await request.auser()
+    if user.is_authenticated:
+        user_id = user.id
+    else:
+        token = request.GET.get('token')
+        user_id = await Token.objects.filter(key=token).values_list('user_id', flat=True).afirst() if token else None
+        if user_id is None:
+            return HttpResponse(status=401)
+
+    # 只能订阅自己的视频，入队时已创建视频记录
+    try:
+        owned = await Video.objects.filter(id=video_id, creator=user_id).aexists()
+    except ValidationError:
+        owned = False
+    if not owned:
+        return HttpResponse(status=404)
+
+    response = StreamingHttpResponse(RenderProgress.stream(video_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 关闭 nginx 缓冲，事件立即下发
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class VideoStageStatsView(APIView):
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    # 统计范围为所有用户的渲染记录，仅管理员可查看
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="按模板统计渲染各阶段耗时、内存与计数的 p50/p95",
+        manual_parameters=[
+            openapi.Parameter('template_id', openapi.IN_QUERY, description="模板ID，不传时统计全部模板", type=openapi.TYPE_STRING),
+            openapi.Parameter('days', openapi.IN_QUERY, description="统计最近天数", type=openapi.TYPE_INTEGER,
+                              default=RENDER_STATS_DAYS),
+            openapi.Parameter('result', openapi.IN_QUERY, description="视频状态，默认只统计生成成功的视频", type=openapi.TYPE_STRING,
+                              default='Success'),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Success",
+                examples={
+                    "application/json": {
+                        'code': 0,
+                        "message": "success",
+                        "data": [{
+                            "template_id": "模板ID",
+                            "name": "数据对比生成视频",
+                            "renders": 120,
+                            "total": {"p50": 62.4, "p95": 118.0},
+                            "stages": {
+                                "encode": {"renders": 120, "seconds": {"p50": 48.2, "p95": 97.5},
+                                           "peak_rss_mb": {"p50": 820.0, "p95": 1210.5},
+                                           "counts": {"frames": {"p50": 1380, "p95": 2610}}}
+                            }
+                        }]
+                    }
+                }
+            )
+        }
+    )
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', RENDER_STATS_DAYS))
+            template_id = request.query_params.get('template_id')
+            result = request.query_params.get('result', 'Success')
+
+            queryset = Video.objects.filter(
+                create_time__gte=timezone.now() - timedelta(days=days),
+                spec__has_key=STAGES_SPEC_KEY,
+            ).annotate(
+                template_id=Subquery(Parameters.objects.filter(id=OuterRef('param_id')).values('template_id')[:1])
+            )
+            if result:
+                queryset = queryset.filter(result=result)
+            if template_id:
+                queryset = queryset.filter(template_id=template_id)
+            rows = queryset.order_by('-create_time').values_list('template_id', f'spec__{STAGES_SPEC_KEY}')
+
+            names = TemplateRegistry.names()
+            stats = aggregate(rows[:RENDER_STATS_MAX_VIDEOS])
+            data = [{'template_id': key, 'name': names.get(key), **value} for key, value in stats.items()]
+            data.sort(key=lambda item: item['total']['p95'], reverse=True)
+            return ok_response(data)
+        except ValueError:
+            return error_response("days 参数必须为整数")
+        except Exception as e:
+            return error_response(str(e))
+
+
+class VideoBatchGenerateView(APIView):
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="同一模板批量生成视频，配音、派生图片与背景音乐底轨统一准备一次，各视频并行渲染",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'template_id': openapi.Schema(type=openapi.TYPE_STRING, description='模板ID'),
+                'render_profile': openapi.Schema(type=openapi.TYPE_STRING, description='渲染配置，final 或 preview',
+                                                 default='final'),
+                'parameter_sets': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                    description='各视频的生成参数，与单个视频生成参数相同'
+                ),
+            },
+            required=['template_id', 'parameter_sets']
+        ),
+        responses={
+            200: openapi.Response(
+                description="Success",
+                examples={
+                    "application/json": {
+                        'code': 0,
+                        "message": "success",
+                        "data": {"batch_id": "批次ID", "video_ids": ["视频ID"]}
+                    }
+                }
+            )
+        }
+    )
+    def post(self, request):
+        try:
+            result = template.generate_batch(request.user.id, request.data.get('template_id'),
+                                             request.data.get('parameter_sets'),
+                                             request.data.get('render_profile') or 'final')
+            return ok_response(result)
+        except BusinessException as e:
+            return error_response(str(e))
+        except Exception:
+            logger.exception("批量生成视频失败")
+            return error_response("批量生成视频失败,请查看后台日志！")
+
+
+class VideoBatchProgressView(APIView):
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="查询批量生成的整体进度及各视频的阶段与进度",
+        responses={
+            200: openapi.Response(
+                description="Success",
+                examples={
+                    "application/json": {
+                        'code': 0,
+                        "message": "success",
+                        "data": {
+                            "batch_id": "批次ID",
+                            "state": "rendering",
+                            "total": 30,
+                            "finished": 12,
+                            "progress": 47.5,
+                            "counts": {"queued": 14, "prepare": 0, "render": 4, "success": 12, "failed": 0},
+                            "shared": {"videos": 30, "tts": 41, "tts_segments": 186, "bgm_beds": 1},
+                            "videos": [{"video_id": "视频ID", "stage": "render", "progress": 63.2}]
+                        }
+                    }
+                }
+            )
+        }
+    )
+    def get(self, request, batch_id):
+        batch = RenderBatch(batch_id)
+        info = batch.load()
+        if info is None or str(info['user']) != str(request.user.id):
+            return error_response("批次不存在")
+        return ok_response(batch.progress())
+
+
+class RenderQueueStatsView(APIView):
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    # 包含所有用户的任务与渲染主机信息，仅管理员可查看
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="各优先级、各用户的排队与运行任务数，及各渲染主机的资源预算、已占用资源、运行中与等待资源的任务",
+        responses={
+            200: openapi.Response(
+                description="Success",
+                examples={
+                    "application/json": {
+                        'code': 0,
+                        "message": "success",
+                        "data": {
+                            "queues": {
+                                "preview": {"pending": 0, "running": 1, "users": {"3": {"pending": 0, "running": 1}}},
+                                "final": {"pending": 12, "running": 2, "users": {"7": {"pending": 12, "running": 2}}},
+                                "batch": {"pending": 0, "running": 0, "users": {}}
+                            },
+                            "running": 3,
+                            "waiting": 2,
+                            "hosts": [{
+                                "host": "render-01",
+                                "budget": {"cores": 32, "memory_mb": 24576, "disk_mb": 180000},
+                                "used": {"cores": 24, "memory_mb": 15200, "disk_mb": 900},
+                                "running": [{"video_id": "视频ID", "cores": 8, "memory_mb": 5100, "disk_mb": 300,
+                                             "duration": 95.0, "pid": 1234, "since": 1760000000.0}],
+                                "waiting": []
+                            }]
+                        }
+                    }
+                }
+            )
+        }
+    )
+    def get(self, request):
+        hosts = RenderAdmission.metrics()
+        return ok_response({
+            'queues': RenderQueue().stats(),
+            'running': sum(len(host['running']) for host in hosts),
+            'waiting': sum(len(host['waiting']) for host in hosts),
+            'hosts': hosts,
+        })
+
+
+class VideoRetryView(APIView):
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="重试生成失败的视频，按原参数重新入队并复用已完成的中间产物",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'video_id': openapi.Schema(type=openapi.TYPE_STRING, description='视频ID')
+            },
+            required=['video_id']
+        ),
+        responses={
+            200: openapi.Response(
+                description="Success",
+                examples={
+                    "application/json": {
+                        'code': 0,
+                        "message": "success",
+                        "data": {"video_id": "视频ID"}
+                    }
+                }
+            )
+        }
+    )
+    def post(self, request):
+        video_id = request.data.get('video_id')
+        if not video_id:
+            return error_response("视频ID不能为空")
+        try:
+            return ok_response(template.retry_video(request.user.id, video_id))
+        except BusinessException as e:
+            return error_response(str(e))
+        except Exception:
+            logger.exception(f"视频{video_id}重试失败")
+            return error_response("视频重试失败,请查看后台日志！")
+
+
+class VideoCancelView(APIView):
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="取消排队中或生成中的视频，渲染进程在下一个检查点停止并保留已完成的中间产物，可通过重试接口继续",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'video_id': openapi.Schema(type=openapi.TYPE_STRING, description='视频ID')
+            },
+            required=['video_id']
+        ),
+        responses={
+            200: openapi.Response(
+                description="Success",
+                examples={
+                    "application/json": {
+                        'code': 0,
+                        "message": "success",
+                        "data": {"video_id": "视频ID"}
+                    }
+                }
+            )
+        }
+    )
+    def post(self, request):
+        video_id = request.data.get('video_id')
+        if not video_id:
+            return error_response("视频ID不能为空")
+        try:
+            return ok_response(template.cancel_video(request.user.id, video_id))
+        except BusinessException as e:
+            return error_response(str(e))
+        except Exception:
+            logger.exception(f"视频{video_id}取消失败")
+            return error_response("视频取消失败,请查看后台日志！")
+
+
 class VideoAssetUploadView(APIView):
     authentication_classes = [SessionAuthentication, TokenAuthentication]
     permission_classes = [IsAuthenticated]
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+import uuid
+import wave
+
+import numpy as np
+from moviepy import AudioFileClip
+from moviepy.audio.fx import AudioFadeOut
+from pydub import AudioSegment
+
+from astra.settings import BGM_CACHE_PATH, BGM_CACHE_MAX_BYTES, BGM_CACHE_BUCKET_SECONDS
+
+logger = logging.getLogger("voice")
+
+
+class BgmCache:
+    """背景音乐底轨缓存
+
+    按 (音乐, 时长档位, 音量) 缓存解码、循环拼接并调好音量的 WAV 底轨，
+    同一首 BGM 只解码一次，渲染时直接读取 PCM，不再逐块混合多份循环副本。
+    时长按档位向上取整，同一档位内的视频共用一份底轨；淡出与视频实际结尾相关，使用时再叠加。
+    """
+
+    def __init__(self, cache_path=BGM_CACHE_PATH, max_bytes=BGM_CACHE_MAX_BYTES, bucket_seconds=BGM_CACHE_BUCKET_SECONDS,
+                 frame_rate=44100, channels=2):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.bucket_seconds = bucket_seconds
+        self.frame_rate = frame_rate
+        self.channels = channels
+
+    def bucket(self, duration):
+        return max(1, math.ceil(duration / self.bucket_seconds)) * self.bucket_seconds
+
+    def make_key(self, sound_id, bucket, volume):
+        raw = json.dumps({'sound_id': str(sound_id), 'bucket': bucket, 'volume': round(volume, 4),
+                          'frame_rate': self.frame_rate, 'channels': self.channels}, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_path, f'{key}.wav')
+
+    def build(self, source_path, path, bucket, volume):
+        """解码原始音乐，循环铺满整个档位时长并调整音量后写入 WAV"""
+        segment = AudioSegment.from_file(source_path)
+        segment = segment.set_frame_rate(self.frame_rate).set_channels(self.channels).set_sample_width(2)
+        samples = np.array(segment.get_array_of_samples(), dtype=np.float32).reshape(-1, self.channels)
+        total = int(bucket * self.frame_rate)
+        if not len(samples):
+            samples = np.zeros((total, self.channels), dtype=np.float32)
+        loops = -(-total // len(samples))
+        bed = np.tile(samples, (loops, 1))[:total] * volume
+        data = np.clip(bed, -32768, 32767).astype(np.int16)
+
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with wave.open(tmp_path, 'wb') as f:
+            f.setnchannels(self.channels)
+            f.setsampwidth(2)
+            f.setframerate(self.frame_rate)
+            f.writeframes(data.tobytes())
+        os.replace(tmp_path, path)
+        logger.info(f"BGM底轨已缓存：{source_path}，档位{bucket}s，音量{volume}")
+
+    def bed_path(self, sound_id, source_path, duration, volume):
+        bucket = self.bucket(duration)
+        path = self._path(self.make_key(sound_id, bucket, volume))
+        if os.path.isfile(path):
+            # 更新访问时间，用于LRU淘汰
+            now = time.time()
+            os.utime(path, (now, now))
+        else:
+            self.build(source_path, path, bucket, volume)
+            self.evict()
+        return path
+
+    def bed(self, sound_id, source_path, duration, volume=0.1, fade=0):
+        """返回时长为 duration 的背景音乐片段，fade 为结尾淡出秒数"""
+        clip = AudioFileClip(self.bed_path(sound_id, source_path, duration, volume)).with_duration(duration)
+        if fade:
+            clip = clip.with_effects([AudioFadeOut(fade)])
+        return clip
+
+    def evict(self):
+        """超出容量上限时，按最近最少使用顺序删除底轨文件"""
+        entries = []
+        for name in os.listdir(self.cache_path):
+            if not name.endswith('.wav'):
+                continue
+            path = os.path.join(self.cache_path, name)
+            try:
+                entries.append((os.path.getmtime(path), path, os.path.getsize(path)))
+            except FileNotFoundError:
+                continue
+
+        total = sum(entry[2] for entry in entries)
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for last_used, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.info(f"BGM底轨缓存淘汰：{path}")
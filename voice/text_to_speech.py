@@ -3,7 +3,9 @@ import logging
 import os.path
 import shutil
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
+from django.db import connection
 from gradio_client import Client, handle_file
 from pydub import AudioSegment
 import edge_tts
@@ -12,8 +14,9 @@ import os
 import uuid
 
 from account.models import SystemSettings
-from astra.settings import TTS_PATH, SPEAKER_PATH
+from astra.settings import TTS_PATH, SPEAKER_PATH, TTS_MAX_WORKERS
 from voice.models import Speaker, Tts
+from voice.tts_cache import TtsCache
 
 logger = logging.getLogger("voice")
 
@@ -122,17 +125,46 @@ class EdgeTTS(TTSBase):
 class Speech:
     """TTS工厂类"""
 
+    # speaker.origin 到TTS实现的映射，基准测试等场景可注册本地实现
+    backends = {
+        'INDEX_TTS': IndexTTS,
+        'EDGE_TTS': EdgeTTS,
+    }
+
+    @staticmethod
+    def register_backend(speaker_origin, backend):
+        Speech.backends[speaker_origin] = backend
+
     @staticmethod
     def get_tts_service(speaker_origin):
         """
         根据speaker的origin获取对应的TTS服务
         """
-        if speaker_origin == 'INDEX_TTS':
-            return IndexTTS()
-        elif speaker_origin == 'EDGE_TTS':
-            return EdgeTTS()
-        else:
+        backend = Speech.backends.get(speaker_origin)
+        if backend is None:
             raise ValueError(f"不支持的TTS类型: {speaker_origin}")
+        return backend()
+
+    @staticmethod
+    def synthesize(tts_service, speaker, text, speaker_id, creator, video_id='', sound_id=None):
+        """
+        优先从TTS缓存中复用相同文本与音色的语音，未命中时调用TTS服务并写入缓存
+        """
+        cache = TtsCache()
+        key = cache.make_key(text, speaker)
+        try:
+            tts = cache.fetch(key, text, speaker_id, creator, video_id, sound_id)
+            if tts is not None:
+                return tts
+        except Exception as e:
+            logger.warning("读取TTS缓存失败: %s", e)
+
+        tts = tts_service.generate_speech(text, speaker_id, creator, video_id, sound_id)
+        try:
+            cache.store(key, tts)
+        except Exception as e:
+            logger.warning("写入TTS缓存失败: %s", e)
+        return tts
 
     @staticmethod
     def chat_tts(text, speaker_id, creator, video_id='', sound_id=None):
@@ -142,4 +174,27 @@ class Speech:
         # 直接调用同步实现
         speaker = Speaker.objects.get(id=speaker_id)
         tts_service = Speech.get_tts_service(speaker.origin)
-        return tts_service.generate_speech(text, speaker_id, creator, video_id, sound_id)
+        return Speech.synthesize(tts_service, speaker, text, speaker_id, creator, video_id, sound_id)
+
+    @staticmethod
+    def chat_tts_many(segments, speaker_id, creator, video_id='', max_workers=TTS_MAX_WORKERS):
+        """
+        并发合成多段文本，返回与segments顺序一致的Tts列表
+        """
+        if not segments:
+            return []
+        speaker = Speaker.objects.get(id=speaker_id)
+        tts_service = Speech.get_tts_service(speaker.origin)
+
+        def generate(text):
+            try:
+                return Speech.synthesize(tts_service, speaker, text, speaker_id, creator, video_id)
+            finally:
+                # 线程池中的数据库连接用完即关闭，避免连接泄漏
+                connection.close()
+
+        workers = max(1, min(max_workers, len(segments)))
+        if workers == 1:
+            return [Speech.synthesize(tts_service, speaker, text, speaker_id, creator, video_id) for text in segments]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tts') as executor:
+            return list(executor.map(generate, segments))
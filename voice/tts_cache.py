@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from astra.settings import TTS_PATH, TTS_CACHE_PATH, TTS_CACHE_MAX_BYTES, TTS_CACHE_MAX_ENTRIES, TTS_CACHE_RESCAN_INTERVAL
+from voice.models import Tts
+
+logger = logging.getLogger("voice")
+
+# 各缓存目录的用量：{目录: {'bytes', 'entries', 'scanned'}}，写入时累加，超出上限或统计过期时才扫描目录
+_usage = {}
+_usage_lock = threading.Lock()
+
+
+class TtsCache:
+    """按内容寻址的TTS结果缓存，相同文本、音色与参数的语音只合成一次"""
+
+    def __init__(self, cache_path=TTS_CACHE_PATH, max_bytes=TTS_CACHE_MAX_BYTES, max_entries=TTS_CACHE_MAX_ENTRIES):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+    @staticmethod
+    def normalize_text(text):
+        return re.sub(r'\s+', ' ', text or '').strip()
+
+    def make_key(self, text, speaker):
+        spec = speaker.spec or {}
+        payload = {
+            'text': self.normalize_text(text),
+            'speaker_id': str(speaker.id),
+            'origin': speaker.origin,
+            'voice': spec.get('voice') or speaker.name,
+            'rate': spec.get('rate'),
+            'volume': spec.get('volume'),
+            'pitch': spec.get('pitch'),
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_path, f'{key}.json')
+
+    def _audio_path(self, key, fmt):
+        return os.path.join(self.cache_path, f'{key}.{fmt}')
+
+    def _load_meta(self, key):
+        try:
+            with open(self._meta_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def _link(src, dst):
+        # 优先硬链接，删除视频的TTS文件不会影响缓存；跨磁盘时退化为复制
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    def fetch(self, key, text, speaker_id, creator, video_id='', sound_id=None):
+        """命中时复用缓存音频生成新的Tts记录，未命中返回None"""
+        meta = self._load_meta(key)
+        if not meta:
+            return None
+        audio_path = self._audio_path(key, meta['format'])
+        if not os.path.isfile(audio_path):
+            return None
+
+        if not sound_id:
+            sound_id = str(uuid.uuid4())
+        self._link(audio_path, os.path.join(TTS_PATH, f"{sound_id}.{meta['format']}"))
+        # 更新访问时间，用于LRU淘汰
+        now = time.time()
+        os.utime(self._meta_path(key), (now, now))
+
+        tts = Tts(
+            id=sound_id, format=meta['format'], txt=text,
+            speaker_id=speaker_id, video_id=video_id,
+            duration=meta['duration'], creator=creator
+        )
+        tts.save()
+        logger.info(f"TTS缓存命中：{key}")
+        return tts
+
+    def store(self, key, tts):
+        source = os.path.join(TTS_PATH, f'{tts.id}.{tts.format}')
+        if not os.path.isfile(source):
+            return
+        suffix = f'.{uuid.uuid4().hex}.tmp'
+
+        audio_path = self._audio_path(key, tts.format)
+        self._link(source, audio_path + suffix)
+        os.replace(audio_path + suffix, audio_path)
+
+        meta_path = self._meta_path(key)
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump({'format': tts.format, 'duration': tts.duration, 'txt': tts.txt}, f, ensure_ascii=False)
+        os.replace(meta_path + suffix, meta_path)
+        if self._account(os.path.getsize(audio_path)):
+            self.evict()
+
+    def _account(self, size):
+        """累加本次写入，返回是否需要扫描目录淘汰：超出上限，或本进程还没有扫描过、统计已过期"""
+        with _usage_lock:
+            usage = _usage.get(self.cache_path)
+            if usage is None or time.time() - usage['scanned'] > TTS_CACHE_RESCAN_INTERVAL:
+                return True
+            usage['bytes'] += size
+            usage['entries'] += 1
+            return usage['bytes'] > self.max_bytes or usage['entries'] > self.max_entries
+
+    def _scan(self):
+        """列出缓存条目 [(最近使用时间, key, 音频路径, 大小)]，只读取文件属性，不读取元数据内容"""
+        used, audios = {}, {}
+        with os.scandir(self.cache_path) as entries:
+            for entry in entries:
+                if entry.name.endswith('.tmp'):
+                    continue
+                key, _, ext = entry.name.partition('.')
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if ext == 'json':
+                    used[key] = stat.st_mtime
+                else:
+                    audios[key] = (entry.path, stat.st_size)
+        return [(last_used, key, *audios.get(key, (None, 0))) for key, last_used in used.items()]
+
+    def evict(self):
+        """超出容量或条目数上限时，按最近最少使用顺序删除缓存文件，并重置本进程的用量统计"""
+        with _usage_lock:
+            entries = self._scan()
+            total = sum(entry[3] for entry in entries)
+            count = len(entries)
+            if total > self.max_bytes or count > self.max_entries:
+                entries.sort()
+                for last_used, key, audio_path, size in entries:
+                    if total <= self.max_bytes and count <= self.max_entries:
+                        break
+                    for path in (audio_path, self._meta_path(key)):
+                        try:
+                            if path:
+                                os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                    total -= size
+                    count -= 1
+                    logger.info(f"TTS缓存淘汰：{key}")
+            _usage[self.cache_path] = {'bytes': total, 'entries': count, 'scanned': time.time()}